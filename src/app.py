@@ -1,18 +1,28 @@
 import streamlit as st
-import cv2
 import time
-import numpy as np
-from PIL import Image
 from functions import opencv_functions
+from functions.tracing import stage_totals, tracer
+from display import DISPLAY_WIDTHS
+from preview import scale_params, scale_secondary
+from store import image_store
 from utils import (
     initialize_session_state,
     save_current_state,
     revert_state,
     forward_state,
     get_ui_parameters,
+    get_preview_image,
+    show_image,
+    process_image,
     get_function_history_json,
     display_function_history,
+    display_background_status,
+    display_history_memory,
+    display_timings,
+    display_parameter_sweep,
+    display_video_processing,
     import_and_apply_json,
+    save_session,
 )
 import logging
 
@@ -25,27 +35,26 @@ def main():
     st.title("OpenCV Image Processing App")
     initialize_session_state()
 
+    # Images are downscaled to this width before being sent to the browser
+    st.sidebar.select_slider(
+        "Display width", options=DISPLAY_WIDTHS, key="display_width"
+    )
+    st.sidebar.caption(
+        f"Session {st.session_state.session_store.session_id} is saved on disk. "
+        "Bookmark this page to come back to it."
+    )
+
     # Handle file upload and check if it's a new file
     uploaded_file = st.file_uploader("Choose an image...", type=["jpg", "jpeg", "png"])
 
     if uploaded_file is not None:
         # If a new file is uploaded or session state is empty
         if "file" not in st.session_state or uploaded_file != st.session_state.file:
-            image = Image.open(uploaded_file)
-            image = np.array(image)
+            # Decoded straight to BGR, and only once per file content
+            with tracer.span("decode"):
+                image = st.session_state.decode_cache.decode_upload(uploaded_file)
             logger.info(f"Image shape: {image.shape}")
 
-            # Handle different image types and convert to BGR
-            if image.dtype == bool:
-                image = image.astype(np.uint8) * 255
-
-            if len(image.shape) == 2:  # If grayscale, convert to BGR
-                image = cv2.cvtColor(image, cv2.COLOR_GRAY2BGR)
-            elif image.shape[2] == 4:  # If RGBA, convert to BGR
-                image = cv2.cvtColor(image, cv2.COLOR_RGBA2BGR)
-            else:  # Assume RGB and convert to BGR
-                image = cv2.cvtColor(image, cv2.COLOR_RGB2BGR)
-
             st.session_state.image = image
             save_current_state(image)  # Reset function history for new image
             st.session_state.file = (
@@ -54,58 +63,125 @@ def main():
 
     if "image" in st.session_state:
         # Create tabs for main processing and function history
-        tab1, tab2 = st.tabs(["Image Processing", "Function History"])
+        tab1, tab2, tab3, tab4 = st.tabs(
+            ["Image Processing", "Function History", "Parameter Sweep", "Video"]
+        )
         
         with tab1:
             selected_function_string = st.selectbox(
                 "Select OpenCV function", list(opencv_functions.keys())
             )
 
-            selected_function = opencv_functions[selected_function_string]
+            try:
+                selected_function = opencv_functions[selected_function_string]
+            except ImportError as e:
+                # Optional backends may be missing, the other functions still work
+                st.error(str(e))
+                st.stop()
             # Get UI parameters and secondary image if required
             params, secondary_image = get_ui_parameters(selected_function)
 
             try:
-                start = time.time()
                 current_img = st.session_state.image
-                # Process the image using the selected function
-                if secondary_image is not None:
-                    processed_image = selected_function.process(
-                        current_img.copy(), secondary_image, **params
-                    )
+                if current_img is None:
+                    st.error("Please upload an image to get started.")
+                    return
 
-                    st.image(
-                        cv2.cvtColor(secondary_image, cv2.COLOR_BGR2RGB),
-                        caption="Secondary Image",
-                        use_column_width=False,
-                    )
-                elif current_img is not None:
-                    processed_image = selected_function.process(
-                        current_img.copy(), **params
+                # Tune on a downscaled proxy of large images, render in full on Accept
+                proxy_image, scale = get_preview_image()
+                preview = False
+                if scale < 1:
+                    preview = st.toggle(
+                        "Fast preview",
+                        value=True,
+                        help=(
+                            "Process a downscaled copy while tuning, with pixel-sized "
+                            "parameters rescaled to match. Turn off for a sharp preview; "
+                            "Accept always uses the full resolution."
+                        ),
                     )
+
+                start = time.perf_counter()
+                with tracer.collect() as spans:
+                    if preview:
+                        processed_image = process_image(
+                            selected_function_string,
+                            selected_function,
+                            proxy_image,
+                            scale_params(selected_function, params, scale),
+                            None
+                            if secondary_image is None
+                            else scale_secondary(secondary_image, current_img, proxy_image),
+                            background=True,
+                        )
+                    else:
+                        processed_image = process_image(
+                            selected_function_string,
+                            selected_function,
+                            current_img,
+                            params,
+                            secondary_image,
+                            background=True,
+                        )
+
+                # Slow functions run in the background, the last result is
+                # shown until theirs is ready
+                computing = processed_image is None
+                if computing:
+                    processed_image = st.session_state.get("last_processed")
+                    if processed_image is None:
+                        processed_image = proxy_image if preview else current_img
+                    display_background_status()
                 else:
-                    st.error("Please upload an image to get started.")
-                    return
+                    st.session_state.last_processed = processed_image
 
-                end = time.time()
+                if secondary_image is not None:
+                    show_image(
+                        secondary_image, caption="Secondary Image", use_column_width=False
+                    )
 
-                # Displaying the time taken to process the image
-                st.write(f"Time taken to process the image: {end-start} seconds")
+                # Displaying the time taken to process the image. Stages are
+                # nested, e.g. "draw" in "process", so their sum is too high
+                elapsed = time.perf_counter() - start
+                background_seconds = st.session_state.pop("background_seconds", None)
+                if background_seconds is not None:
+                    # The result was picked up from the worker in this rerun
+                    elapsed = background_seconds
+                timings = stage_totals(spans)
+                st.write(f"Time taken to process the image: {elapsed:.4f} seconds")
+                st.caption(
+                    ", ".join(
+                        f"{stage}: {seconds * 1000:.1f} ms" for stage, seconds in timings.items()
+                    )
+                )
+                if preview:
+                    st.caption(
+                        f"Preview at {proxy_image.shape[1]}x{proxy_image.shape[0]} "
+                        f"({scale:.0%} of full resolution)"
+                    )
+                cache_stats = st.session_state.result_cache.stats()
+                display_stats = st.session_state.display_cache.stats()
+                store_stats = image_store.stats()
+                st.caption(
+                    f"Result cache: {cache_stats['hits']} hits, "
+                    f"{cache_stats['misses']} misses, "
+                    f"{cache_stats['bytes'] / 1e6:.1f} MB in {cache_stats['entries']} entries. "
+                    f"Display cache: {display_stats['hits']} hits, "
+                    f"{display_stats['misses']} misses. "
+                    f"Images shared by all sessions: {store_stats['entries']}, "
+                    f"{store_stats['bytes'] / 1e6:.1f} MB"
+                )
 
                 # Make the image display wider
                 col1, col2 = st.columns([2, 2])
                 with col1:
                     st.header("Input Image")
-                    st.image(
-                        cv2.cvtColor(st.session_state.image, cv2.COLOR_BGR2RGB),
-                        use_column_width=True,
-                    )
+                    with tracer.span("display"):
+                        show_image(proxy_image if preview else current_img)
                 with col2:
                     st.header("Processed Image")
-                    st.image(
-                        cv2.cvtColor(processed_image, cv2.COLOR_BGR2RGB),
-                        use_column_width=True,
-                    )
+                    with tracer.span("display", selected_function_string):
+                        show_image(processed_image)
 
                 # Control buttons
                 col3, col4, col5 = st.columns(3)
@@ -116,8 +192,25 @@ def main():
 
                 with col4:
                     if st.button("Accept", use_container_width=True):
+                        if preview or computing:
+                            with st.spinner(
+                                "Processing at full resolution..."
+                            ), tracer.collect() as spans:
+                                processed_image = process_image(
+                                    selected_function_string,
+                                    selected_function,
+                                    current_img,
+                                    params,
+                                    secondary_image,
+                                )
                         st.session_state.image = processed_image
-                        save_current_state(processed_image, selected_function_string, params)
+                        save_current_state(
+                            processed_image,
+                            selected_function_string,
+                            params,
+                            replayable=secondary_image is None,
+                            timings=stage_totals(spans),
+                        )
                         st.success(
                             "The processed image has been accepted and set as the new input."
                         )
@@ -136,6 +229,12 @@ def main():
             
             # Display current function history
             display_function_history()
+
+            with st.expander("Memory usage per step"):
+                display_history_memory()
+
+            with st.expander("Timings per stage and function"):
+                display_timings()
             
             # JSON export section
             st.subheader("Export Function History")
@@ -203,7 +302,7 @@ def main():
                 st.info("""
                 **Import Modes:**
                 - **Add to Current History**: Applies the imported functions after your current processing steps
-                - **Restart History**: Clears current history and applies the imported functions from the original image
+                - **Restart History**: Applies the imported functions from the original image, keeping the leading steps that match the current history
                 
                 If any error occurs during import, all changes will be reverted and your original image restored.
                 """)
@@ -216,10 +315,27 @@ def main():
                 st.session_state.function_history_index = -1
                 st.success("Function history cleared!")
                 st.rerun()
+
+        with tab3:
+            st.header("Parameter Sweep")
+            display_parameter_sweep(
+                selected_function_string, selected_function, params, secondary_image
+            )
+
+        with tab4:
+            st.header("Video")
+            display_video_processing()
                 
     else:
         st.write("Please upload an image to get started.")
 
+    # Keep the session on disk, so a refresh or restart does not lose it.
+    # Runs ended by st.rerun() are saved by the run that follows.
+    save_session()
+
+    # Import the remaining function modules while the user looks at the page
+    opencv_functions.prewarm()
+
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,251 @@
+"""Replay an exported function history over a directory of images.
+
+Example:
+    python batch.py history.json ./images -o ./processed --workers 8
+    python batch.py history.json ./images -o ./detections --detections-only
+"""
+
+import argparse
+import glob
+import json
+import logging
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+import cv2
+
+from functions.detections import save_npz
+from functions.frequency_domain import as_image
+from functions.tracing import stage_totals, tracer
+from pipeline import Pipeline, load_pipeline, resolve_steps
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".bmp", ".tif", ".tiff")
+
+# Per-worker pipeline, set up once by _init_worker so buffers are reused
+_pipeline = None
+
+
+def find_images(input_spec):
+    """Return the sorted image paths of a directory (recursive) or a glob."""
+    if os.path.isdir(input_spec):
+        paths = glob.glob(os.path.join(input_spec, "**", "*"), recursive=True)
+    else:
+        paths = glob.glob(input_spec, recursive=True)
+    return sorted(
+        path
+        for path in paths
+        if os.path.isfile(path) and path.lower().endswith(IMAGE_EXTENSIONS)
+    )
+
+
+def read_manifest(manifest_path):
+    """Return the input paths already recorded as successful in a manifest."""
+    done = set()
+    if not os.path.exists(manifest_path):
+        return done
+    with open(manifest_path, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                # A crash can leave a truncated last line behind
+                continue
+            if record.get("status") == "ok":
+                done.add(record["input"])
+    return done
+
+
+def output_path_for(input_path, input_root, output_dir, extension):
+    relative = os.path.relpath(input_path, input_root)
+    if extension:
+        relative = os.path.splitext(relative)[0] + extension
+    return os.path.join(output_dir, relative)
+
+
+def _init_worker(pipeline_path, secondary_path, tile_size, draw=True):
+    global _pipeline
+    from functions import opencv_functions
+
+    secondary_image = None
+    if secondary_path:
+        secondary_image = cv2.imread(secondary_path, cv2.IMREAD_COLOR)
+        if secondary_image is None:
+            raise ValueError(f"Could not read secondary image: {secondary_path}")
+    _pipeline = Pipeline.from_json(
+        load_pipeline(pipeline_path), opencv_functions, secondary_image, tile_size, draw
+    )
+
+
+def process_one(input_path, output_path):
+    """Run the pipeline on a single file and return its manifest record."""
+    start = time.perf_counter()
+    record = {"input": input_path, "output": output_path}
+    with tracer.collect() as spans:
+        try:
+            with tracer.span("decode"):
+                image = cv2.imread(input_path, cv2.IMREAD_COLOR)
+            if image is None:
+                raise ValueError("Could not read image")
+            # Images are unrelated, so frame-pair steps must not see the last one
+            _pipeline.reset()
+            result = _pipeline.run(image)
+            if _pipeline.detections:
+                record["detections"] = [
+                    dict(function=function_name, **detections.summary())
+                    for function_name, detections in _pipeline.detections
+                ]
+            os.makedirs(os.path.dirname(output_path) or ".", exist_ok=True)
+            with tracer.span("encode"):
+                if _pipeline.draw:
+                    written = cv2.imwrite(output_path, as_image(result))
+                else:
+                    save_npz(output_path, _pipeline.detections)
+                    written = True
+            if not written:
+                raise ValueError("Could not write output image")
+            record["status"] = "ok"
+        except Exception as e:
+            record["status"] = "error"
+            record["error"] = f"{type(e).__name__}: {e}"
+    record["seconds"] = round(time.perf_counter() - start, 4)
+    record["timings"] = stage_totals(spans)
+    # Sent back to the main process for its metrics, not written to the manifest
+    record["spans"] = spans
+    return record
+
+
+def run_batch(
+    pipeline_path,
+    input_spec,
+    output_dir,
+    workers=None,
+    max_in_flight=None,
+    manifest_path=None,
+    extension=None,
+    secondary_path=None,
+    tile_size=None,
+    metrics_path=None,
+    detections_only=False,
+):
+    """Process every image and append one manifest record per image.
+
+    Images already recorded as successful in the manifest are skipped, so
+    an interrupted run can be resumed by starting it again. For a few very
+    large images, use few workers and a `tile_size` so each image is split
+    across threads instead. With `metrics_path`, the time spent per stage
+    and function is written there as JSON, or as Prometheus text for a
+    .prom file. With `detections_only`, detector steps are not drawn and
+    their detections are saved as one .npz file per image instead.
+    """
+    # Fail fast on a broken pipeline before starting any workers
+    from functions import opencv_functions
+
+    steps = resolve_steps(load_pipeline(pipeline_path), opencv_functions)
+    if detections_only:
+        if not any(function_class.returns_detections for _, function_class, _ in steps):
+            raise ValueError("The pipeline has no detector steps to save detections of")
+        extension = ".npz"
+
+    workers = workers or os.cpu_count() or 1
+    max_in_flight = max_in_flight or workers * 2
+    manifest_path = manifest_path or os.path.join(output_dir, "manifest.jsonl")
+    images = find_images(input_spec)
+    if os.path.isdir(input_spec):
+        input_root = input_spec
+    elif images:
+        input_root = os.path.commonpath([os.path.dirname(p) or "." for p in images])
+    else:
+        input_root = "."
+
+    done = read_manifest(manifest_path)
+    todo = [path for path in images if path not in done]
+    logger.info(f"{len(done)} images already done, {len(todo)} to process")
+
+    os.makedirs(os.path.dirname(manifest_path) or ".", exist_ok=True)
+    counts = {"ok": 0, "error": 0}
+    start = time.perf_counter()
+    with open(manifest_path, "a", encoding="utf-8") as manifest, ProcessPoolExecutor(
+        max_workers=workers,
+        initializer=_init_worker,
+        initargs=(pipeline_path, secondary_path, tile_size, not detections_only),
+    ) as executor:
+        pending = set()
+        paths = iter(todo)
+        while True:
+            # Keep at most max_in_flight images queued in the pool
+            for input_path in paths:
+                output_path = output_path_for(input_path, input_root, output_dir, extension)
+                pending.add(executor.submit(process_one, input_path, output_path))
+                if len(pending) >= max_in_flight:
+                    break
+            if not pending:
+                break
+
+            finished, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in finished:
+                record = future.result()
+                for span in record.pop("spans"):
+                    tracer.record(*span)
+                counts[record["status"]] += 1
+                manifest.write(json.dumps(record) + "\n")
+                if record["status"] == "error":
+                    logger.warning(f"{record['input']}: {record['error']}")
+            manifest.flush()
+
+    elapsed = time.perf_counter() - start
+    logger.info(
+        f"Processed {counts['ok']} images, {counts['error']} failed in {elapsed:.1f} seconds"
+    )
+    if metrics_path:
+        tracer.write(metrics_path)
+        logger.info(f"Wrote metrics to {metrics_path}")
+    return counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("pipeline", help="Exported function history JSON file")
+    parser.add_argument("input", help="Input directory or glob pattern")
+    parser.add_argument("-o", "--output", required=True, help="Output directory")
+    parser.add_argument("-w", "--workers", type=int, help="Number of worker processes")
+    parser.add_argument(
+        "--max-in-flight", type=int, help="Maximum number of queued images (default: 2x workers)"
+    )
+    parser.add_argument("--manifest", help="Manifest path (default: <output>/manifest.jsonl)")
+    parser.add_argument("--ext", help="Output file extension, e.g. .png (default: keep input)")
+    parser.add_argument("--secondary", help="Secondary image for functions that require one")
+    parser.add_argument(
+        "--tile-size", type=int, help="Process tile-safe filters in tiles of this size on large images"
+    )
+    parser.add_argument(
+        "--metrics", help="Write per-stage timings to this file (.prom for Prometheus, else JSON)"
+    )
+    parser.add_argument(
+        "--detections-only",
+        action="store_true",
+        help="Save the detections of detector steps as .npz instead of drawing them",
+    )
+    args = parser.parse_args()
+
+    counts = run_batch(
+        args.pipeline,
+        args.input,
+        args.output,
+        workers=args.workers,
+        max_in_flight=args.max_in_flight,
+        manifest_path=args.manifest,
+        extension=args.ext,
+        secondary_path=args.secondary,
+        tile_size=args.tile_size,
+        metrics_path=args.metrics,
+        detections_only=args.detections_only,
+    )
+    raise SystemExit(1 if counts["error"] else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,275 @@
+"""Benchmark every function in the opencv_functions registry.
+
+Example:
+    python benchmark.py -o bench.json
+    python benchmark.py -o bench.json --baseline baseline.json --tolerance 0.2
+"""
+
+import argparse
+import datetime
+import json
+import logging
+import os
+import platform
+import time
+
+import cv2
+import numpy as np
+
+from functions import opencv_functions
+from pipeline import serialize_params
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+RESOLUTIONS = {
+    "VGA": (640, 480),
+    "FHD": (1920, 1080),
+    "4K": (3840, 2160),
+}
+PARAM_SETS = ("default", "min", "max")
+
+
+def synthetic_image(width, height, channels, seed=0):
+    """Return a noisy gradient with shapes, so detectors have something to find."""
+    rng = np.random.default_rng(seed)
+    x = np.linspace(0, 255, width, dtype=np.float32)
+    y = np.linspace(0, 255, height, dtype=np.float32)[:, None]
+    base = (x + y) / 2 + rng.normal(0, 12, (height, width)).astype(np.float32)
+    image = np.clip(base, 0, 255).astype(np.uint8)
+    image = cv2.cvtColor(image, cv2.COLOR_GRAY2BGR)
+
+    scale = min(width, height)
+    for _ in range(20):
+        center = (int(rng.integers(0, width)), int(rng.integers(0, height)))
+        radius = int(rng.integers(scale // 60, scale // 10))
+        color = tuple(int(c) for c in rng.integers(0, 256, 3))
+        cv2.circle(image, center, radius, color, -1)
+        corner = (int(rng.integers(0, width)), int(rng.integers(0, height)))
+        size = int(rng.integers(scale // 40, scale // 8))
+        cv2.rectangle(image, corner, (corner[0] + size, corner[1] + size), color, 3)
+
+    if channels == 1:
+        return cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+    return image
+
+
+def derive_params(param_info, param_set):
+    """Return process() arguments for a get_params() schema.
+
+    "default" uses the slider defaults and first options, "min" and "max"
+    the slider limits and first or last options.
+    """
+    params = {}
+    for name, config in param_info.items():
+        if name == "requires_secondary_image" or config is None:
+            continue
+        if isinstance(config, tuple):
+            min_val, max_val, default, _ = config
+            params[name] = {"default": default, "min": min_val, "max": max_val}[param_set]
+        elif isinstance(config, list):
+            params[name] = config[-1] if param_set == "max" else config[0]
+        else:
+            params[name] = config
+    return params
+
+
+def time_function(function_class, image, params, secondary_image, repeat, max_seconds):
+    """Return per-run durations in seconds, after one warm-up run."""
+
+    def run():
+        current = image.copy() if function_class.modifies_input else image
+        start = time.perf_counter()
+        if secondary_image is not None:
+            function_class.process(current, secondary_image, **params)
+        else:
+            function_class.process(current, **params)
+        return time.perf_counter() - start
+
+    warmup = run()
+    durations = []
+    budget = max_seconds - warmup
+    while len(durations) < repeat:
+        durations.append(run())
+        budget -= durations[-1]
+        if budget <= 0:
+            break
+    return durations
+
+
+def run_benchmarks(
+    function_names=None,
+    resolutions=("VGA", "FHD"),
+    channels=(1, 3),
+    param_sets=PARAM_SETS,
+    repeat=5,
+    max_seconds=10.0,
+):
+    """Time every function, resolution, channel count and parameter set."""
+    results = []
+    for function_name in function_names or opencv_functions.keys():
+        try:
+            function_class = opencv_functions[function_name]
+        except ImportError as e:
+            logger.warning(str(e))
+            results.append({"function": function_name, "error": str(e)})
+            continue
+        try:
+            param_info = function_class.get_params()
+        except Exception as e:
+            logger.warning(f"{function_name}: get_params failed: {e}")
+            results.append({"function": function_name, "error": f"get_params: {e}"})
+            continue
+
+        for resolution in resolutions:
+            width, height = RESOLUTIONS[resolution]
+            for channel_count in channels:
+                image = synthetic_image(width, height, channel_count)
+                secondary_image = None
+                if function_class.frame_pair:
+                    # A second frame with everything moved a little
+                    secondary_image = np.roll(image, (3, 5), axis=(0, 1))
+                elif "requires_secondary_image" in param_info:
+                    secondary_image = image[
+                        height // 3 : height // 3 + height // 8,
+                        width // 3 : width // 3 + width // 8,
+                    ].copy()
+
+                for param_set in param_sets:
+                    params = derive_params(param_info, param_set)
+                    result = {
+                        "function": function_name,
+                        "resolution": resolution,
+                        "channels": channel_count,
+                        "param_set": param_set,
+                        "params": serialize_params(params),
+                    }
+                    try:
+                        durations = time_function(
+                            function_class,
+                            image,
+                            params,
+                            secondary_image,
+                            repeat,
+                            max_seconds,
+                        )
+                        median = float(np.median(durations))
+                        result.update(
+                            {
+                                "runs": len(durations),
+                                "median_ms": round(median * 1000, 3),
+                                "p95_ms": round(float(np.percentile(durations, 95)) * 1000, 3),
+                                "mp_per_s": round(width * height / 1e6 / median, 2),
+                            }
+                        )
+                        logger.info(
+                            f"{function_name} {resolution} {channel_count}ch {param_set}: "
+                            f"{result['median_ms']} ms"
+                        )
+                    except Exception as e:
+                        result["error"] = f"{type(e).__name__}: {e}"
+                    results.append(result)
+    return results
+
+
+def result_key(result):
+    return (
+        result["function"],
+        result.get("resolution"),
+        result.get("channels"),
+        result.get("param_set"),
+    )
+
+
+def compare_to_baseline(results, baseline, tolerance):
+    """Return results whose median is slower than the baseline by more than `tolerance`."""
+    baseline_medians = {
+        result_key(r): r["median_ms"] for r in baseline["results"] if "median_ms" in r
+    }
+    regressions = []
+    for result in results:
+        previous = baseline_medians.get(result_key(result))
+        if previous is None or "median_ms" not in result:
+            continue
+        ratio = result["median_ms"] / previous if previous > 0 else 1.0
+        if ratio > 1 + tolerance:
+            regressions.append(
+                {
+                    "function": result["function"],
+                    "resolution": result["resolution"],
+                    "channels": result["channels"],
+                    "param_set": result["param_set"],
+                    "baseline_ms": previous,
+                    "median_ms": result["median_ms"],
+                    "ratio": round(ratio, 2),
+                }
+            )
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("-o", "--output", default="bench.json", help="Output JSON file")
+    parser.add_argument("--functions", nargs="+", help="Registry names to benchmark (default: all)")
+    parser.add_argument(
+        "--resolutions",
+        nargs="+",
+        default=["VGA", "FHD"],
+        choices=list(RESOLUTIONS),
+    )
+    parser.add_argument("--channels", nargs="+", type=int, default=[1, 3], choices=[1, 3])
+    parser.add_argument("--param-sets", nargs="+", default=list(PARAM_SETS), choices=PARAM_SETS)
+    parser.add_argument("--repeat", type=int, default=5, help="Timed runs per case")
+    parser.add_argument(
+        "--max-seconds", type=float, default=10.0, help="Time budget per case before stopping early"
+    )
+    parser.add_argument("--baseline", help="Previous benchmark JSON to compare against")
+    parser.add_argument(
+        "--tolerance", type=float, default=0.2, help="Allowed slowdown before flagging, e.g. 0.2 = 20%%"
+    )
+    args = parser.parse_args()
+
+    results = run_benchmarks(
+        args.functions,
+        args.resolutions,
+        args.channels,
+        args.param_sets,
+        args.repeat,
+        args.max_seconds,
+    )
+    report = {
+        "meta": {
+            "timestamp": datetime.datetime.now().isoformat(),
+            "opencv": cv2.__version__,
+            "numpy": np.__version__,
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "opencv_threads": cv2.getNumThreads(),
+        },
+        "results": results,
+    }
+
+    exit_code = 0
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        report["regressions"] = compare_to_baseline(results, baseline, args.tolerance)
+        for regression in report["regressions"]:
+            logger.warning(
+                f"Regression: {regression['function']} {regression['resolution']} "
+                f"{regression['channels']}ch {regression['param_set']}: "
+                f"{regression['baseline_ms']} ms -> {regression['median_ms']} ms "
+                f"({regression['ratio']}x)"
+            )
+        if report["regressions"]:
+            exit_code = 1
+
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    logger.info(f"Wrote {len(results)} results to {args.output}")
+    raise SystemExit(exit_code)
+
+
+if __name__ == "__main__":
+    main()
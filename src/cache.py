@@ -0,0 +1,81 @@
+import json
+from collections import OrderedDict
+
+import numpy as np
+
+from functions.colorspace import image_hash, image_nbytes
+from pipeline import serialize_params
+
+
+def params_key(params):
+    """Return a stable string for a parameter dictionary."""
+    return json.dumps(serialize_params(params or {}), sort_keys=True, default=str)
+
+
+def result_nbytes(result):
+    return image_nbytes(result) if isinstance(result, np.ndarray) else 0
+
+
+class ResultCache:
+    """Bounded LRU cache of processed images, evicted by total bytes.
+
+    The gray and BGR versions a result keeps count towards its size. They
+    can be added after the result is stored, so sizes are measured again
+    on every put(). With a `shared` ImageStore, results are also evicted
+    while the images of all sessions exceed its cap.
+    """
+
+    def __init__(self, max_bytes=512 * 1024 * 1024, shared=None):
+        self.max_bytes = max_bytes
+        self.shared = shared
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+
+    def make_key(self, image, function_name, params, secondary_image=None):
+        secondary = image_hash(secondary_image) if secondary_image is not None else None
+        return (image_hash(image), function_name, params_key(params), secondary)
+
+    def get(self, key):
+        """Return the cached result for `key`, or None on a miss."""
+        result = self._entries.get(key)
+        if result is None:
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return result
+
+    def put(self, key, result):
+        """Store a result and evict least recently used entries over budget."""
+        size = result_nbytes(result)
+        if size > self.max_bytes:
+            return
+        self._entries.pop(key, None)
+        if isinstance(result, np.ndarray):
+            # Cached results are shared between reruns and must not be mutated
+            result.setflags(write=False)
+        self._entries[key] = result
+        over = self.total_bytes - self.max_bytes
+        if self.shared is not None:
+            over = max(over, self.shared.excess_bytes())
+        # The new result is being shown, and is kept
+        while over > 0 and len(self._entries) > 1:
+            _, evicted = self._entries.popitem(last=False)
+            over -= result_nbytes(evicted)
+
+    @property
+    def total_bytes(self):
+        return sum(result_nbytes(result) for result in self._entries.values())
+
+    def clear(self):
+        self._entries.clear()
+
+    def stats(self):
+        return {
+            "entries": len(self._entries),
+            "bytes": self.total_bytes,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+        }
@@ -0,0 +1,107 @@
+import hashlib
+import io
+import threading
+from collections import OrderedDict
+
+import cv2
+import numpy as np
+from PIL import Image
+
+from functions.colorspace import color_image, image_nbytes
+from store import image_store
+
+
+def to_bgr(image):
+    """Convert a decoded image to 8-bit BGR, the format all functions expect.
+
+    Handles bool, gray, gray with alpha, BGRA and 16-bit or float images.
+    """
+    if image.dtype == bool:
+        image = image.astype(np.uint8) * 255
+    elif image.dtype == np.uint16:
+        image = cv2.convertScaleAbs(image, alpha=1 / 257)
+    elif np.issubdtype(image.dtype, np.floating):
+        image = cv2.convertScaleAbs(image, alpha=255)
+    elif image.dtype != np.uint8:
+        image = cv2.convertScaleAbs(image)
+
+    if image.ndim == 2 or image.shape[2] == 1:
+        return cv2.cvtColor(image, cv2.COLOR_GRAY2BGR)
+    if image.shape[2] == 2:  # Gray with alpha
+        return cv2.cvtColor(image[:, :, 0], cv2.COLOR_GRAY2BGR)
+    if image.shape[2] == 4:
+        return cv2.cvtColor(image, cv2.COLOR_BGRA2BGR)
+    return image
+
+
+def decode_image(data):
+    """Decode encoded image bytes into an 8-bit BGR array.
+
+    cv2.imdecode decodes straight to BGR. PIL is only used for formats
+    OpenCV cannot read.
+    """
+    buffer = np.frombuffer(data, dtype=np.uint8)
+    image = cv2.imdecode(buffer, cv2.IMREAD_UNCHANGED) if buffer.size else None
+    if image is None:
+        try:
+            pil_image = Image.open(io.BytesIO(data))
+            if pil_image.mode == "P":  # Palette indices are not gray values
+                pil_image = pil_image.convert("RGBA")
+            image = np.array(pil_image)
+        except Exception as e:
+            raise ValueError(f"Could not decode image: {e}") from e
+        # PIL returns RGB(A), swap to BGR(A) before the common conversion
+        if image.ndim == 3 and image.shape[2] in (3, 4):
+            image = image[:, :, [2, 1, 0, 3][: image.shape[2]]]
+    return to_bgr(image)
+
+
+class DecodeCache:
+    """LRU cache of decoded uploads, keyed by a hash of the file content.
+
+    Decoded images are returned read-only, as they are shared between
+    reruns. Functions that draw on their input are copied by the callers
+    already (see CvFunction.modifies_input). As ColorImages, they also keep
+    their gray version across reruns.
+    """
+
+    def __init__(self, max_entries=8):
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, data):
+        key = hashlib.blake2b(data, digest_size=16).hexdigest()
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._entries[key]
+            self.misses += 1
+
+        # Read-only, and shared with other sessions uploading the same image
+        image = image_store.intern(color_image(decode_image(data)))
+        with self._lock:
+            self._entries[key] = image
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return image
+
+    def decode_upload(self, uploaded_file):
+        """Decode a Streamlit UploadedFile, or return the cached image."""
+        return self.get(uploaded_file.getvalue())
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": sum(image_nbytes(image) for image in self._entries.values()),
+                "hits": self.hits,
+                "misses": self.misses,
+            }
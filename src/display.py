@@ -0,0 +1,128 @@
+import threading
+import weakref
+from collections import OrderedDict
+
+import cv2
+import numpy as np
+
+from cache import image_hash
+from functions.frequency_domain import as_image
+
+# Widths offered for the displayed images; Streamlit itself re-encodes
+# anything wider than 1460 pixels
+DISPLAY_WIDTHS = (640, 960, 1460)
+DEFAULT_DISPLAY_WIDTH = 960
+JPEG_QUALITY = 90
+# Fast rather than small, the PNGs only travel to the browser
+PNG_COMPRESSION = 1
+
+
+def display_format(image):
+    """Return "PNG" for single-channel and alpha images, "JPEG" otherwise.
+
+    Edge maps and masks get visible artifacts as JPEG.
+    """
+    if image.ndim == 2 or image.shape[2] in (1, 4):
+        return "PNG"
+    return "JPEG"
+
+
+def display_image(image, width):
+    """Downscale `image` to at most `width` pixels and convert it to uint8."""
+    if image.shape[1] > width:
+        height = max(1, round(image.shape[0] * width / image.shape[1]))
+        image = cv2.resize(image, (width, height), interpolation=cv2.INTER_AREA)
+    if image.dtype != np.uint8:
+        # Float images are shown in the 0-1 range, like st.image does
+        alpha = 255 if np.issubdtype(image.dtype, np.floating) else 1
+        image = cv2.convertScaleAbs(image, alpha=alpha)
+    return image
+
+
+def encode(image, image_format):
+    """Encode a BGR, BGRA or single-channel uint8 image."""
+    if image_format == "PNG":
+        ok, data = cv2.imencode(".png", image, [cv2.IMWRITE_PNG_COMPRESSION, PNG_COMPRESSION])
+    else:
+        ok, data = cv2.imencode(".jpg", image, [cv2.IMWRITE_JPEG_QUALITY, JPEG_QUALITY])
+    if not ok:
+        raise ValueError(f"Could not encode image as {image_format}")
+    return data.tobytes()
+
+
+class DisplayCache:
+    """LRU cache of display-sized, encoded images for st.image.
+
+    Images are downscaled before encoding, and encoded directly from BGR or
+    single-channel data, so no RGB copy of the full image is ever made.
+    Entries are keyed by a hash of the downscaled content. Read-only images,
+    such as cached results, are also remembered by identity, which skips
+    the downscaling when the same array is shown again.
+    """
+
+    def __init__(self, max_entries=16):
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._frozen_keys = {}
+        self._lock = threading.Lock()
+
+    def get(self, image, width=DEFAULT_DISPLAY_WIDTH):
+        """Return (encoded bytes, format) for showing `image` at most `width` wide."""
+        # Spectra are shown as their magnitude
+        image = as_image(image)
+        key = self._frozen_key(image, width)
+        if key is None:
+            small = display_image(image, width)
+            key = (image_hash(small), width)
+            self._remember(image, width, key)
+        else:
+            small = None
+
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._entries[key]
+            self.misses += 1
+
+        if small is None:
+            small = display_image(image, width)
+        image_format = display_format(small)
+        value = (encode(small, image_format), image_format)
+        with self._lock:
+            self._entries[key] = value
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return value
+
+    def _frozen_key(self, image, width):
+        remembered = self._frozen_keys.get((id(image), width))
+        if remembered is not None and remembered[0]() is image:
+            return remembered[1]
+        return None
+
+    def _remember(self, image, width, key):
+        if image.flags.writeable:
+            return
+        self._frozen_keys[(id(image), width)] = (weakref.ref(image), key)
+        # Forget arrays that no longer exist
+        if len(self._frozen_keys) > 4 * self.max_entries:
+            self._frozen_keys = {
+                k: v for k, v in self._frozen_keys.items() if v[0]() is not None
+            }
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._frozen_keys.clear()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": sum(len(data) for data, _ in self._entries.values()),
+                "hits": self.hits,
+                "misses": self.misses,
+            }
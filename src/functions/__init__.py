@@ -1,57 +1,49 @@
-from .blurring import GaussianBlur, MedianBlur, BilateralFilter
-from .edge_detection import CannyEdgeDetection, SobelEdgeDetection, Laplacian
-from .thresholding import Threshold
-from .morphological import Dilate, Erode, Morphology
-from .transformations import Resize
-from .aruco import ArucoDetector, CharucoBoardDetector
-from .feature_detection import (
-    BlobDetector,
-    FastFeatureDetector,
-    OrbFeatureDetector,
-    SiftFeatureDetector,
-    AkazeFeatureDetector,
-)
-from .shape_detection import ContourDetection, HoughLines, HoughCircles
-from .frequency_domain import FourierTransform, InverseFourierTransform
-from .histogram import (
-    HistogramEqualization,
-    CLAHE,
-    ColorSpaceConversion,
-)
+from .registry import LazyRegistry
 
-# from .optical_flow import OpticalFlow
-from .template_matching import (
-    TemplateMatching,
-    FastMatcher,
+# Display name -> "module.ClassName". Modules are only imported when one of
+# their functions is first used, see get_functions.py to list what exists.
+opencv_functions = LazyRegistry(
+    {
+        "Gaussian Blur": "blurring.GaussianBlur",
+        "Canny Edge Detection": "edge_detection.CannyEdgeDetection",
+        "Threshold": "thresholding.Threshold",
+        "Dilate": "morphological.Dilate",
+        "Erode": "morphological.Erode",
+        "Median Blur": "blurring.MedianBlur",
+        "Bilateral Filter": "blurring.BilateralFilter",
+        "Sobel Edge Detection": "edge_detection.SobelEdgeDetection",
+        "Laplacian": "edge_detection.Laplacian",
+        "Morphology": "morphological.Morphology",
+        "Resize": "transformations.Resize",
+        "Aruco Detector": "aruco.ArucoDetector",
+        "Charuco Board Detector": "aruco.CharucoBoardDetector",
+        "Blob Detector": "feature_detection.BlobDetector",
+        "Fast Feature Detector": "feature_detection.FastFeatureDetector",
+        "Orb Feature Detector": "feature_detection.OrbFeatureDetector",
+        "Sift Feature Detector": "feature_detection.SiftFeatureDetector",
+        "Akaze Feature Detector": "feature_detection.AkazeFeatureDetector",
+        "Contour Detection": "shape_detection.ContourDetection",
+        "Hough Lines": "shape_detection.HoughLines",
+        "Hough Lines (Probabilistic)": "shape_detection.HoughLinesP",
+        "Hough Circles": "shape_detection.HoughCircles",
+        "Fourier Transform": "frequency_domain.FourierTransform",
+        "Inverse Fourier Transform": "frequency_domain.InverseFourierTransform",
+        "Frequency Filter": "frequency_domain.FrequencyFilter",
+        "Notch Filter": "frequency_domain.NotchFilter",
+        "Histogram Equalization": "histogram.HistogramEqualization",
+        "CLAHE": "histogram.CLAHE",
+        "Color Space Conversion": "histogram.ColorSpaceConversion",
+        "Template Matching": "template_matching.TemplateMatching",
+        "Fast Matcher": "fast_matcher.FastMatcher",
+        "Feature Matching": "feature_matching.FeatureMatching",
+        "Optical Flow": "optical_flow.OpticalFlow",
+    }
 )
 
-opencv_functions = {
-    "Gaussian Blur": GaussianBlur,
-    "Canny Edge Detection": CannyEdgeDetection,
-    "Threshold": Threshold,
-    "Dilate": Dilate,
-    "Erode": Erode,
-    "Median Blur": MedianBlur,
-    "Bilateral Filter": BilateralFilter,
-    "Sobel Edge Detection": SobelEdgeDetection,
-    "Laplacian": Laplacian,
-    "Morphology": Morphology,
-    "Resize": Resize,
-    "Aruco Detector": ArucoDetector,
-    "Charuco Board Detector": CharucoBoardDetector,
-    "Blob Detector": BlobDetector,
-    "Fast Feature Detector": FastFeatureDetector,
-    "Orb Feature Detector": OrbFeatureDetector,
-    "Sift Feature Detector": SiftFeatureDetector,
-    "Akaze Feature Detector": AkazeFeatureDetector,
-    "Contour Detection": ContourDetection,
-    "Hough Lines": HoughLines,
-    "Hough Circles": HoughCircles,
-    "Fourier Transform": FourierTransform,
-    "Inverse Fourier Transform": InverseFourierTransform,
-    "Histogram Equalization": HistogramEqualization,
-    "CLAHE": CLAHE,
-    "Color Space Conversion": ColorSpaceConversion,
-    "Template Matching": TemplateMatching,
-    "Fast Matcher": FastMatcher,
-}
+
+def __getattr__(name):
+    # Keep `from functions import GaussianBlur` working without eager imports
+    for display_name, entry in opencv_functions.entries.items():
+        if entry.rsplit(".", 1)[1] == name:
+            return opencv_functions[display_name]
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -1,37 +1,77 @@
 import cv2
 import numpy as np
+from .colorspace import to_gray
+from .detections import Detections
 from .enums import *
 from .function import CvFunction
+from .operator_cache import operator_cache
+from .tracing import tracer
+
+
+def detector_parameters(params):
+    detector_parameter = cv2.aruco.DetectorParameters()
+    for key, value in params.items():
+        # if value is Enum() take value
+        if isinstance(value, Enum):
+            value = value.value
+
+        if hasattr(detector_parameter, key):
+            setattr(detector_parameter, key, value)
+    return detector_parameter
+
+
+def marker_arrays(corners, ids):
+    """Convert the corner tuple and id column of detected markers to arrays."""
+    corners = np.array(corners, np.float32).reshape(-1, 4, 2)
+    ids = np.empty(0, np.int32) if ids is None else ids.reshape(-1).astype(np.int32)
+    return corners, ids
+
+
+def draw_markers(image, corners, ids):
+    return cv2.aruco.drawDetectedMarkers(
+        image, tuple(c.reshape(1, 4, 2) for c in corners), ids.reshape(-1, 1)
+    )
 
 
 class ArucoDetector(CvFunction):
+    returns_detections = True
+
     @staticmethod
     def process(image, dictionary_type, **params):
-        gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
-        aruco_dict = cv2.aruco.getPredefinedDictionary(dictionary_type.value)
+        detections = ArucoDetector.detect(image, dictionary_type, **params)
+        with tracer.span("draw"):
+            return ArucoDetector.draw(image, detections)
 
-        detector_parameter = cv2.aruco.DetectorParameters()
-        for key, value in params.items():
-            # if value is Enum() take value
-            if isinstance(value, Enum):
-                value = value.value
-
-            if hasattr(detector_parameter, key):
-                setattr(detector_parameter, key, value)
+    @staticmethod
+    def detect(image, dictionary_type, **params):
+        gray = to_gray(image)
 
         if params.get("flipImage"):
             gray = cv2.flip(gray, 1)
 
-        detector = cv2.aruco.ArucoDetector(
-            dictionary=aruco_dict, detectorParams=detector_parameter
+        detector = operator_cache.get(
+            ("aruco", dictionary_type, params),
+            lambda: cv2.aruco.ArucoDetector(
+                dictionary=cv2.aruco.getPredefinedDictionary(dictionary_type.value),
+                detectorParams=detector_parameters(params),
+            ),
         )
         corners, ids, _ = detector.detectMarkers(gray)
+        corners, ids = marker_arrays(corners, ids)
+        return Detections(
+            "markers", corners=corners, ids=ids, flipped=bool(params.get("flipImage"))
+        )
 
+    @staticmethod
+    def draw(image, detections):
+        if len(detections) == 0:
+            return image
+        # Markers are drawn on the grayscale image they were detected in
+        gray = to_gray(image)
+        if detections["flipped"]:
+            gray = cv2.flip(gray, 1)
         color = cv2.cvtColor(gray, cv2.COLOR_GRAY2BGR)
-
-        if ids is not None:
-            image = cv2.aruco.drawDetectedMarkers(color, corners, ids)
-        return image
+        return draw_markers(color, detections["corners"], detections["ids"])
 
     @staticmethod
     def get_params():
@@ -76,8 +116,18 @@ class ArucoDetector(CvFunction):
 
 
 class CharucoBoardDetector(CvFunction):
+    modifies_input = True
+    returns_detections = True
+    slow = True
+
+    @staticmethod
+    def process(image, **params):
+        detections = CharucoBoardDetector.detect(image, **params)
+        with tracer.span("draw"):
+            return CharucoBoardDetector.draw(image, detections)
+
     @staticmethod
-    def process(
+    def detect(
         image,
         dictionary_type,
         patternsize_x,
@@ -86,35 +136,62 @@ class CharucoBoardDetector(CvFunction):
         marker_length,
         **params
     ):
-        gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
-        aruco_dict = cv2.aruco.getPredefinedDictionary(dictionary_type.value)
-        board = cv2.aruco.CharucoBoard(
-            (patternsize_x, patternsize_y), square_length, marker_length, aruco_dict
-        )
+        gray = to_gray(image)
 
-        detector_parameter = cv2.aruco.DetectorParameters()
-        for key, value in params.items():
-            # if value is Enum() take value
-            if isinstance(value, Enum):
-                value = value.value
-
-            if hasattr(detector_parameter, key):
-                setattr(detector_parameter, key, value)
+        def create():
+            aruco_dict = cv2.aruco.getPredefinedDictionary(dictionary_type.value)
+            board = cv2.aruco.CharucoBoard(
+                (patternsize_x, patternsize_y), square_length, marker_length, aruco_dict
+            )
+            return cv2.aruco.CharucoDetector(
+                board, detectorParams=detector_parameters(params)
+            )
 
-        detector = cv2.aruco.CharucoDetector(board, detectorParams=detector_parameter)
+        detector = operator_cache.get(
+            (
+                "charuco",
+                dictionary_type,
+                patternsize_x,
+                patternsize_y,
+                square_length,
+                marker_length,
+                params,
+            ),
+            create,
+        )
 
         if params.get("flipImage"):
             gray = cv2.flip(gray, 1)
-            image = cv2.flip(image, 1)
 
         corners, corner_ids, marker_corners, marker_ids = detector.detectBoard(gray)
+        marker_corners, marker_ids = marker_arrays(marker_corners, marker_ids)
+        if corners is None or corner_ids is None:
+            corners, corner_ids = np.empty((0, 2), np.float32), np.empty(0, np.int32)
+        return Detections(
+            "charuco",
+            corners=corners.reshape(-1, 2).astype(np.float32),
+            corner_ids=corner_ids.reshape(-1).astype(np.int32),
+            marker_corners=marker_corners,
+            marker_ids=marker_ids,
+            flipped=bool(params.get("flipImage")),
+        )
 
-        if marker_corners is not None and len(marker_corners) > 0:
-            image = cv2.aruco.drawDetectedMarkers(image, marker_corners, marker_ids)
+    @staticmethod
+    def draw(image, detections):
+        if detections["flipped"]:
+            image = cv2.flip(image, 1)
+
+        if len(detections["marker_ids"]) > 0:
+            image = draw_markers(
+                image, detections["marker_corners"], detections["marker_ids"]
+            )
 
-        if corners is not None and corner_ids is not None and len(corners) > 0:
+        if len(detections) > 0:
             cv2.aruco.drawDetectedCornersCharuco(
-                image, corners, corner_ids, (0, 255, 0)
+                image,
+                detections["corners"].reshape(-1, 1, 2),
+                detections["corner_ids"].reshape(-1, 1),
+                (0, 255, 0),
             )
         return image
 
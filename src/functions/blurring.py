@@ -4,9 +4,23 @@ from .function import CvFunction
 
 
 class GaussianBlur(CvFunction):
+    supports_dst = True
+    pixel_params = {"ksize": 1, "sigmaX": 1, "sigmaY": 1}
+
+    @staticmethod
+    def process(
+        image, ksize, sigmaX, sigmaY=0, borderType=BorderType.BORDER_DEFAULT, dst=None
+    ):
+        return cv2.GaussianBlur(
+            image, (ksize, ksize), sigmaX, dst, sigmaY, borderType.value
+        )
+
     @staticmethod
-    def process(image, ksize, sigmaX, sigmaY=0, borderType=BorderType.BORDER_DEFAULT):
-        return cv2.GaussianBlur(image, (ksize, ksize), sigmaX, sigmaY, borderType.value)
+    def tile_halo(ksize, borderType=BorderType.BORDER_DEFAULT, **params):
+        # Wrapped borders take pixels from the opposite edge, outside the tile
+        if borderType == BorderType.BORDER_WRAP:
+            return None
+        return ksize // 2
 
     @staticmethod
     def get_params():
@@ -19,9 +33,16 @@ class GaussianBlur(CvFunction):
 
 
 class MedianBlur(CvFunction):
+    supports_dst = True
+    pixel_params = {"ksize": 1}
+
     @staticmethod
-    def process(image, ksize):
-        return cv2.medianBlur(image, ksize)
+    def process(image, ksize, dst=None):
+        return cv2.medianBlur(image, ksize, dst)
+
+    @staticmethod
+    def tile_halo(ksize, **params):
+        return ksize // 2
 
     @staticmethod
     def get_params():
@@ -29,9 +50,19 @@ class MedianBlur(CvFunction):
 
 
 class BilateralFilter(CvFunction):
+    supports_dst = True
+    pixel_params = {"d": 1, "sigmaSpace": 1}
+    slow = True
+
+    @staticmethod
+    def process(image, d, sigmaColor, sigmaSpace, dst=None):
+        return cv2.bilateralFilter(image, d, sigmaColor, sigmaSpace, dst)
+
     @staticmethod
-    def process(image, d, sigmaColor, sigmaSpace):
-        return cv2.bilateralFilter(image, d, sigmaColor, sigmaSpace)
+    def tile_halo(d, sigmaSpace, **params):
+        # OpenCV derives the radius from sigmaSpace when d is not positive,
+        # and always uses at least one neighbor
+        return max(1, d // 2 if d > 0 else round(sigmaSpace * 1.5))
 
     @staticmethod
     def get_params():
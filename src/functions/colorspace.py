@@ -0,0 +1,99 @@
+import hashlib
+
+import cv2
+import numpy as np
+
+
+class ColorImage(np.ndarray):
+    """An image that keeps the gray and BGR versions computed from it.
+
+    Only arrays from color_image() and to_bgr() keep versions, in
+    `_views`. Copies, slices and buffers made with np.empty_like start
+    without, as they may be written to. The arrays returned by to_gray()
+    and to_bgr() may be shared, so never write to them; take a copy, or
+    use cv2.cvtColor() for an image to draw on.
+    """
+
+    def __array_finalize__(self, obj):
+        self._views = None
+
+
+def color_image(image):
+    """Return `image` as a ColorImage that keeps the versions computed from it.
+
+    The image must not be written to afterwards. No data is copied.
+    """
+    if getattr(image, "_views", None) is None:
+        image = np.asarray(image).view(ColorImage)
+        image._views = {}
+    return image
+
+
+def image_hash(image):
+    """Return a content hash of an image, including its shape and dtype."""
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(f"{image.shape}|{image.dtype.str}".encode("utf-8"))
+    digest.update(np.ascontiguousarray(image).data)
+    return digest.hexdigest()
+
+
+def image_nbytes(image):
+    """Return the bytes of an image and of the versions it keeps.
+
+    Versions are added whenever they are first used, so caches holding
+    ColorImages must measure them again rather than once when stored.
+    """
+    views = getattr(image, "_views", None) or {}
+    return image.nbytes + sum(view.nbytes for view in views.values())
+
+
+def converted(image, name, code):
+    views = getattr(image, "_views", None)
+    if views is not None and name in views:
+        return views[name]
+    result = cv2.cvtColor(image, code)
+    if views is not None:
+        views[name] = result
+    return result
+
+
+def to_gray(image):
+    """Return the single-channel version of a gray, BGR or BGRA image."""
+    if image.ndim == 2:
+        return image
+    if image.shape[2] == 1:
+        return image[:, :, 0]
+    if image.shape[2] == 4:
+        return converted(image, "gray", cv2.COLOR_BGRA2GRAY)
+    return converted(image, "gray", cv2.COLOR_BGR2GRAY)
+
+
+def to_bgr(image, dst=None):
+    """Return the BGR version of a gray or BGR image.
+
+    The result of converting a gray image remembers it, so converting that
+    back with to_gray() costs nothing.
+    """
+    if image.ndim == 3 and image.shape[2] == 3:
+        return image
+    if image.ndim == 3 and image.shape[2] == 4:
+        return converted(image, "bgr", cv2.COLOR_BGRA2BGR)
+    gray = to_gray(image)
+    views = getattr(gray, "_views", None)
+    if views is not None and "bgr" in views and dst is None:
+        return views["bgr"]
+    bgr = cv2.cvtColor(gray, cv2.COLOR_GRAY2BGR, dst)
+    if isinstance(bgr, ColorImage):
+        # A reused dst must forget the versions of what it held before
+        bgr._views = {}
+    else:
+        bgr = color_image(bgr)
+    bgr._views["gray"] = gray
+    if views is not None:
+        views["bgr"] = bgr
+    return bgr
+
+
+def to_rgb(image):
+    """Return the RGB version of a gray or BGR image, for display."""
+    return converted(to_bgr(image), "rgb", cv2.COLOR_BGR2RGB)
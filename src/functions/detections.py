@@ -0,0 +1,96 @@
+import cv2
+import numpy as np
+
+
+class Detections:
+    """Array-backed results of a detector, independent of how they are drawn.
+
+    `kind` names what was detected ("markers", "keypoints", "lines", ...).
+    Every other keyword is an array, and the first one has one row per
+    detection. Flags needed for drawing are stored as 0-d arrays, so all
+    detections can be saved to .npz without pickling.
+    """
+
+    def __init__(self, kind, **arrays):
+        self.kind = kind
+        self.arrays = {name: np.asarray(value) for name, value in arrays.items()}
+
+    def __len__(self):
+        first = next(iter(self.arrays.values()), None)
+        return 0 if first is None or first.ndim == 0 else len(first)
+
+    def __getitem__(self, name):
+        return self.arrays[name]
+
+    def __contains__(self, name):
+        return name in self.arrays
+
+    def __repr__(self):
+        return f"Detections({self.kind!r}, {len(self)} found)"
+
+    def summary(self):
+        return {"kind": self.kind, "count": len(self)}
+
+
+def save_npz(path, detections):
+    """Save (function name, Detections) pairs of a pipeline run to one .npz file.
+
+    Arrays are stored as "step<n>.<name>", along with "step<n>.kind" and
+    "step<n>.function".
+    """
+    arrays = {}
+    for i, (function_name, result) in enumerate(detections, start=1):
+        prefix = f"step{i}"
+        arrays[f"{prefix}.function"] = np.array(function_name)
+        arrays[f"{prefix}.kind"] = np.array(result.kind)
+        for name, value in result.arrays.items():
+            arrays[f"{prefix}.{name}"] = value
+    np.savez_compressed(path, **arrays)
+
+
+def load_npz(path):
+    """Return the (function name, Detections) pairs saved by save_npz()."""
+    steps = {}
+    with np.load(path) as data:
+        for key in data.files:
+            prefix, name = key.split(".", 1)
+            steps.setdefault(prefix, {})[name] = data[key]
+    detections = []
+    for prefix in sorted(steps, key=lambda p: int(p[len("step"):])):
+        arrays = steps[prefix]
+        function_name = arrays.pop("function").item()
+        kind = arrays.pop("kind").item()
+        detections.append((function_name, Detections(kind, **arrays)))
+    return detections
+
+
+def keypoint_detections(keypoints, descriptors=None):
+    """Convert cv2.KeyPoint objects, and optionally their descriptors."""
+    arrays = {
+        "points": np.array([kp.pt for kp in keypoints], np.float32).reshape(-1, 2),
+        "size": np.array([kp.size for kp in keypoints], np.float32),
+        "angle": np.array([kp.angle for kp in keypoints], np.float32),
+        "response": np.array([kp.response for kp in keypoints], np.float32),
+        "octave": np.array([kp.octave for kp in keypoints], np.int32),
+        "class_id": np.array([kp.class_id for kp in keypoints], np.int32),
+    }
+    if descriptors is not None:
+        arrays["descriptors"] = descriptors
+    return Detections("keypoints", **arrays)
+
+
+def to_keypoints(detections):
+    """Rebuild the cv2.KeyPoint objects of keypoint detections, for drawing."""
+    return [
+        cv2.KeyPoint(
+            float(x), float(y), float(size), float(angle), float(response), int(octave), int(class_id)
+        )
+        for (x, y), size, angle, response, octave, class_id in zip(
+            detections["points"],
+            detections["size"],
+            detections["angle"],
+            detections["response"],
+            detections["octave"],
+            detections["class_id"],
+        )
+    ]
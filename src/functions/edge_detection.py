@@ -4,12 +4,17 @@ from .function import CvFunction
 
 
 class CannyEdgeDetection(CvFunction):
+    supports_dst = True
+
     @staticmethod
-    def process(image, threshold1, threshold2, apertureSize=3, L2gradient=False):
+    def process(
+        image, threshold1, threshold2, apertureSize=3, L2gradient=False, dst=None
+    ):
         return cv2.Canny(
             image,
             threshold1,
             threshold2,
+            edges=dst,
             apertureSize=apertureSize,
             L2gradient=L2gradient,
         )
@@ -25,21 +30,39 @@ class CannyEdgeDetection(CvFunction):
 
 
 class SobelEdgeDetection(CvFunction):
+    supports_dst = True
+
     @staticmethod
     def process(
-        image, dx, dy, ksize=3, scale=1, delta=0, borderType=BorderType.BORDER_DEFAULT
+        image,
+        dx,
+        dy,
+        ksize=3,
+        scale=1,
+        delta=0,
+        borderType=BorderType.BORDER_DEFAULT,
+        dst=None,
     ):
         return cv2.Sobel(
             image,
             cv2.CV_8U,
             dx,
             dy,
+            dst=dst,
             ksize=ksize,
             scale=scale,
             delta=delta,
             borderType=borderType.value,
         )
 
+    @staticmethod
+    def tile_halo(ksize=3, borderType=BorderType.BORDER_DEFAULT, **params):
+        # Wrapped borders take pixels from the opposite edge, outside the tile
+        if borderType == BorderType.BORDER_WRAP:
+            return None
+        # ksize 1 uses a 3-tap kernel
+        return max(1, ksize // 2)
+
     @staticmethod
     def get_params():
         return {
@@ -53,17 +76,29 @@ class SobelEdgeDetection(CvFunction):
 
 
 class Laplacian(CvFunction):
+    supports_dst = True
+
     @staticmethod
-    def process(image, ksize=1, scale=1, delta=0, borderType=BorderType.BORDER_DEFAULT):
+    def process(
+        image, ksize=1, scale=1, delta=0, borderType=BorderType.BORDER_DEFAULT, dst=None
+    ):
         return cv2.Laplacian(
             image,
             cv2.CV_8U,
+            dst=dst,
             ksize=ksize,
             scale=scale,
             delta=delta,
             borderType=borderType.value,
         )
 
+    @staticmethod
+    def tile_halo(ksize=1, borderType=BorderType.BORDER_DEFAULT, **params):
+        if borderType == BorderType.BORDER_WRAP:
+            return None
+        # ksize 1 uses a 3x3 aperture
+        return max(1, ksize // 2)
+
     @staticmethod
     def get_params():
         return {
@@ -127,3 +127,27 @@ class TemplateMatchingMethod(Enum):
     CCORR_NORMED = cv2.TM_CCORR_NORMED
     CCOEFF = cv2.TM_CCOEFF
     CCOEFF_NORMED = cv2.TM_CCOEFF_NORMED
+
+
+class FeatureType(Enum):
+    ORB = "ORB"
+    SIFT = "SIFT"
+    AKAZE = "AKAZE"
+
+
+class DescriptorMatcherType(Enum):
+    BRUTE_FORCE = "BRUTE_FORCE"
+    FLANN = "FLANN"
+
+
+class FrequencyFilterType(Enum):
+    LOW_PASS = "LOW_PASS"
+    HIGH_PASS = "HIGH_PASS"
+    BAND_PASS = "BAND_PASS"
+    BAND_STOP = "BAND_STOP"
+
+
+class FrequencyFilterProfile(Enum):
+    IDEAL = "IDEAL"
+    GAUSSIAN = "GAUSSIAN"
+    BUTTERWORTH = "BUTTERWORTH"
@@ -0,0 +1,53 @@
+import cv2
+import numpy as np
+import streamlit as st
+from .colorspace import to_gray
+from .function import CvFunction
+from csem_template_matcher.MatcherApi.Matcher import Matcher, MatcherSettings
+
+
+class FastMatcher(CvFunction):
+    cacheable = False
+
+    @staticmethod
+    def process(image, template, **params):
+
+        settings = MatcherSettings()
+        for key, value in params.items():
+            setattr(settings, key, value)
+
+        template = to_gray(template).astype(np.uint8)
+        image = to_gray(image).astype(np.uint8)
+
+        matcher = Matcher(template)
+        matcher.set_settings(settings)
+
+        matcher.match(image)
+        res = matcher.get_result()
+
+        output = Matcher.draw_matches(cv2.cvtColor(image, cv2.COLOR_GRAY2BGR), res)
+
+        st.write(f"Found {len(res)} matches")
+
+        return output
+
+    @staticmethod
+    def get_params():
+
+        return {
+            "template": None,
+            "m_ckSIMD": True,
+            "m_iMaxPos": (1, 100, 50, 1),
+            "m_dMaxOverlap": (0.0, 1.0, 0.0, 0.1),
+            "m_dScore": (0.0, 1.0, 0.5, 0.01),
+            "m_dToleranceAngle": (0, 360, 180, 1),
+            "m_iMinReduceArea": (1, 1024, 256, 1),
+            "m_bToleranceRange": False,
+            "m_dTolerance1": (0, 360, 1, 1),
+            "m_dTolerance2": (0, 360, 1, 1),
+            "m_dTolerance3": (0, 360, 1, 1),
+            "m_dTolerance4": (0, 360, 1, 1),
+            "m_useSubPixel": False,
+            "m_bStopLayer": True,
+            "requires_secondary_image": True,
+        }
@@ -1,12 +1,25 @@
 import cv2
 import numpy as np
+from .colorspace import to_gray
+from .detections import keypoint_detections, to_keypoints
 from .enums import *
 from .function import CvFunction
+from .operator_cache import operator_cache
+from .tracing import tracer
 
 
 class BlobDetector(CvFunction):
+    pixel_params = {"minArea": 2}
+    returns_detections = True
+
+    @staticmethod
+    def process(image, **params):
+        detections = BlobDetector.detect(image, **params)
+        with tracer.span("draw"):
+            return BlobDetector.draw(image, detections)
+
     @staticmethod
-    def process(
+    def detect(
         image,
         minThreshold,
         maxThreshold,
@@ -15,27 +28,43 @@ class BlobDetector(CvFunction):
         minConvexity,
         minInertiaRatio,
     ):
-        # Set up the detector with default parameters.
-        params = cv2.SimpleBlobDetector.Params()
-
-        params.minThreshold = minThreshold
-        params.maxThreshold = maxThreshold
-        params.filterByArea = True
-        params.minArea = minArea
-        params.filterByCircularity = True
-        params.minCircularity = minCircularity
-        params.filterByConvexity = True
-        params.minConvexity = minConvexity
-        params.filterByInertia = True
-        params.minInertiaRatio = minInertiaRatio
-        detector = cv2.SimpleBlobDetector.create(params)
-
-        keypoints = detector.detect(image)
+        def create():
+            # Set up the detector with default parameters.
+            params = cv2.SimpleBlobDetector.Params()
+
+            params.minThreshold = minThreshold
+            params.maxThreshold = maxThreshold
+            params.filterByArea = True
+            params.minArea = minArea
+            params.filterByCircularity = True
+            params.minCircularity = minCircularity
+            params.filterByConvexity = True
+            params.minConvexity = minConvexity
+            params.filterByInertia = True
+            params.minInertiaRatio = minInertiaRatio
+            return cv2.SimpleBlobDetector.create(params)
 
+        detector = operator_cache.get(
+            (
+                "blob",
+                minThreshold,
+                maxThreshold,
+                minArea,
+                minCircularity,
+                minConvexity,
+                minInertiaRatio,
+            ),
+            create,
+        )
+
+        return keypoint_detections(detector.detect(to_gray(image)))
+
+    @staticmethod
+    def draw(image, detections):
         # Draw detected blobs as red circles.
         return cv2.drawKeypoints(
             image,
-            keypoints,
+            to_keypoints(detections),
             np.array([]),
             (0, 0, 255),
             cv2.DRAW_MATCHES_FLAGS_DRAW_RICH_KEYPOINTS,
@@ -54,13 +83,29 @@ class BlobDetector(CvFunction):
 
 
 class FastFeatureDetector(CvFunction):
+    returns_detections = True
+
+    @staticmethod
+    def process(image, **params):
+        detections = FastFeatureDetector.detect(image, **params)
+        with tracer.span("draw"):
+            return FastFeatureDetector.draw(image, detections)
+
     @staticmethod
-    def process(image, threshold=10, nonmaxSuppression=True, type=2):
-        fast = cv2.FastFeatureDetector.create(
-            threshold=threshold, nonmaxSuppression=nonmaxSuppression, type=type
+    def detect(
+        image, threshold=10, nonmaxSuppression=True, type=FastFeatureType.TYPE_9_16
+    ):
+        fast = operator_cache.get(
+            ("fast", threshold, nonmaxSuppression, type),
+            lambda: cv2.FastFeatureDetector.create(
+                threshold=threshold, nonmaxSuppression=nonmaxSuppression, type=type.value
+            ),
         )
-        keypoints = fast.detect(image, None)
-        return cv2.drawKeypoints(image, keypoints, None, color=(255, 0, 0))
+        return keypoint_detections(fast.detect(to_gray(image), None))
+
+    @staticmethod
+    def draw(image, detections):
+        return cv2.drawKeypoints(image, to_keypoints(detections), None, color=(255, 0, 0))
 
     @staticmethod
     def get_params():
@@ -72,8 +117,16 @@ class FastFeatureDetector(CvFunction):
 
 
 class OrbFeatureDetector(CvFunction):
+    returns_detections = True
+
     @staticmethod
-    def process(
+    def process(image, **params):
+        detections = OrbFeatureDetector.detect(image, **params)
+        with tracer.span("draw"):
+            return OrbFeatureDetector.draw(image, detections)
+
+    @staticmethod
+    def detect(
         image,
         nfeatures=500,
         scaleFactor=1.2,
@@ -85,19 +138,37 @@ class OrbFeatureDetector(CvFunction):
         patchSize=31,
         fastThreshold=20,
     ):
-        orb = cv2.ORB.create(
-            nfeatures=nfeatures,
-            scaleFactor=scaleFactor,
-            nlevels=nlevels,
-            edgeThreshold=edgeThreshold,
-            firstLevel=firstLevel,
-            WTA_K=WTA_K,
-            scoreType=scoreType.value,
-            patchSize=patchSize,
-            fastThreshold=fastThreshold,
+        orb = operator_cache.get(
+            (
+                "orb",
+                nfeatures,
+                scaleFactor,
+                nlevels,
+                edgeThreshold,
+                firstLevel,
+                WTA_K,
+                scoreType,
+                patchSize,
+                fastThreshold,
+            ),
+            lambda: cv2.ORB.create(
+                nfeatures=nfeatures,
+                scaleFactor=scaleFactor,
+                nlevels=nlevels,
+                edgeThreshold=edgeThreshold,
+                firstLevel=firstLevel,
+                WTA_K=WTA_K,
+                scoreType=scoreType.value,
+                patchSize=patchSize,
+                fastThreshold=fastThreshold,
+            ),
         )
-        keypoints, _ = orb.detectAndCompute(image, None)
-        return cv2.drawKeypoints(image, keypoints, None, color=(0, 255, 0))
+        keypoints, descriptors = orb.detectAndCompute(to_gray(image), None)
+        return keypoint_detections(keypoints, descriptors)
+
+    @staticmethod
+    def draw(image, detections):
+        return cv2.drawKeypoints(image, to_keypoints(detections), None, color=(0, 255, 0))
 
     @staticmethod
     def get_params():
@@ -115,8 +186,17 @@ class OrbFeatureDetector(CvFunction):
 
 
 class SiftFeatureDetector(CvFunction):
+    returns_detections = True
+    slow = True
+
+    @staticmethod
+    def process(image, **params):
+        detections = SiftFeatureDetector.detect(image, **params)
+        with tracer.span("draw"):
+            return SiftFeatureDetector.draw(image, detections)
+
     @staticmethod
-    def process(
+    def detect(
         image,
         nfeatures=0,
         nOctaveLayers=3,
@@ -124,15 +204,21 @@ class SiftFeatureDetector(CvFunction):
         edgeThreshold=10,
         sigma=1.6,
     ):
-        sift = cv2.SIFT.create(
-            nfeatures=nfeatures,
-            nOctaveLayers=nOctaveLayers,
-            contrastThreshold=contrastThreshold,
-            edgeThreshold=edgeThreshold,
-            sigma=sigma,
+        sift = operator_cache.get(
+            ("sift", nfeatures, nOctaveLayers, contrastThreshold, edgeThreshold, sigma),
+            lambda: cv2.SIFT.create(
+                nfeatures=nfeatures,
+                nOctaveLayers=nOctaveLayers,
+                contrastThreshold=contrastThreshold,
+                edgeThreshold=edgeThreshold,
+                sigma=sigma,
+            ),
         )
-        keypoints = sift.detect(image, None)
-        return cv2.drawKeypoints(image, keypoints, None, color=(0, 0, 255))
+        return keypoint_detections(sift.detect(to_gray(image), None))
+
+    @staticmethod
+    def draw(image, detections):
+        return cv2.drawKeypoints(image, to_keypoints(detections), None, color=(0, 0, 255))
 
     @staticmethod
     def get_params():
@@ -146,8 +232,16 @@ class SiftFeatureDetector(CvFunction):
 
 
 class AkazeFeatureDetector(CvFunction):
+    returns_detections = True
+
     @staticmethod
-    def process(
+    def process(image, **params):
+        detections = AkazeFeatureDetector.detect(image, **params)
+        with tracer.span("draw"):
+            return AkazeFeatureDetector.draw(image, detections)
+
+    @staticmethod
+    def detect(
         image,
         descriptor_type=AkazeDescriptorType.DESCRIPTOR_MLDB_UPRIGHT,
         descriptor_size=0,
@@ -157,17 +251,32 @@ class AkazeFeatureDetector(CvFunction):
         nOctaveLayers=4,
         diffusivity=DiffusivityType.DIFF_PM_G2,
     ):
-        akaze = cv2.AKAZE.create(
-            descriptor_type=descriptor_type.value,
-            descriptor_size=descriptor_size,
-            descriptor_channels=descriptor_channels,
-            threshold=threshold,
-            nOctaves=nOctaves,
-            nOctaveLayers=nOctaveLayers,
-            diffusivity=diffusivity.value,
+        akaze = operator_cache.get(
+            (
+                "akaze",
+                descriptor_type,
+                descriptor_size,
+                descriptor_channels,
+                threshold,
+                nOctaves,
+                nOctaveLayers,
+                diffusivity,
+            ),
+            lambda: cv2.AKAZE.create(
+                descriptor_type=descriptor_type.value,
+                descriptor_size=descriptor_size,
+                descriptor_channels=descriptor_channels,
+                threshold=threshold,
+                nOctaves=nOctaves,
+                nOctaveLayers=nOctaveLayers,
+                diffusivity=diffusivity.value,
+            ),
         )
-        keypoints = akaze.detect(image, None)
-        return cv2.drawKeypoints(image, keypoints, None, color=(255, 255, 0))
+        return keypoint_detections(akaze.detect(to_gray(image), None))
+
+    @staticmethod
+    def draw(image, detections):
+        return cv2.drawKeypoints(image, to_keypoints(detections), None, color=(255, 255, 0))
 
     @staticmethod
     def get_params():
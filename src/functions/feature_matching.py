@@ -0,0 +1,163 @@
+import cv2
+import numpy as np
+from .colorspace import image_hash, to_gray
+from .detections import Detections
+from .enums import *
+from .function import CvFunction
+from .operator_cache import operator_cache
+from .tracing import tracer
+
+FLANN_INDEX_KDTREE = 1
+FLANN_INDEX_LSH = 6
+# Homographies need at least four point pairs
+MIN_HOMOGRAPHY_MATCHES = 4
+
+
+def create_detector(feature_type, nfeatures):
+    if feature_type == FeatureType.ORB:
+        return cv2.ORB.create(nfeatures=nfeatures)
+    if feature_type == FeatureType.SIFT:
+        return cv2.SIFT.create(nfeatures=nfeatures)
+    # AKAZE has no feature limit
+    return cv2.AKAZE.create()
+
+
+def create_matcher(feature_type, matcher_type):
+    """Return a descriptor matcher suited to the descriptors of `feature_type`."""
+    binary = feature_type != FeatureType.SIFT
+    if matcher_type == DescriptorMatcherType.FLANN:
+        if binary:
+            index_params = dict(
+                algorithm=FLANN_INDEX_LSH, table_number=6, key_size=12, multi_probe_level=1
+            )
+        else:
+            index_params = dict(algorithm=FLANN_INDEX_KDTREE, trees=5)
+        return cv2.FlannBasedMatcher(index_params, dict(checks=50))
+    return cv2.BFMatcher(cv2.NORM_HAMMING if binary else cv2.NORM_L2)
+
+
+class FeatureIndex:
+    """Keypoints and a trained descriptor index of one reference image.
+
+    Building the index is the expensive part, so it is done once and the
+    index is then queried with the descriptors of any number of images.
+    """
+
+    def __init__(self, reference, feature_type, nfeatures, matcher_type):
+        self.detector = create_detector(feature_type, nfeatures)
+        keypoints, descriptors = self.detector.detectAndCompute(to_gray(reference), None)
+        self.points = np.array([kp.pt for kp in keypoints], np.float32).reshape(-1, 2)
+        self.shape = reference.shape[:2]
+        self.matcher = create_matcher(feature_type, matcher_type)
+        if descriptors is not None and len(descriptors) >= 2:
+            self.matcher.add([descriptors])
+            self.matcher.train()
+        else:
+            self.matcher = None
+
+    def match(self, image, ratio):
+        """Return (query points, reference points, distances) passing the ratio test."""
+        keypoints, descriptors = self.detector.detectAndCompute(to_gray(image), None)
+        pairs = []
+        if self.matcher is not None and descriptors is not None:
+            # FLANN may return fewer than two neighbors for a descriptor
+            pairs = [
+                m[0]
+                for m in self.matcher.knnMatch(descriptors, k=2)
+                if len(m) == 2 and m[0].distance < ratio * m[1].distance
+            ]
+        query_points = np.array(
+            [keypoints[m.queryIdx].pt for m in pairs], np.float32
+        ).reshape(-1, 2)
+        reference_points = self.points[[m.trainIdx for m in pairs]].reshape(-1, 2)
+        distances = np.array([m.distance for m in pairs], np.float32)
+        return query_points, reference_points, distances
+
+
+class FeatureMatching(CvFunction):
+    """Match features of the image against those of the secondary image."""
+
+    modifies_input = True
+    returns_detections = True
+    pixel_params = {"ransac_threshold": 1}
+
+    @staticmethod
+    def process(image, reference, **params):
+        detections = FeatureMatching.detect(image, reference, **params)
+        with tracer.span("draw"):
+            return FeatureMatching.draw(image, detections)
+
+    @staticmethod
+    def detect(
+        image,
+        reference,
+        feature_type=FeatureType.ORB,
+        nfeatures=1000,
+        matcher_type=DescriptorMatcherType.BRUTE_FORCE,
+        ratio=0.75,
+        homography=False,
+        ransac_threshold=5.0,
+    ):
+        with tracer.span("index"):
+            index = operator_cache.get(
+                (
+                    "feature_index",
+                    image_hash(reference),
+                    feature_type,
+                    nfeatures,
+                    matcher_type,
+                ),
+                lambda: FeatureIndex(reference, feature_type, nfeatures, matcher_type),
+            )
+        query_points, reference_points, distances = index.match(image, ratio)
+
+        # Outline of the reference image in the query image, and the matches
+        # consistent with it
+        matrix = np.full((3, 3), np.nan)
+        outline = np.empty((0, 2), np.float32)
+        inliers = np.ones(len(distances), bool)
+        if homography and len(distances) >= MIN_HOMOGRAPHY_MATCHES:
+            found, mask = cv2.findHomography(
+                reference_points, query_points, cv2.RANSAC, ransac_threshold
+            )
+            if found is not None:
+                matrix = found
+                inliers = mask.reshape(-1).astype(bool)
+                height, width = index.shape
+                corners = np.array(
+                    [[0, 0], [width, 0], [width, height], [0, height]], np.float32
+                )
+                outline = cv2.perspectiveTransform(corners.reshape(-1, 1, 2), matrix)
+                outline = outline.reshape(-1, 2)
+
+        return Detections(
+            "feature_matches",
+            query_points=query_points,
+            reference_points=reference_points,
+            distances=distances,
+            inliers=inliers,
+            homography=matrix,
+            outline=outline,
+        )
+
+    @staticmethod
+    def draw(image, detections):
+        for (x, y), inlier in zip(detections["query_points"].tolist(), detections["inliers"]):
+            color = (0, 255, 0) if inlier else (0, 0, 255)
+            cv2.circle(image, (round(x), round(y)), 4, color, 1)
+        if len(detections["outline"]) > 0:
+            outline = np.round(detections["outline"]).astype(np.int32)
+            cv2.polylines(image, [outline], True, (255, 0, 0), 2)
+        return image
+
+    @staticmethod
+    def get_params():
+        return {
+            "feature_type": list(FeatureType),
+            "nfeatures": (100, 10000, 1000, 100),
+            "matcher_type": list(DescriptorMatcherType),
+            "ratio": (0.5, 1.0, 0.75, 0.01),
+            "homography": False,
+            "ransac_threshold": (1.0, 20.0, 5.0, 0.5),
+            "requires_secondary_image": True,
+        }
@@ -1,38 +1,257 @@
 import cv2
 import numpy as np
+from .colorspace import to_bgr, to_gray
+from .enums import *
 from .function import CvFunction
+from .operator_cache import operator_cache
+
+
+class Spectrum(np.ndarray):
+    """Complex spectra of the channels of an image, as passed between steps.
+
+    The array has the shape (channels, height, width, 2) with real and
+    imaginary parts in float32, and the DC term at (0, 0). The image is
+    padded to sizes cv2.dft is fast for, `image_shape` is its (height,
+    width) before padding. `shift` centers the magnitude view.
+    """
+
+    def __new__(cls, array, image_shape, shift=True):
+        spectrum = np.asarray(array).view(cls)
+        spectrum.image_shape = tuple(image_shape)
+        spectrum.shift = shift
+        return spectrum
+
+    def __array_finalize__(self, obj):
+        self.image_shape = getattr(obj, "image_shape", None)
+        self.shift = getattr(obj, "shift", True)
+
+    def __reduce__(self):
+        # Keep the attributes when sent to worker processes
+        reconstruct, args, state = super().__reduce__()
+        return reconstruct, args, (state, self.image_shape, self.shift)
+
+    def __setstate__(self, state):
+        state, self.image_shape, self.shift = state
+        super().__setstate__(state)
+
+
+def magnitude_view(spectrum):
+    """Return the log magnitude of a spectrum as a uint8 image, for display."""
+    array = np.asarray(spectrum)
+    magnitude = np.mean(
+        [cv2.magnitude(channel[:, :, 0], channel[:, :, 1]) for channel in array], axis=0
+    )
+    view = np.log1p(magnitude)
+    if spectrum.shift:
+        view = np.fft.fftshift(view)
+    return cv2.normalize(view, None, 0, 255, cv2.NORM_MINMAX, dtype=cv2.CV_8U)
+
+
+def as_image(result):
+    """Return the magnitude view of a spectrum, and any other result unchanged."""
+    if isinstance(result, Spectrum):
+        return magnitude_view(result)
+    return result
+
+
+def require_spectrum(image, function_name):
+    if not isinstance(image, Spectrum):
+        raise ValueError(f"{function_name} needs the output of a Fourier Transform step")
+
+
+def require_image(image, function_name, function_class):
+    """Raise a ValueError when a function working on images gets a spectrum."""
+    if isinstance(image, Spectrum) and not function_class.spectral:
+        raise ValueError(
+            f"{function_name} works on images, add an Inverse Fourier Transform step first"
+        )
+
+
+def radial_frequency(shape):
+    """Return the frequency of every element of an unshifted spectrum.
+
+    Frequencies are fractions of the Nyquist frequency, so 1 is the
+    highest frequency along an axis, whatever the image size.
+    """
+    fy = np.fft.fftfreq(shape[0]).astype(np.float32) * 2
+    fx = np.fft.fftfreq(shape[1]).astype(np.float32) * 2
+    return np.sqrt(fy[:, None] ** 2 + fx[None, :] ** 2)
+
+
+def low_pass(frequency, cutoff, profile, order):
+    if profile == FrequencyFilterProfile.IDEAL:
+        return (frequency <= cutoff).astype(np.float32)
+    if profile == FrequencyFilterProfile.GAUSSIAN:
+        return np.exp(-(frequency**2) / (2 * cutoff**2))
+    return 1 / (1 + (frequency / cutoff) ** (2 * order))
+
+
+def frequency_mask(shape, filter_type, profile, cutoff, bandwidth, order):
+    frequency = radial_frequency(shape)
+    if filter_type == FrequencyFilterType.LOW_PASS:
+        mask = low_pass(frequency, cutoff, profile, order)
+    elif filter_type == FrequencyFilterType.HIGH_PASS:
+        mask = 1 - low_pass(frequency, cutoff, profile, order)
+    else:
+        inner = low_pass(frequency, max(cutoff - bandwidth / 2, 1e-6), profile, order)
+        outer = low_pass(frequency, cutoff + bandwidth / 2, profile, order)
+        mask = outer * (1 - inner)
+        if filter_type == FrequencyFilterType.BAND_STOP:
+            mask = 1 - mask
+    return mask.astype(np.float32)
+
+
+def notch_mask(shape, centers, radius):
+    """Return a mask suppressing Gaussian notches at (fx, fy) and their mirrors."""
+    fy = np.fft.fftfreq(shape[0]).astype(np.float32)[:, None] * 2
+    fx = np.fft.fftfreq(shape[1]).astype(np.float32)[None, :] * 2
+    mask = np.ones(shape, np.float32)
+    for cx, cy in centers:
+        # The spectrum of a real image is symmetric, so notch both peaks
+        for sign in (1, -1):
+            distance = (fx - sign * cx) ** 2 + (fy - sign * cy) ** 2
+            mask *= 1 - np.exp(-distance / (2 * radius**2))
+    return mask
+
+
+def find_notches(spectrum, count, radius, min_frequency):
+    """Return the (fx, fy) of the `count` strongest peaks above `min_frequency`."""
+    array = np.asarray(spectrum)
+    magnitude = np.mean(
+        [cv2.magnitude(channel[:, :, 0], channel[:, :, 1]) for channel in array], axis=0
+    )
+    magnitude[radial_frequency(magnitude.shape) < min_frequency] = 0
+    fy = np.fft.fftfreq(magnitude.shape[0]) * 2
+    fx = np.fft.fftfreq(magnitude.shape[1]) * 2
+    centers = []
+    for _ in range(count):
+        y, x = np.unravel_index(np.argmax(magnitude), magnitude.shape)
+        if magnitude[y, x] <= 0:
+            break
+        centers.append((float(fx[x]), float(fy[y])))
+        # Suppress the peak and its mirror before looking for the next one
+        magnitude *= notch_mask(magnitude.shape, centers[-1:], radius)
+    return centers
 
 
 class FourierTransform(CvFunction):
+    """Transform the image to the frequency domain.
+
+    The result is a Spectrum that later steps such as "Frequency Filter"
+    and "Inverse Fourier Transform" work on. Only its magnitude is shown.
+    """
+
     @staticmethod
-    def process(image, dft_scale=1, dft_shift=True):
-        gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
-        dft = cv2.dft(np.float32(gray), flags=cv2.DFT_COMPLEX_OUTPUT)
-        if dft_shift:
-            dft_shift = np.fft.fftshift(dft)
+    def process(image, dft_scale=1, dft_shift=True, color=False):
+        # dft_scale is kept for older exported histories. The magnitude
+        # view is normalized, so scaling it never had a visible effect.
+        if color and image.ndim == 3:
+            planes = cv2.split(to_bgr(image))
         else:
-            dft_shift = dft
-        magnitude_spectrum = dft_scale * np.log(
-            cv2.magnitude(dft_shift[:, :, 0], dft_shift[:, :, 1])
-        )
-        return cv2.normalize(
-            magnitude_spectrum, None, 0, 255, cv2.NORM_MINMAX, dtype=cv2.CV_8U
-        )
+            planes = [to_gray(image)]
+
+        height, width = planes[0].shape
+        padded_height = cv2.getOptimalDFTSize(height)
+        padded_width = cv2.getOptimalDFTSize(width)
+        spectrum = np.empty((len(planes), padded_height, padded_width, 2), np.float32)
+        for plane, channel in zip(planes, spectrum):
+            # Mirrored rather than zero padding, so filters do not darken
+            # the image borders
+            padded = cv2.copyMakeBorder(
+                np.float32(plane),
+                0,
+                padded_height - height,
+                0,
+                padded_width - width,
+                cv2.BORDER_REFLECT_101,
+            )
+            # OpenCV uses a real-input transform and only expands the result
+            cv2.dft(padded, channel, flags=cv2.DFT_COMPLEX_OUTPUT)
+        return Spectrum(spectrum, (height, width), dft_shift)
 
     @staticmethod
     def get_params():
         return {
-            "dft_scale": (0.1, 10.0, 1.0, 0.1),
             "dft_shift": True,
+            "color": False,
         }
 
 
 class InverseFourierTransform(CvFunction):
+    spectral = True
+
     @staticmethod
     def process(image):
-        dft = cv2.idft(image)
-        return cv2.magnitude(dft[:, :, 0], dft[:, :, 1])
+        require_spectrum(image, "Inverse Fourier Transform")
+        height, width = image.image_shape
+        planes = [
+            cv2.idft(channel, flags=cv2.DFT_SCALE | cv2.DFT_REAL_OUTPUT)[:height, :width]
+            for channel in np.asarray(image)
+        ]
+        return to_bgr(np.clip(np.rint(cv2.merge(planes)), 0, 255).astype(np.uint8))
 
     @staticmethod
     def get_params():
         return {}
+
+
+class FrequencyFilter(CvFunction):
+    """Multiply a spectrum by a radial low, high, band-pass or band-stop mask.
+
+    Cutoff and bandwidth are fractions of the Nyquist frequency, so the
+    same parameters work on the downscaled preview.
+    """
+
+    modifies_input = True
+    spectral = True
+
+    @staticmethod
+    def process(image, filter_type, profile, cutoff, bandwidth=0.1, order=2):
+        require_spectrum(image, "Frequency Filter")
+        shape = image.shape[1:3]
+        mask = operator_cache.get(
+            ("frequency_mask", shape, filter_type, profile, cutoff, bandwidth, order),
+            lambda: frequency_mask(shape, filter_type, profile, cutoff, bandwidth, order),
+            per_thread=False,
+        )
+        image *= mask[None, :, :, None]
+        return image
+
+    @staticmethod
+    def get_params():
+        return {
+            "filter_type": list(FrequencyFilterType),
+            "profile": list(FrequencyFilterProfile),
+            "cutoff": (0.01, 1.0, 0.1, 0.01),
+            "bandwidth": (0.01, 1.0, 0.1, 0.01),
+            "order": (1, 10, 2, 1),
+        }
+
+
+class NotchFilter(CvFunction):
+    """Suppress periodic patterns, such as textures, at single frequencies.
+
+    Notches go at (fx, fy), unless both are 0, and at the `peaks` strongest
+    frequencies above `min_frequency`, which are found automatically.
+    """
+
+    modifies_input = True
+    spectral = True
+
+    @staticmethod
+    def process(image, fx=0.0, fy=0.0, radius=0.02, peaks=0, min_frequency=0.1):
+        require_spectrum(image, "Notch Filter")
+        centers = [(fx, fy)] if fx or fy else []
+        centers += find_notches(image, peaks, radius, min_frequency)
+        image *= notch_mask(image.shape[1:3], centers, radius)[None, :, :, None]
+        return image
+
+    @staticmethod
+    def get_params():
+        return {
+            "fx": (-1.0, 1.0, 0.0, 0.01),
+            "fy": (-1.0, 1.0, 0.0, 0.01),
+            "radius": (0.005, 0.2, 0.02, 0.005),
+            "peaks": (0, 20, 4, 1),
+            "min_frequency": (0.01, 1.0, 0.1, 0.01),
+        }
@@ -1,4 +1,27 @@
 class CvFunction:
+    # Whether results depend only on the inputs and parameters, so they can
+    # be reused instead of recomputed
+    cacheable = True
+    # Whether process() draws on or otherwise writes to its input image
+    modifies_input = False
+    # Whether process() accepts a `dst` array to write its output into
+    supports_dst = False
+    # Whether process() takes the previous video frame followed by the
+    # current one, instead of an image and a secondary image
+    frame_pair = False
+    # Parameters measured in pixels, mapped to their dimension (1 for
+    # lengths, 2 for areas), so previews on downscaled images can rescale them
+    pixel_params = {}
+    # Whether detect() and draw() are implemented, with process() drawing
+    # what detect() found
+    returns_detections = False
+    # Whether process() takes the Spectrum of a "Fourier Transform" step
+    # instead of an image
+    spectral = False
+    # Whether process() is slow enough that the UI should always run it in
+    # the background, instead of only after a slow run
+    slow = False
+
     @staticmethod
     def process(image, **kwargs):
         raise NotImplementedError
@@ -6,3 +29,24 @@ class CvFunction:
     @staticmethod
     def get_params():
         raise NotImplementedError
+
+    @staticmethod
+    def detect(image, **kwargs):
+        """Return the Detections that process() would draw, without drawing."""
+        raise NotImplementedError
+
+    @staticmethod
+    def draw(image, detections):
+        """Draw detections returned by detect() on `image`."""
+        raise NotImplementedError
+
+    @staticmethod
+    def tile_halo(**params):
+        """Return how many pixels of context each output pixel depends on.
+
+        Functions that can run tile by tile with the same result return the
+        halo for the given parameters; None means the function is not
+        tile-safe, e.g. with BORDER_WRAP, where edge pixels depend on the
+        opposite side of the image.
+        """
+        return None
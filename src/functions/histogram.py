@@ -1,19 +1,18 @@
 import cv2
 import numpy as np
+from .colorspace import to_gray
 from .enums import *
 from .function import CvFunction
+from .operator_cache import operator_cache
 
 
 class HistogramEqualization(CvFunction):
     """Traditional histogram equalization for grayscale images."""
+    supports_dst = True
+
     @staticmethod
-    def process(image):
-        # Check if image is already grayscale
-        if len(image.shape) == 3 and image.shape[2] == 3:
-            gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
-        else:
-            gray = image
-        return cv2.equalizeHist(gray)
+    def process(image, dst=None):
+        return cv2.equalizeHist(to_gray(image), dst)
 
     @staticmethod
     def get_params():
@@ -22,16 +21,17 @@ class HistogramEqualization(CvFunction):
 
 class CLAHE(CvFunction):
     """Contrast Limited Adaptive Histogram Equalization."""
+    supports_dst = True
+
     @staticmethod
-    def process(image, clip_limit=2.0, tile_grid_size=(8, 8)):
-        # Check if image is already grayscale
-        if len(image.shape) == 3 and image.shape[2] == 3:
-            gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
-        else:
-            gray = image
-        
-        clahe = cv2.createCLAHE(clipLimit=clip_limit, tileGridSize=tile_grid_size)
-        return clahe.apply(gray)
+    def process(image, clip_limit=2.0, tile_grid_size=(8, 8), dst=None):
+        gray = to_gray(image)
+
+        clahe = operator_cache.get(
+            ("clahe", clip_limit, tile_grid_size),
+            lambda: cv2.createCLAHE(clipLimit=clip_limit, tileGridSize=tile_grid_size),
+        )
+        return clahe.apply(gray, dst)
 
     @staticmethod
     def get_params():
@@ -42,9 +42,13 @@ class CLAHE(CvFunction):
 
 
 class ColorSpaceConversion(CvFunction):
+    supports_dst = True
+
     @staticmethod
-    def process(image, conversion_code=ColorSpaceConversionType.COLOR_BGR2GRAY):
-        return cv2.cvtColor(image, conversion_code.value)
+    def process(
+        image, conversion_code=ColorSpaceConversionType.COLOR_BGR2GRAY, dst=None
+    ):
+        return cv2.cvtColor(image, conversion_code.value, dst)
 
     @staticmethod
     def get_params():
@@ -1,13 +1,33 @@
 import cv2
 from .enums import MorphShape, MorphOperation
 from .function import CvFunction
+from .operator_cache import structuring_element
+
+# Number of erode/dilate passes each operation makes per iteration
+MORPH_PASSES = {
+    MorphOperation.MORPH_ERODE: 1,
+    MorphOperation.MORPH_DILATE: 1,
+    MorphOperation.MORPH_OPEN: 2,
+    MorphOperation.MORPH_CLOSE: 2,
+    MorphOperation.MORPH_GRADIENT: 1,
+    MorphOperation.MORPH_TOPHAT: 2,
+    MorphOperation.MORPH_BLACKHAT: 2,
+    MorphOperation.MORPH_HITMISS: 1,
+}
 
 
 class Dilate(CvFunction):
+    supports_dst = True
+    pixel_params = {"ksize": 1}
+
     @staticmethod
-    def process(image, ksize, iterations, shape=MorphShape.MORPH_RECT):
-        kernel = cv2.getStructuringElement(shape.value, (ksize, ksize))
-        return cv2.dilate(image, kernel, iterations=iterations)
+    def process(image, ksize, iterations, shape=MorphShape.MORPH_RECT, dst=None):
+        kernel = structuring_element(shape, ksize)
+        return cv2.dilate(image, kernel, dst, iterations=iterations)
+
+    @staticmethod
+    def tile_halo(ksize, iterations, **params):
+        return ksize // 2 * iterations
 
     @staticmethod
     def get_params():
@@ -19,10 +39,17 @@ class Dilate(CvFunction):
 
 
 class Erode(CvFunction):
+    supports_dst = True
+    pixel_params = {"ksize": 1}
+
     @staticmethod
-    def process(image, ksize, iterations, shape=MorphShape.MORPH_RECT):
-        kernel = cv2.getStructuringElement(shape.value, (ksize, ksize))
-        return cv2.erode(image, kernel, iterations=iterations)
+    def process(image, ksize, iterations, shape=MorphShape.MORPH_RECT, dst=None):
+        kernel = structuring_element(shape, ksize)
+        return cv2.erode(image, kernel, dst, iterations=iterations)
+
+    @staticmethod
+    def tile_halo(ksize, iterations, **params):
+        return ksize // 2 * iterations
 
     @staticmethod
     def get_params():
@@ -34,10 +61,21 @@ class Erode(CvFunction):
 
 
 class Morphology(CvFunction):
+    supports_dst = True
+    pixel_params = {"ksize": 1}
+
+    @staticmethod
+    def process(
+        image, operation, ksize, shape=MorphShape.MORPH_RECT, iterations=1, dst=None
+    ):
+        kernel = structuring_element(shape, ksize)
+        return cv2.morphologyEx(
+            image, operation.value, kernel, dst, iterations=iterations
+        )
+
     @staticmethod
-    def process(image, operation, ksize, shape=MorphShape.MORPH_RECT, iterations=1):
-        kernel = cv2.getStructuringElement(shape.value, (ksize, ksize))
-        return cv2.morphologyEx(image, operation.value, kernel, iterations=iterations)
+    def tile_halo(operation, ksize, iterations=1, **params):
+        return ksize // 2 * iterations * MORPH_PASSES[operation]
 
     @staticmethod
     def get_params():
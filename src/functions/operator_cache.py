@@ -0,0 +1,114 @@
+import itertools
+import threading
+import weakref
+from collections import OrderedDict
+from enum import Enum
+
+import cv2
+import numpy as np
+
+
+def freeze(value):
+    """Turn parameters into a hashable key, using the values of enums."""
+    if isinstance(value, Enum):
+        return value.value
+    if isinstance(value, dict):
+        return tuple(sorted((key, freeze(item)) for key, item in value.items()))
+    if isinstance(value, (list, tuple)):
+        return tuple(freeze(item) for item in value)
+    return value
+
+
+class OperatorCache:
+    """LRU cache of OpenCV objects keyed on their constructor parameters.
+
+    Detectors, matchers and CLAHE objects keep internal state while they run,
+    so by default each thread gets its own instance and no object is ever
+    used by two threads at once. The instances of a thread that has finished
+    go to the next thread asking for them; Streamlit runs every rerun on a
+    new thread, and would otherwise never get a hit. Immutable values such as structuring
+    elements can be shared between threads with `per_thread=False`; shared
+    arrays are made read-only.
+    """
+
+    def __init__(self, max_entries=64):
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        # Weak references to the threads owning per-thread entries
+        self._owners = {}
+        self._serial = itertools.count()
+        self._lock = threading.Lock()
+
+    def get(self, key, factory, per_thread=True):
+        """Return the cached object for `key`, creating it with `factory()`."""
+        key = freeze(key)
+
+        with self._lock:
+            if per_thread:
+                key = self._owned_key(key)
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._entries[key]
+            self.misses += 1
+
+        # Build outside the lock, construction can be slow
+        value = factory()
+        if not per_thread and isinstance(value, np.ndarray):
+            value.setflags(write=False)
+
+        with self._lock:
+            # Another thread may have built the same shared value meanwhile
+            value = self._entries.setdefault(key, value)
+            self._entries.move_to_end(key)
+            if per_thread:
+                self._owners[key] = weakref.ref(threading.current_thread())
+            while len(self._entries) > self.max_entries:
+                evicted, _ = self._entries.popitem(last=False)
+                self._owners.pop(evicted, None)
+        return value
+
+    def _owned_key(self, key):
+        # The entry of this thread, else one of a finished thread, else a new one
+        current = threading.current_thread()
+        free = None
+        for entry_key, owner in self._owners.items():
+            if entry_key[0] != key:
+                continue
+            thread = owner()
+            if thread is current:
+                return entry_key
+            if free is None and (thread is None or not thread.is_alive()):
+                free = entry_key
+        if free is not None:
+            self._owners[free] = weakref.ref(current)
+            return free
+        return (key, next(self._serial))
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._owners.clear()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+            }
+
+
+operator_cache = OperatorCache()
+
+
+def structuring_element(shape, ksize):
+    """Return a shared, read-only structuring element."""
+    return operator_cache.get(
+        ("structuring_element", shape, ksize),
+        lambda: cv2.getStructuringElement(shape.value, (ksize, ksize)),
+        per_thread=False,
+    )
@@ -1,9 +1,12 @@
 import cv2
 import numpy as np
+from .colorspace import to_gray
 from .function import CvFunction
 
 
 class OpticalFlow(CvFunction):
+    frame_pair = True
+
     @staticmethod
     def process(
         prev_image,
@@ -15,8 +18,8 @@ class OpticalFlow(CvFunction):
         poly_n=5,
         poly_sigma=1.2,
     ):
-        prev_gray = cv2.cvtColor(prev_image, cv2.COLOR_BGR2GRAY)
-        next_gray = cv2.cvtColor(next_image, cv2.COLOR_BGR2GRAY)
+        prev_gray = to_gray(prev_image)
+        next_gray = to_gray(next_image)
         flow = cv2.calcOpticalFlowFarneback(
             prev_gray,
             next_gray,
@@ -30,7 +33,7 @@ class OpticalFlow(CvFunction):
             0,
         )
         mag, ang = cv2.cartToPolar(flow[..., 0], flow[..., 1])
-        hsv = np.zeros_like(prev_image)
+        hsv = np.zeros((*prev_gray.shape, 3), np.uint8)
         hsv[..., 1] = 255
         hsv[..., 0] = ang * 180 / np.pi / 2
         hsv[..., 2] = cv2.normalize(mag, None, 0, 255, cv2.NORM_MINMAX)
@@ -45,4 +48,6 @@ class OpticalFlow(CvFunction):
             "iterations": (1, 10, 3, 1),
             "poly_n": (3, 7, 5, 2),
             "poly_sigma": (0.1, 2.0, 1.2, 0.1),
+            # The second frame, when not processing a video
+            "requires_secondary_image": True,
         }
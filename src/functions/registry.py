@@ -0,0 +1,75 @@
+import importlib
+import logging
+import threading
+from collections.abc import Mapping
+
+logger = logging.getLogger(__name__)
+
+
+class LazyRegistry(Mapping):
+    """Map display names to function classes, importing modules on first use.
+
+    Entries are "module.ClassName" strings relative to the functions
+    package, so listing the names costs nothing and a module whose
+    dependencies are missing only fails when one of its functions is
+    used. Import errors are remembered in `errors` and raised again as
+    ImportError on every later lookup.
+    """
+
+    def __init__(self, entries, package=__package__):
+        self.entries = dict(entries)
+        self.package = package
+        self.errors = {}
+        self._classes = {}
+        self._lock = threading.Lock()
+        self._prewarm_thread = None
+
+    def __getitem__(self, name):
+        function_class = self._classes.get(name)
+        if function_class is not None:
+            return function_class
+        if name not in self.entries:
+            raise KeyError(name)
+        if name in self.errors:
+            raise ImportError(f"{name} is not available: {self.errors[name]}")
+
+        module_name, class_name = self.entries[name].rsplit(".", 1)
+        # Imports are serialized so a module is never imported by two threads
+        with self._lock:
+            try:
+                module = importlib.import_module(f".{module_name}", self.package)
+                function_class = getattr(module, class_name)
+            except Exception as e:
+                self.errors[name] = f"{type(e).__name__}: {e}"
+                raise ImportError(f"{name} is not available: {self.errors[name]}") from e
+            self._classes[name] = function_class
+        return function_class
+
+    def __iter__(self):
+        return iter(self.entries)
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __contains__(self, name):
+        return name in self.entries
+
+    def is_loaded(self, name):
+        return name in self._classes
+
+    def load_all(self):
+        """Import every module, returning the names that failed to load."""
+        for name in self.entries:
+            try:
+                self[name]
+            except ImportError as e:
+                logger.warning(str(e))
+        return sorted(self.errors)
+
+    def prewarm(self):
+        """Import every module on a background thread, once per process."""
+        with self._lock:
+            if self._prewarm_thread is None:
+                self._prewarm_thread = threading.Thread(target=self.load_all, daemon=True)
+                self._prewarm_thread.start()
+        return self._prewarm_thread
@@ -1,12 +1,57 @@
 import cv2
 import numpy as np
+from .colorspace import to_gray
+from .detections import Detections
 from .function import CvFunction
+from .tracing import tracer
+
+
+def is_edge_map(gray):
+    """Return True if an 8-bit image only holds 0 and 255, like the output of Canny."""
+    return gray.dtype == np.uint8 and cv2.countNonZero(cv2.inRange(gray, 1, 254)) == 0
+
+
+def hough_input(image, canny=False, canny_threshold1=100, canny_threshold2=200):
+    """Return the single-channel image a Hough transform runs on.
+
+    With `canny`, edges are detected first, unless the input already is an
+    edge map, such as the output of a previous "Canny Edge Detection" step.
+    """
+    gray = to_gray(image)
+    if canny and not is_edge_map(gray):
+        return cv2.Canny(gray, canny_threshold1, canny_threshold2)
+    return gray
+
+
+def color_canvas(image):
+    """Return a BGR image to draw detections on."""
+    # Not to_bgr(), which may return a shared image
+    if image.ndim == 2:
+        return cv2.cvtColor(image, cv2.COLOR_GRAY2BGR)
+    return image
+
+
+def draw_segments(image, segments, color):
+    """Draw (x1, y1, x2, y2) rows with a single cv2.polylines call."""
+    if len(segments) > 0:
+        cv2.polylines(image, segments.reshape(-1, 2, 2), False, color, 2)
+    return image
 
 
 class HoughCircles(CvFunction):
+    modifies_input = True
+    pixel_params = {"minDist": 1, "minRadius": 1, "maxRadius": 1}
+    returns_detections = True
+
     @staticmethod
-    def process(image, dp, minDist, param1, param2, minRadius, maxRadius):
-        gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+    def process(image, **params):
+        detections = HoughCircles.detect(image, **params)
+        with tracer.span("draw"):
+            return HoughCircles.draw(image, detections)
+
+    @staticmethod
+    def detect(image, dp, minDist, param1, param2, minRadius, maxRadius):
+        gray = hough_input(image)
         circles = cv2.HoughCircles(
             gray,
             cv2.HOUGH_GRADIENT,
@@ -17,13 +62,21 @@ class HoughCircles(CvFunction):
             minRadius=minRadius,
             maxRadius=maxRadius,
         )
-        if circles is not None:
-            circles = np.uint16(np.around(circles))
-            for i in circles[0, :]:
-                # Draw the outer circle
-                cv2.circle(image, (i[0], i[1]), i[2], (0, 255, 0), 2)
-                # Draw the center of the circle
-                cv2.circle(image, (i[0], i[1]), 2, (0, 0, 255), 3)
+        if circles is None:
+            circles = np.empty((0, 3), np.float32)
+        # Rows of (x, y, radius)
+        return Detections("circles", circles=circles.reshape(-1, 3))
+
+    @staticmethod
+    def draw(image, detections):
+        image = color_canvas(image)
+        # OpenCV has no batched circle drawing, but plain ints are much
+        # faster to pass than NumPy scalars
+        for x, y, radius in np.uint16(np.around(detections["circles"])).tolist():
+            # Draw the outer circle
+            cv2.circle(image, (x, y), radius, (0, 255, 0), 2)
+            # Draw the center of the circle
+            cv2.circle(image, (x, y), 2, (0, 0, 255), 3)
         return image
 
     @staticmethod
@@ -39,41 +92,133 @@ class HoughCircles(CvFunction):
 
 
 class HoughLines(CvFunction):
+    modifies_input = True
+    returns_detections = True
+
     @staticmethod
-    def process(image, rho, theta, threshold):
-        gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
-        lines = cv2.HoughLines(gray, rho, theta, threshold)
-        if lines is not None:
-            for line in lines:
-                rho, theta = line[0]
-                a = np.cos(theta)
-                b = np.sin(theta)
-                x0 = a * rho
-                y0 = b * rho
-                x1 = int(x0 + 1000 * (-b))
-                y1 = int(y0 + 1000 * (a))
-                x2 = int(x0 - 1000 * (-b))
-                y2 = int(y0 - 1000 * (a))
-                cv2.line(image, (x1, y1), (x2, y2), (0, 0, 255), 2)
-        return image
+    def process(image, **params):
+        detections = HoughLines.detect(image, **params)
+        with tracer.span("draw"):
+            return HoughLines.draw(image, detections)
+
+    @staticmethod
+    def detect(
+        image, rho, theta, threshold, canny=False, canny_threshold1=100, canny_threshold2=200
+    ):
+        edges = hough_input(image, canny, canny_threshold1, canny_threshold2)
+        lines = cv2.HoughLines(edges, rho, theta, threshold)
+        if lines is None:
+            lines = np.empty((0, 2), np.float32)
+        # Rows of (rho, theta)
+        return Detections("lines", lines=lines.reshape(-1, 2))
+
+    @staticmethod
+    def draw(image, detections):
+        rho, theta = detections["lines"].T
+        a = np.cos(theta)
+        b = np.sin(theta)
+        x0 = a * rho
+        y0 = b * rho
+        # Segments 2000 pixels long through the closest point to the origin,
+        # truncated to integers like int() does
+        segments = np.stack(
+            [x0 - 1000 * b, y0 + 1000 * a, x0 + 1000 * b, y0 - 1000 * a], axis=1
+        ).astype(np.int32)
+        return draw_segments(color_canvas(image), segments, (0, 0, 255))
 
     @staticmethod
     def get_params():
         return {
             "rho": (1, 10, 1, 1),
-            "theta": (0.01, 1, 0.01, 0.01),
+            "theta": (0.01, 1.0, 0.01, 0.01),
             "threshold": (1, 100, 50, 1),
+            "canny": False,
+            "canny_threshold1": (0, 1000, 100, 1),
+            "canny_threshold2": (0, 1000, 200, 1),
+        }
+
+
+class HoughLinesP(CvFunction):
+    modifies_input = True
+    returns_detections = True
+    pixel_params = {"minLineLength": 1, "maxLineGap": 1}
+
+    @staticmethod
+    def process(image, **params):
+        detections = HoughLinesP.detect(image, **params)
+        with tracer.span("draw"):
+            return HoughLinesP.draw(image, detections)
+
+    @staticmethod
+    def detect(
+        image,
+        rho,
+        theta,
+        threshold,
+        minLineLength,
+        maxLineGap,
+        canny=True,
+        canny_threshold1=100,
+        canny_threshold2=200,
+    ):
+        edges = hough_input(image, canny, canny_threshold1, canny_threshold2)
+        segments = cv2.HoughLinesP(
+            edges, rho, theta, threshold, minLineLength=minLineLength, maxLineGap=maxLineGap
+        )
+        if segments is None:
+            segments = np.empty((0, 4), np.int32)
+        # Rows of (x1, y1, x2, y2)
+        return Detections("segments", segments=segments.reshape(-1, 4))
+
+    @staticmethod
+    def draw(image, detections):
+        return draw_segments(color_canvas(image), detections["segments"], (0, 0, 255))
+
+    @staticmethod
+    def get_params():
+        return {
+            "rho": (1, 10, 1, 1),
+            "theta": (0.01, 1.0, 0.01, 0.01),
+            "threshold": (1, 500, 50, 1),
+            "minLineLength": (0, 1000, 30, 1),
+            "maxLineGap": (0, 100, 10, 1),
+            "canny": True,
+            "canny_threshold1": (0, 1000, 100, 1),
+            "canny_threshold2": (0, 1000, 200, 1),
         }
 
 
 class ContourDetection(CvFunction):
+    modifies_input = True
+    returns_detections = True
+
     @staticmethod
     def process(image, retrieval_mode, approximation_method):
-        gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
-        _, thresh = cv2.threshold(gray, 127, 255, cv2.THRESH_BINARY)
+        detections = ContourDetection.detect(image, retrieval_mode, approximation_method)
+        with tracer.span("draw"):
+            return ContourDetection.draw(image, detections)
+
+    @staticmethod
+    def detect(image, retrieval_mode, approximation_method):
+        _, thresh = cv2.threshold(to_gray(image), 127, 255, cv2.THRESH_BINARY)
         contours, _ = cv2.findContours(
             thresh, retrieval_mode.value, approximation_method.value
         )
+        # The points of all contours concatenated, split by their lengths
+        return Detections(
+            "contours",
+            lengths=np.array([len(c) for c in contours], np.int32),
+            points=np.concatenate(
+                [c.reshape(-1, 2) for c in contours] or [np.empty((0, 2), np.int32)]
+            ),
+        )
+
+    @staticmethod
+    def draw(image, detections):
+        contours = []
+        if len(detections) > 0:
+            offsets = np.cumsum(detections["lengths"])[:-1]
+            contours = [c.reshape(-1, 1, 2) for c in np.split(detections["points"], offsets)]
         return cv2.drawContours(image, contours, -1, (0, 255, 0), 3)
 
     @staticmethod
@@ -1,80 +1,204 @@
 import cv2
 import numpy as np
-import streamlit as st
+from .colorspace import to_gray
+from .detections import Detections
 from .enums import *
 from .function import CvFunction
-from csem_template_matcher.MatcherApi.Matcher import Matcher, MatcherSettings
+from .tracing import tracer
 
+# Templates are not matched on pyramid levels where they get smaller than this
+MIN_PYRAMID_TEMPLATE_SIZE = 8
+SQDIFF_METHODS = (cv2.TM_SQDIFF, cv2.TM_SQDIFF_NORMED)
+NORMED_METHODS = (cv2.TM_SQDIFF_NORMED, cv2.TM_CCORR_NORMED, cv2.TM_CCOEFF_NORMED)
 
-class TemplateMatching(CvFunction):
-    @staticmethod
-    def process(image, template, method=TemplateMatchingMethod.CCOEFF_NORMED):
-        gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
-        template_gray = cv2.cvtColor(template, cv2.COLOR_BGR2GRAY)
-        result = cv2.matchTemplate(gray, template_gray, method.value)
+
+def similarity(scores, method):
+    """Turn match scores into "higher is better" values.
+
+    Normalized methods end up in the range -1 to 1, so a single min_score
+    works for all of them.
+    """
+    if method == cv2.TM_SQDIFF_NORMED:
+        return 1 - scores
+    if method == cv2.TM_SQDIFF:
+        return -scores
+    return scores
+
+
+def find_peaks(result, count, radius_x, radius_y, method):
+    """Return up to `count` (x, y, score) peaks of a matchTemplate result.
+
+    Each peak suppresses the area of one template around it, so the peaks
+    belong to different instances. The result is overwritten.
+    """
+    peaks = []
+    worst = np.inf if method in SQDIFF_METHODS else -np.inf
+    for _ in range(count):
         min_val, max_val, min_loc, max_loc = cv2.minMaxLoc(result)
-        if method.value in [cv2.TM_SQDIFF, cv2.TM_SQDIFF_NORMED]:
-            top_left = min_loc
-        else:
-            top_left = max_loc
-        bottom_right = (
-            top_left[0] + template.shape[1],
-            top_left[1] + template.shape[0],
+        score, (x, y) = (min_val, min_loc) if method in SQDIFF_METHODS else (max_val, max_loc)
+        if not np.isfinite(score):
+            break
+        peaks.append((x, y, score))
+        result[
+            max(0, y - radius_y) : y + radius_y + 1, max(0, x - radius_x) : x + radius_x + 1
+        ] = worst
+    return peaks
+
+
+def match_scale(gray, template, method, levels, count):
+    """Match one template size coarse to fine, returning (x, y, score) candidates.
+
+    The image and template are matched on a pyramid level reduced `levels`
+    times, and only windows around the coarse peaks are matched again at
+    full resolution.
+    """
+    height, width = template.shape[:2]
+    levels = min(levels, int(np.log2(min(height, width) / MIN_PYRAMID_TEMPLATE_SIZE)))
+    if levels <= 0:
+        result = cv2.matchTemplate(gray, template, method)
+        return find_peaks(result, count, width // 2, height // 2, method)
+
+    small_gray, small_template = gray, template
+    for _ in range(levels):
+        small_gray = cv2.pyrDown(small_gray)
+        small_template = cv2.pyrDown(small_template)
+    factor = 2**levels
+
+    with tracer.span("match_coarse"):
+        result = cv2.matchTemplate(small_gray, small_template, method)
+        coarse = find_peaks(
+            result,
+            count,
+            small_template.shape[1] // 2,
+            small_template.shape[0] // 2,
+            method,
         )
-        cv2.rectangle(image, top_left, bottom_right, 255, 2)
-        return image
 
-    @staticmethod
-    def get_params():
-        return {
-            "method": list(TemplateMatchingMethod),
-            "requires_secondary_image": True,
-        }
+    candidates = []
+    with tracer.span("match_refine"):
+        # The peak at full resolution is within about one coarse pixel
+        margin = 2 * factor
+        for x, y, _ in coarse:
+            x0 = max(0, x * factor - margin)
+            y0 = max(0, y * factor - margin)
+            x1 = min(gray.shape[1], x * factor + margin + width)
+            y1 = min(gray.shape[0], y * factor + margin + height)
+            result = cv2.matchTemplate(gray[y0:y1, x0:x1], template, method)
+            (x, y, score), = find_peaks(result, 1, 0, 0, method)
+            candidates.append((x0 + x, y0 + y, score))
+    return candidates
 
 
-class FastMatcher(CvFunction):
-    @staticmethod
-    def process(image, template, **params):
+def non_max_suppression(boxes, order, max_overlap):
+    """Return indices of boxes in `order`, dropping boxes that overlap a kept box.
+
+    The overlap is the intersection over union of two (x, y, w, h) boxes.
+    """
+    keep = []
+    for i in order:
+        x, y, w, h = boxes[i]
+        suppressed = False
+        for j in keep:
+            kx, ky, kw, kh = boxes[j]
+            inter_w = min(x + w, kx + kw) - max(x, kx)
+            inter_h = min(y + h, ky + kh) - max(y, ky)
+            if inter_w > 0 and inter_h > 0:
+                intersection = inter_w * inter_h
+                if intersection / (w * h + kw * kh - intersection) > max_overlap:
+                    suppressed = True
+                    break
+        if not suppressed:
+            keep.append(i)
+    return keep
 
-        settings = MatcherSettings()
-        for key, value in params.items():
-            setattr(settings, key, value)
 
-        if len(template.shape) == 3:
-            template = cv2.cvtColor(template, cv2.COLOR_BGR2GRAY).astype(np.uint8)
+class TemplateMatching(CvFunction):
+    modifies_input = True
+    returns_detections = True
+
+    @staticmethod
+    def process(image, template, **params):
+        detections = TemplateMatching.detect(image, template, **params)
+        with tracer.span("draw"):
+            return TemplateMatching.draw(image, detections)
 
-        if len(image.shape) == 3:
-            image = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY).astype(np.uint8)
+    @staticmethod
+    def detect(
+        image,
+        template,
+        method=TemplateMatchingMethod.CCOEFF_NORMED,
+        pyramid_levels=0,
+        min_scale=1.0,
+        max_scale=1.0,
+        scale_steps=1,
+        max_matches=1,
+        max_overlap=0.3,
+        min_score=-1.0,
+    ):
+        """Find up to `max_matches` instances of `template` in `image`.
 
-        matcher = Matcher(template)
-        matcher.set_settings(settings)
+        With `pyramid_levels`, matching starts on an image reduced that many
+        times and is refined around the candidates at full resolution. The
+        template is tried at `scale_steps` sizes from `min_scale` to
+        `max_scale`. Matches overlapping a better one by more than
+        `max_overlap` are dropped, as are matches below `min_score` for the
+        normalized methods (1 - score for SQDIFF_NORMED).
+        """
+        gray = to_gray(image)
+        template_gray = to_gray(template)
+        method = method.value
 
-        matcher.match(image)
-        res = matcher.get_result()
+        boxes, scores, scales = [], [], []
+        for scale in np.linspace(min_scale, max_scale, max(1, scale_steps)):
+            scaled = template_gray
+            if scale != 1.0:
+                interpolation = cv2.INTER_AREA if scale < 1 else cv2.INTER_LINEAR
+                scaled = cv2.resize(
+                    template_gray, None, fx=scale, fy=scale, interpolation=interpolation
+                )
+            height, width = scaled.shape
+            if height > gray.shape[0] or width > gray.shape[1] or min(height, width) < 1:
+                continue
+            # A few extra candidates per scale, as some are lost to NMS
+            for x, y, score in match_scale(
+                gray, scaled, method, pyramid_levels, 2 * max_matches + 2
+            ):
+                boxes.append((x, y, width, height))
+                scores.append(score)
+                scales.append(scale)
+        if not boxes:
+            raise ValueError("The template is larger than the image at every scale")
 
-        output = Matcher.draw_matches(cv2.cvtColor(image, cv2.COLOR_GRAY2BGR), res)
+        scores = np.array(scores, np.float32)
+        order = np.argsort(-similarity(scores, method), kind="stable")
+        if method in NORMED_METHODS:
+            order = [i for i in order if similarity(scores[i], method) >= min_score]
+        keep = non_max_suppression(boxes, order, max_overlap)[:max_matches]
 
-        st.write(f"Found {len(res)} matches")
+        # The matches as (x, y, width, height), best first
+        return Detections(
+            "matches",
+            boxes=np.array([boxes[i] for i in keep], np.int32).reshape(-1, 4),
+            scores=scores[keep],
+            scales=np.array([scales[i] for i in keep], np.float32),
+        )
 
-        return output
+    @staticmethod
+    def draw(image, detections):
+        for x, y, width, height in detections["boxes"].tolist():
+            cv2.rectangle(image, (x, y), (x + width, y + height), 255, 2)
+        return image
 
     @staticmethod
     def get_params():
-
         return {
-            "template": None,
-            "m_ckSIMD": True,
-            "m_iMaxPos": (1, 100, 50, 1),
-            "m_dMaxOverlap": (0.0, 1.0, 0.0, 0.1),
-            "m_dScore": (0.0, 1.0, 0.5, 0.01),
-            "m_dToleranceAngle": (0, 360, 180, 1),
-            "m_iMinReduceArea": (1, 1024, 256, 1),
-            "m_bToleranceRange": False,
-            "m_dTolerance1": (0, 360, 1, 1),
-            "m_dTolerance2": (0, 360, 1, 1),
-            "m_dTolerance3": (0, 360, 1, 1),
-            "m_dTolerance4": (0, 360, 1, 1),
-            "m_useSubPixel": False,
-            "m_bStopLayer": True,
+            "method": list(TemplateMatchingMethod),
+            "pyramid_levels": (0, 4, 0, 1),
+            "min_scale": (0.25, 1.0, 1.0, 0.05),
+            "max_scale": (1.0, 4.0, 1.0, 0.05),
+            "scale_steps": (1, 15, 1, 1),
+            "max_matches": (1, 50, 1, 1),
+            "max_overlap": (0.0, 1.0, 0.3, 0.05),
+            "min_score": (-1.0, 1.0, -1.0, 0.05),
             "requires_secondary_image": True,
         }
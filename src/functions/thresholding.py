@@ -1,15 +1,52 @@
+import time
 import cv2
+import numpy as np
+from .colorspace import to_bgr, to_gray
 from .enums import ThresholdType
 from .function import CvFunction
 
 
 class Threshold(CvFunction):
+    supports_dst = True
+
+    @staticmethod
+    def process(image, thresh, maxval, thresh_type, dst=None):
+        # The gray image may be shared with other steps, so do not write to it
+        _, result = cv2.threshold(to_gray(image), thresh, maxval, thresh_type.value)
+        return to_bgr(result, dst)
+
     @staticmethod
-    def process(image, thresh, maxval, thresh_type):
-        _, processed = cv2.threshold(
-            cv2.cvtColor(image, cv2.COLOR_BGR2GRAY), thresh, maxval, thresh_type.value
-        )
-        return cv2.cvtColor(processed, cv2.COLOR_GRAY2BGR)
+    def process_many(image, params_list, max_width=None):
+        """Threshold one image at many settings, returning (result, seconds) pairs.
+
+        The gray conversion is shared by all settings instead of being
+        repeated for each one. With `max_width`, each result is downscaled
+        while still single-channel, before the conversion back to BGR.
+        """
+        gray = to_gray(image)
+        scratch = np.empty_like(gray)
+        size = None
+        if max_width is not None and gray.shape[1] > max_width:
+            size = (max_width, max(1, round(gray.shape[0] * max_width / gray.shape[1])))
+
+        results = []
+        for params in params_list:
+            start = time.perf_counter()
+            try:
+                result = cv2.threshold(
+                    gray,
+                    params["thresh"],
+                    params["maxval"],
+                    params["thresh_type"].value,
+                    scratch,
+                )[1]
+                if size is not None:
+                    result = cv2.resize(result, size, interpolation=cv2.INTER_AREA)
+                result = cv2.cvtColor(result, cv2.COLOR_GRAY2BGR)
+            except Exception as e:
+                result = e
+            results.append((result, time.perf_counter() - start))
+        return results
 
     @staticmethod
     def get_params():
@@ -0,0 +1,235 @@
+import json
+import sys
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+try:
+    import resource
+except ImportError:  # Not available on Windows
+    resource = None
+
+# Upper bounds of the latency histogram buckets in seconds
+LATENCY_BUCKETS = (
+    0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0
+)
+
+
+class Histogram:
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def add(self, value):
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                break
+        else:
+            i = len(self.buckets)
+        self.counts[i] += 1
+        self.count += 1
+        self.sum += value
+        self.max = max(self.max, value)
+
+    def quantile(self, q):
+        """Estimate a quantile as the upper bound of the bucket it falls in."""
+        target = q * self.count
+        total = 0
+        for bound, count in zip(self.buckets, self.counts):
+            total += count
+            if total >= target:
+                return min(bound, self.max)
+        return self.max
+
+
+class Tracer:
+    """Collect timings of pipeline stages such as decode, process and display.
+
+    Spans are recorded per (stage, function) into latency histograms, and
+    passed to any listeners added with add_listener(). A span without a
+    function inherits the one of the span around it, so e.g. a "draw" span
+    inside a function's process() is attributed to that function. With
+    `trace_memory`, the peak Python and NumPy allocation of outermost spans
+    is recorded as well, at a noticeable cost in speed.
+    """
+
+    def __init__(self, trace_memory=False):
+        self.enabled = True
+        self.trace_memory = trace_memory
+        self.histograms = {}
+        self.peak_bytes = {}
+        self.listeners = []
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    @contextmanager
+    def span(self, stage, function=None):
+        if not self.enabled:
+            yield
+            return
+
+        stack = self._stack()
+        if function is None:
+            function = stack[-1] if stack else ""
+        measure_memory = self.trace_memory and not stack
+        if measure_memory:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+            tracemalloc.reset_peak()
+            baseline = tracemalloc.get_traced_memory()[0]
+
+        stack.append(function)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            seconds = time.perf_counter() - start
+            stack.pop()
+            peak = None
+            if measure_memory:
+                peak = tracemalloc.get_traced_memory()[1] - baseline
+            self.record(stage, function, seconds, peak)
+
+    def record(self, stage, function, seconds, peak_bytes=None):
+        key = (stage, function)
+        with self._lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = Histogram()
+            histogram.add(seconds)
+            if peak_bytes is not None:
+                self.peak_bytes[key] = max(self.peak_bytes.get(key, 0), peak_bytes)
+            # Other threads add and remove listeners while this one calls them
+            listeners = list(self.listeners)
+        for listener in listeners:
+            listener(stage, function, seconds, peak_bytes)
+
+    def add_listener(self, listener):
+        """Call `listener(stage, function, seconds, peak_bytes)` for every span."""
+        with self._lock:
+            self.listeners.append(listener)
+
+    def remove_listener(self, listener):
+        with self._lock:
+            self.listeners.remove(listener)
+
+    @contextmanager
+    def collect(self):
+        """Yield a list that receives (stage, function, seconds) for spans in this thread."""
+        spans = []
+        thread = threading.get_ident()
+
+        def listener(stage, function, seconds, peak_bytes):
+            if threading.get_ident() == thread:
+                spans.append((stage, function, seconds))
+
+        self.add_listener(listener)
+        try:
+            yield spans
+        finally:
+            self.remove_listener(listener)
+
+    def reset(self):
+        with self._lock:
+            self.histograms.clear()
+            self.peak_bytes.clear()
+
+    def _stack(self):
+        stack = getattr(self._local, "stack", None)
+        if stack is None:
+            stack = self._local.stack = []
+        return stack
+
+    def to_dict(self):
+        with self._lock:
+            items = sorted(self.histograms.items())
+            peak_bytes = dict(self.peak_bytes)
+        stages = []
+        for (stage, function), histogram in items:
+            entry = {
+                "stage": stage,
+                "function": function,
+                "count": histogram.count,
+                "sum_seconds": round(histogram.sum, 6),
+                "mean_seconds": round(histogram.sum / histogram.count, 6),
+                "p95_seconds": round(histogram.quantile(0.95), 6),
+                "max_seconds": round(histogram.max, 6),
+                "buckets": {
+                    str(bound): count for bound, count in zip(histogram.buckets, histogram.counts)
+                },
+            }
+            entry["buckets"]["+Inf"] = histogram.counts[-1]
+            if (stage, function) in peak_bytes:
+                entry["peak_bytes"] = peak_bytes[(stage, function)]
+            stages.append(entry)
+        return {"stages": stages, "peak_rss_bytes": peak_rss_bytes()}
+
+    def to_json(self):
+        return json.dumps(self.to_dict(), indent=2)
+
+    def to_prometheus(self, prefix="opencv_tester"):
+        """Return the metrics in the Prometheus text exposition format."""
+        with self._lock:
+            items = sorted(self.histograms.items())
+            peak_bytes = sorted(self.peak_bytes.items())
+        lines = [
+            f"# HELP {prefix}_stage_seconds Time spent per stage and function.",
+            f"# TYPE {prefix}_stage_seconds histogram",
+        ]
+        for (stage, function), histogram in items:
+            labels = f'stage="{_escape(stage)}",function="{_escape(function)}"'
+            total = 0
+            for bound, count in zip(histogram.buckets, histogram.counts):
+                total += count
+                lines.append(f'{prefix}_stage_seconds_bucket{{{labels},le="{bound}"}} {total}')
+            lines.append(f'{prefix}_stage_seconds_bucket{{{labels},le="+Inf"}} {histogram.count}')
+            lines.append(f"{prefix}_stage_seconds_sum{{{labels}}} {histogram.sum:.6f}")
+            lines.append(f"{prefix}_stage_seconds_count{{{labels}}} {histogram.count}")
+
+        if peak_bytes:
+            lines.append(f"# HELP {prefix}_stage_peak_bytes Peak memory allocated in a stage.")
+            lines.append(f"# TYPE {prefix}_stage_peak_bytes gauge")
+            for (stage, function), value in peak_bytes:
+                labels = f'stage="{_escape(stage)}",function="{_escape(function)}"'
+                lines.append(f"{prefix}_stage_peak_bytes{{{labels}}} {value}")
+
+        rss = peak_rss_bytes()
+        if rss is not None:
+            lines.append(f"# HELP {prefix}_peak_rss_bytes Peak resident memory of the process.")
+            lines.append(f"# TYPE {prefix}_peak_rss_bytes gauge")
+            lines.append(f"{prefix}_peak_rss_bytes {rss}")
+        return "\n".join(lines) + "\n"
+
+    def write(self, path):
+        """Write the metrics to `path`, as Prometheus text for .prom/.txt files, else JSON."""
+        text = self.to_prometheus() if path.endswith((".prom", ".txt")) else self.to_json()
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(text)
+
+
+def stage_totals(spans):
+    """Sum the seconds per stage of (stage, function, seconds) spans."""
+    totals = {}
+    for stage, _, seconds in spans:
+        totals[stage] = round(totals.get(stage, 0.0) + seconds, 6)
+    return totals
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def peak_rss_bytes():
+    """Return the peak resident memory of this process, if it can be measured."""
+    if resource is None:
+        return None
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and in kilobytes elsewhere
+    return maxrss if sys.platform == "darwin" else maxrss * 1024
+
+
+tracer = Tracer()
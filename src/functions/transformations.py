@@ -4,9 +4,13 @@ from .function import CvFunction
 
 
 class Resize(CvFunction):
+    supports_dst = True
+
     @staticmethod
-    def process(image, fx, fy, interpolation=Interpolation.INTER_LINEAR):
-        return cv2.resize(image, None, fx=fx, fy=fy, interpolation=interpolation.value)
+    def process(image, fx, fy, interpolation=Interpolation.INTER_LINEAR, dst=None):
+        return cv2.resize(
+            image, None, dst, fx=fx, fy=fy, interpolation=interpolation.value
+        )
 
     @staticmethod
     def get_params():
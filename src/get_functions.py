@@ -1,46 +1,69 @@
+import ast
 import os
-import inspect
-import importlib
-from enum import Enum
-from pathlib import Path
 
 
-def is_enum(cls):
-    return issubclass(cls, Enum)
+def get_params_keys(class_node):
+    """Return the parameter names of a literal dict returned by get_params()."""
+    for node in class_node.body:
+        if isinstance(node, ast.FunctionDef) and node.name == "get_params":
+            for statement in ast.walk(node):
+                if isinstance(statement, ast.Return) and isinstance(statement.value, ast.Dict):
+                    return [
+                        key.value
+                        for key in statement.value.keys
+                        if isinstance(key, ast.Constant) and key.value != "requires_secondary_image"
+                    ]
+    return []
 
 
-def get_classes_from_module(module):
+def get_classes_from_source(path):
+    """Return the CvFunction subclasses defined in a file, without importing it."""
+    with open(path, "r", encoding="utf-8") as f:
+        tree = ast.parse(f.read(), filename=path)
+
     classes = []
-    for name, obj in inspect.getmembers(module, inspect.isclass):
-        # if not is_enum(obj) and obj.__module__ == module.__name__:
-        classes.append(name)
+    for node in tree.body:
+        if not isinstance(node, ast.ClassDef):
+            continue
+        bases = [base.id for base in node.bases if isinstance(base, ast.Name)]
+        if "CvFunction" in bases:
+            classes.append({"class": node.name, "params": get_params_keys(node)})
     return classes
 
 
 def crawl_functions_folder(functions_folder):
+    """Return {"module.ClassName": [param names]} for every function class.
+
+    Modules are parsed rather than imported, so this works even when the
+    optional dependencies of some modules are not installed.
+    """
+    found = {}
     for root, _, files in os.walk(functions_folder):
-        for file in files:
+        for file in sorted(files):
             if file.endswith(".py") and file != "__init__.py":
                 module_name = os.path.splitext(file)[0]
                 module_path = os.path.relpath(root, start=functions_folder).replace(
                     os.sep, "."
                 )
                 full_module_name = (
-                    f"{module_path}.{module_name}" if module_path else module_name
+                    f"{module_path}.{module_name}" if module_path != "." else module_name
                 )
-                try:
-                    module = importlib.import_module(
-                        f"{functions_folder}.{full_module_name}"
-                    )
-                    classes = get_classes_from_module(module)
-                    if classes:
-                        print(f"Module: {full_module_name}")
-                        for cls in classes:
-                            print(f"  - Class: {cls}")
-                except ImportError as e:
-                    print(f"Could not import module {full_module_name}: {e}")
+                for cls in get_classes_from_source(os.path.join(root, file)):
+                    found[f"{full_module_name}.{cls['class']}"] = cls["params"]
+    return found
 
 
 if __name__ == "__main__":
-    functions_folder = "functions"
-    crawl_functions_folder(functions_folder)
+    from functions import opencv_functions
+
+    functions_folder = os.path.join(os.path.dirname(os.path.abspath(__file__)), "functions")
+    registered = {entry: name for name, entry in opencv_functions.entries.items()}
+    found = crawl_functions_folder(functions_folder)
+    for entry, params in found.items():
+        name = registered.get(entry, "not registered")
+        print(f"{entry} ({name})")
+        for param in params:
+            print(f"  - {param}")
+    for entry, name in registered.items():
+        if entry not in found:
+            print(f"Registered but not found: {name} -> {entry}")
@@ -0,0 +1,269 @@
+import os
+import uuid
+import zlib
+
+import numpy as np
+
+from cache import image_hash
+from functions.colorspace import image_nbytes
+from store import image_store
+
+DEFAULT_MAX_BYTES = 1024 * 1024 * 1024
+
+
+def save_npy(directory, image):
+    """Write `image` to a file in `directory` named after its content, and return its path.
+
+    Equal states of all sessions share one file, and so the pages the OS
+    caches for it when they map it.
+    """
+    path = os.path.join(directory, f"{image_hash(image)}.npy")
+    if os.path.exists(path):
+        # A recent modification time keeps the file from collect_images()
+        os.utime(path)
+        return path
+    # Other sessions may map the file, so it must appear fully written
+    temporary = f"{path}.{uuid.uuid4().hex}.tmp"
+    with open(temporary, "wb") as f:
+        np.save(f, np.asarray(image))
+    os.replace(temporary, path)
+    return path
+
+
+class HistoryEntry:
+    """One image state and the step (function name, params) that produced it."""
+
+    def __init__(self, image, step=None):
+        self.image = image
+        self.compressed = None
+        self.shape = image.shape
+        self.dtype = image.dtype
+        # Array subclasses such as Spectrum must survive compression
+        self.array_type = type(image)
+        # Underscored attributes, such as the versions a ColorImage keeps,
+        # are caches and are not kept
+        self.attributes = {
+            name: value
+            for name, value in getattr(image, "__dict__", {}).items()
+            if not name.startswith("_")
+        }
+        self.step = step
+        # The .npy file the image was saved to, see ImageHistory.save()
+        self.path = None
+
+    @classmethod
+    def saved(cls, path, step=None, array_type=np.ndarray, attributes=None):
+        """Return an entry for an image saved to `path`, without reading it."""
+        entry = cls.__new__(cls)
+        entry.image = None
+        entry.compressed = None
+        entry.shape = None
+        entry.dtype = None
+        entry.array_type = array_type
+        entry.attributes = attributes or {}
+        entry.step = step
+        entry.path = path
+        return entry
+
+    @property
+    def state(self):
+        if self.image is not None:
+            return "resident"
+        if self.path is not None:
+            return "mapped"
+        if self.compressed is not None:
+            return "compressed"
+        return "evicted"
+
+    @property
+    def nbytes(self):
+        if self.image is not None:
+            return image_nbytes(self.image)
+        if self.path is None and self.compressed is not None:
+            return len(self.compressed)
+        # Mapped files are in the page cache, which the OS frees as needed
+        return 0
+
+    def load(self):
+        """Return the image if it is resident, mapped or compressed, else None.
+
+        A mapped state whose file is gone, e.g. deleted by hand, is forgotten
+        and returns None, so the history replays it.
+        """
+        if self.image is not None:
+            return self.image
+        if self.path is not None:
+            try:
+                # Only the pages that are read are loaded
+                image = np.asarray(np.load(self.path, mmap_mode="r"))
+            except FileNotFoundError:
+                self.path = None
+                return self.load()
+        elif self.compressed is not None:
+            image = np.frombuffer(zlib.decompress(self.compressed), self.dtype).reshape(
+                self.shape
+            )
+        else:
+            return None
+        if self.array_type is not np.ndarray:
+            image = image.view(self.array_type)
+            image.__dict__.update(self.attributes)
+        return image
+
+
+class ImageHistory:
+    """Image states of a session, kept within a memory budget.
+
+    When the budget is exceeded, or the images of all sessions exceed the
+    cap of the image store, states that are not checkpoints are dropped,
+    starting with the ones furthest from the current position, and checkpoints
+    are compressed. A dropped state is rebuilt on access by replaying the
+    steps after the nearest earlier state still in memory. States saved to
+    disk with save() are mapped from their file instead.
+
+    `replay(step, image)` must return the result of applying `step` to `image`.
+    """
+
+    def __init__(
+        self, replay, max_bytes=DEFAULT_MAX_BYTES, checkpoint_interval=5, compress=True
+    ):
+        self.replay = replay
+        self.max_bytes = max_bytes
+        self.checkpoint_interval = checkpoint_interval
+        self.compress = compress
+        self._entries = []
+
+    def __len__(self):
+        return len(self._entries)
+
+    def copy(self):
+        """Return a history sharing this one's entries, e.g. for rollback."""
+        history = ImageHistory(
+            self.replay, self.max_bytes, self.checkpoint_interval, self.compress
+        )
+        history._entries = list(self._entries)
+        return history
+
+    @property
+    def nbytes(self):
+        return sum(entry.nbytes for entry in self._entries)
+
+    def is_checkpoint(self, index):
+        return (
+            index == 0
+            or self._entries[index].step is None
+            or index % self.checkpoint_interval == 0
+        )
+
+    def truncate(self, length):
+        del self._entries[length:]
+
+    def append(self, image, step=None):
+        """Add a state; `step` is None for states that cannot be replayed.
+
+        Returns the image as stored, shared with equal images of other
+        sessions through the image store.
+        """
+        image = image_store.intern(image)
+        self._entries.append(HistoryEntry(image, step))
+        self._enforce_budget(len(self._entries) - 1)
+        return image
+
+    def step(self, index):
+        """Return the step that produced the state at `index`, None if it cannot be replayed."""
+        return self._entries[index].step
+
+    def get(self, index):
+        """Return the image at `index`, rebuilding it if it was dropped."""
+        entry = self._entries[index]
+        image = entry.load()
+        if image is not None:
+            return image
+
+        start = index
+        image = None
+        while image is None:
+            start -= 1
+            if start < 0 or self._entries[start + 1].step is None:
+                raise LookupError(f"State {index} is lost and cannot be replayed")
+            image = self._entries[start].load()
+        for entry in self._entries[start + 1 : index + 1]:
+            image = self.replay(entry.step, image)
+
+        entry.image = image
+        self._enforce_budget(index)
+        return image
+
+    def save(self, directory):
+        """Write the states that are not on disk yet to .npy files in `directory`.
+
+        States on disk are dropped from memory and mapped from their file
+        on access. Returns the entries, with the `path` of their file, which
+        is None for states dropped before they were written. Those are
+        replayed instead.
+        """
+        for entry in self._entries:
+            if entry.path is None:
+                image = entry.load()
+                if image is not None:
+                    entry.path = save_npy(directory, image)
+            if entry.path is not None:
+                entry.image = None
+                entry.compressed = None
+        return list(self._entries)
+
+    @classmethod
+    def from_entries(cls, replay, entries, **kwargs):
+        """Return a history of HistoryEntry objects, e.g. from HistoryEntry.saved()."""
+        history = cls(replay, **kwargs)
+        history._entries = list(entries)
+        return history
+
+    def memory_usage(self):
+        """Return the state and size of every step."""
+        return [
+            {
+                "step": index,
+                "state": entry.state,
+                "checkpoint": self.is_checkpoint(index),
+                "MB": round(entry.nbytes / 1e6, 2),
+            }
+            for index, entry in enumerate(self._entries)
+        ]
+
+    def _enforce_budget(self, current):
+        # The images of all sessions are over the cap of the store, too
+        over = max(self.nbytes - self.max_bytes, image_store.excess_bytes())
+        if over <= 0:
+            return
+
+        candidates = sorted(
+            (i for i in range(len(self._entries)) if i != current),
+            key=lambda i: abs(i - current),
+            reverse=True,
+        )
+        for index in candidates:
+            entry = self._entries[index]
+            # States on disk can always be mapped again
+            if entry.image is not None and (
+                entry.path is not None or not self.is_checkpoint(index)
+            ):
+                over -= entry.nbytes
+                entry.image = None
+                if over <= 0:
+                    return
+
+        if not self.compress:
+            return
+        for index in candidates:
+            entry = self._entries[index]
+            if entry.image is None:
+                continue
+            compressed = zlib.compress(np.ascontiguousarray(entry.image).data, 1)
+            if len(compressed) < entry.image.nbytes:
+                # The versions the image keeps are dropped with it
+                over -= entry.nbytes - len(compressed)
+                entry.compressed = compressed
+                entry.image = None
+                if over <= 0:
+                    return
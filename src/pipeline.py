@@ -0,0 +1,252 @@
+import json
+import numpy as np
+from functions.enums import (
+    ColorSpaceConversionType, ThresholdType, MorphShape, MorphOperation,
+    Interpolation, BorderType, CornerRefineMethod, DictType,
+    AkazeDescriptorType, DiffusivityType, OrbHarrisScore, FastFeatureType,
+    TemplateMatchingMethod, FeatureType, DescriptorMatcherType,
+    FrequencyFilterType, FrequencyFilterProfile
+)
+from functions.colorspace import color_image
+from functions.frequency_domain import require_image
+from functions.tracing import tracer
+from tiling import is_tileable, process_tiled
+
+
+def serialize_params(params):
+    """Convert parameters to JSON-serializable format."""
+    serialized = {}
+    for key, value in params.items():
+        if hasattr(value, 'name'):  # Handle enum values
+            serialized[key] = value.name
+        elif hasattr(value, 'value'):  # Handle enum values with .value
+            serialized[key] = value.value
+        elif isinstance(value, (int, float, str, bool, list, tuple)):
+            serialized[key] = value
+        else:
+            serialized[key] = str(value)  # Fallback to string representation
+    return serialized
+
+
+def deserialize_params(params, opencv_functions):
+    """Convert JSON parameters back to their proper types including enums."""
+    # List of all enum classes
+    enum_classes = [
+        ColorSpaceConversionType, ThresholdType, MorphShape, MorphOperation,
+        Interpolation, BorderType, CornerRefineMethod, DictType,
+        AkazeDescriptorType, DiffusivityType, OrbHarrisScore, FastFeatureType,
+        TemplateMatchingMethod, FeatureType, DescriptorMatcherType,
+        FrequencyFilterType, FrequencyFilterProfile
+    ]
+    
+    deserialized = {}
+    for key, value in params.items():
+        # Try to convert enum string names back to enum objects
+        if isinstance(value, str):
+            # Check all enum types
+            for enum_class in enum_classes:
+                try:
+                    if hasattr(enum_class, value):
+                        deserialized[key] = getattr(enum_class, value)
+                        break
+                except:
+                    pass
+            else:
+                deserialized[key] = value
+        else:
+            deserialized[key] = value
+    
+    return deserialized
+
+
+def validate_json_structure(data):
+    """Validate the structure of imported JSON data."""
+    try:
+        if not isinstance(data, dict):
+            return False, "JSON must be an object"
+        
+        if "processing_pipeline" not in data:
+            return False, "Missing 'processing_pipeline' key"
+        
+        pipeline = data["processing_pipeline"]
+        if not isinstance(pipeline, dict):
+            return False, "'processing_pipeline' must be an object"
+        
+        if "functions_applied" not in pipeline:
+            return False, "Missing 'functions_applied' key"
+        
+        functions = pipeline["functions_applied"]
+        if not isinstance(functions, list):
+            return False, "'functions_applied' must be a list"
+        
+        for i, func in enumerate(functions):
+            if not isinstance(func, dict):
+                return False, f"Function {i+1} must be an object"
+            
+            if "function_name" not in func:
+                return False, f"Function {i+1} missing 'function_name'"
+            
+            if "parameters" not in func:
+                return False, f"Function {i+1} missing 'parameters'"
+        
+        return True, "Valid JSON structure"
+    
+    except Exception as e:
+        return False, f"JSON validation error: {str(e)}"
+
+
+def load_pipeline(path):
+    """Read an exported function history JSON file and return its steps."""
+    with open(path, "r", encoding="utf-8") as f:
+        data = json.load(f)
+
+    is_valid, validation_msg = validate_json_structure(data)
+    if not is_valid:
+        raise ValueError(f"Invalid JSON structure: {validation_msg}")
+
+    return data["processing_pipeline"]["functions_applied"]
+
+
+def resolve_steps(functions_to_apply, opencv_functions):
+    """Resolve JSON step records to (name, function class, params) tuples."""
+    steps = []
+    for func_data in functions_to_apply:
+        function_name = func_data["function_name"]
+        if function_name not in opencv_functions:
+            raise ValueError(f"Unknown function: {function_name}")
+        parameters = deserialize_params(func_data.get("parameters", {}), opencv_functions)
+        steps.append((function_name, opencv_functions[function_name], parameters))
+    return steps
+
+
+class Pipeline:
+    """Apply a fixed list of steps, reusing buffers across steps and runs.
+
+    Steps that accept `dst` write into an output array kept per step, and
+    steps that draw on their input get a copy kept per step, so repeated
+    runs on same-shaped images allocate almost nothing. The returned image
+    is owned by the pipeline and is overwritten by the next run; copy it to
+    keep it. With `tile_size`, tile-safe steps on larger images run tile by
+    tile on a thread pool.
+
+    Frame-pair steps such as optical flow get the input they saw on the
+    previous run as their first image, so running a pipeline frame by frame
+    processes a video. Call reset() before starting on unrelated images.
+
+    The (function name, Detections) of detector steps of the last run are
+    kept in `detections`. Without `draw`, detector steps only detect and
+    pass their input on unchanged, so later steps see the undrawn image.
+    """
+
+    def __init__(self, steps, secondary_image=None, tile_size=None, draw=True):
+        self.steps = steps
+        self.secondary_image = secondary_image
+        self.tile_size = tile_size
+        self.draw = draw
+        self.detections = []
+        self._needs_secondary = [
+            "requires_secondary_image" in function_class.get_params()
+            for _, function_class, _ in steps
+        ]
+        self._outputs = [None] * len(steps)
+        self._inputs = [None] * len(steps)
+        self._frames = [(None, None)] * len(steps)
+
+    @classmethod
+    def from_json(
+        cls,
+        functions_to_apply,
+        opencv_functions,
+        secondary_image=None,
+        tile_size=None,
+        draw=True,
+    ):
+        return cls(
+            resolve_steps(functions_to_apply, opencv_functions),
+            secondary_image,
+            tile_size,
+            draw,
+        )
+
+    def run(self, image):
+        self.detections = []
+        for i, (function_name, _, _) in enumerate(self.steps):
+            with tracer.span("process", function_name):
+                image = self._run_step(i, image)
+        return image
+
+    def _run_step(self, i, image):
+        function_name, function_class, parameters = self.steps[i]
+        require_image(image, function_name, function_class)
+        if function_class.returns_detections:
+            # Detection only reads the image, so detectors and the steps
+            # after them share its gray version instead of converting again
+            image = color_image(image)
+        elif function_class.modifies_input:
+            image = self._copy_input(i, image)
+
+        args = (image,)
+        if function_class.frame_pair:
+            args = (self._previous_frame(i, image), image)
+        elif self._needs_secondary[i]:
+            if self.secondary_image is None:
+                raise ValueError(f"{function_name} requires a secondary image")
+            args = (image, self.secondary_image)
+
+        if function_class.returns_detections:
+            detections = function_class.detect(*args, **parameters)
+            self.detections.append((function_name, detections))
+            if self.draw:
+                with tracer.span("draw"):
+                    if function_class.modifies_input:
+                        image = self._copy_input(i, image)
+                    image = function_class.draw(image, detections)
+        elif self.tile_size and is_tileable(
+            function_class, image, parameters, self.tile_size
+        ):
+            image = process_tiled(
+                function_class,
+                image,
+                parameters,
+                self.tile_size,
+                dst=self._outputs[i],
+            )
+            self._outputs[i] = image
+        elif function_class.supports_dst:
+            # OpenCV reallocates dst when it has the wrong shape or type,
+            # so keep whatever array comes back for the next run
+            image = function_class.process(*args, dst=self._outputs[i], **parameters)
+            self._outputs[i] = image
+        else:
+            image = function_class.process(*args, **parameters)
+        return image
+
+    def reset(self):
+        """Forget the previous frame of frame-pair steps."""
+        self._frames = [(None, None)] * len(self.steps)
+
+    def _previous_frame(self, i, image):
+        # Keep a copy of this frame for the next run in the spare buffer,
+        # which is free again once the previous frame has been used
+        previous, spare = self._frames[i]
+        if spare is None or spare.shape != image.shape or spare.dtype != image.dtype:
+            spare = np.empty_like(image)
+        np.copyto(spare, image)
+        self._frames[i] = (spare, previous)
+
+        if previous is None or previous.shape != image.shape or previous.dtype != image.dtype:
+            # Pair the first frame with the secondary image if it fits, or itself
+            secondary = self.secondary_image
+            if secondary is not None and secondary.shape == image.shape:
+                return secondary
+            return image
+        return previous
+
+    def _copy_input(self, i, image):
+        buffer = self._inputs[i]
+        if buffer is None or buffer.shape != image.shape or buffer.dtype != image.dtype:
+            buffer = self._inputs[i] = np.empty_like(image)
+        np.copyto(buffer, image)
+        # Attributes such as the size of a spectrum, but no cached versions
+        buffer.__array_finalize__(image)
+        return buffer
@@ -0,0 +1,71 @@
+import cv2
+from functions.frequency_domain import Spectrum
+
+# Longest side of the downscaled proxy used while tuning parameters
+PREVIEW_MAX_SIZE = 1024
+
+
+def make_proxy(image, max_size=PREVIEW_MAX_SIZE):
+    """Return a downscaled copy of `image` and its scale factor.
+
+    Images that already fit are returned as they are, with scale 1.0, as
+    are spectra, which cannot be resized.
+    """
+    if isinstance(image, Spectrum):
+        return image, 1.0
+    height, width = image.shape[:2]
+    scale = max_size / max(height, width)
+    if scale >= 1:
+        return image, 1.0
+    size = (max(1, round(width * scale)), max(1, round(height * scale)))
+    return cv2.resize(image, size, interpolation=cv2.INTER_AREA), scale
+
+
+def scale_params(function_class, params, scale):
+    """Rescale the parameters measured in pixels for an image scaled by `scale`.
+
+    Values are snapped to their slider step and clamped to the slider range
+    from get_params(), so odd kernel sizes stay odd. A value of zero stays
+    zero, as it often means "automatic", and other values never drop to
+    zero.
+    """
+    if scale == 1 or not function_class.pixel_params:
+        return params
+
+    param_info = function_class.get_params()
+    scaled = dict(params)
+    for name, power in function_class.pixel_params.items():
+        value = params.get(name)
+        if not value:
+            continue
+        min_val, max_val, _, step = param_info[name]
+        new_value = min_val + round((value * scale**power - min_val) / step) * step
+        if new_value <= 0:
+            new_value = min_val if min_val > 0 else step
+        new_value = min(max(new_value, min_val), max_val)
+        if isinstance(value, int):
+            new_value = int(new_value)
+        else:
+            new_value = round(float(new_value), 6)
+        scaled[name] = new_value
+    return scaled
+
+
+def scale_secondary(secondary_image, image, proxy):
+    """Downscale a secondary image to match a proxy of `image`.
+
+    A secondary image of the same size as `image`, such as a second video
+    frame, gets exactly the proxy's size; anything else, such as a
+    template, is scaled by the same factor.
+    """
+    if proxy is image:
+        return secondary_image
+    if secondary_image.shape[:2] == image.shape[:2]:
+        size = (proxy.shape[1], proxy.shape[0])
+    else:
+        scale = proxy.shape[1] / image.shape[1]
+        size = (
+            max(1, round(secondary_image.shape[1] * scale)),
+            max(1, round(secondary_image.shape[0] * scale)),
+        )
+    return cv2.resize(secondary_image, size, interpolation=cv2.INTER_AREA)
@@ -0,0 +1,516 @@
+"""Serve the function registry and exported pipelines over HTTP.
+
+Example:
+    python server.py --pipeline inspect=history.json --workers 4
+    curl --data-binary @part.png -o out.png localhost:8600/pipelines/inspect
+"""
+
+import argparse
+import io
+import json
+import logging
+import multiprocessing
+import os
+import struct
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, unquote, urlsplit
+
+import cv2
+import numpy as np
+
+from functions.detections import save_npz
+from functions.frequency_domain import as_image
+from functions.tracing import stage_totals, tracer
+from pipeline import Pipeline, load_pipeline, resolve_steps, validate_json_structure
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+DEFAULT_PORT = 8600
+DEFAULT_MAX_BODY_BYTES = 256 * 1024 * 1024
+# Pipelines kept per worker, with their buffers
+MAX_WORKER_PIPELINES = 16
+# Batch bodies are a sequence of frames, each a big-endian length and that many bytes
+FRAME_HEADER = struct.Struct(">I")
+
+# Per-worker state, set up once by _init_worker
+_secondary_image = None
+_tile_size = None
+_pipelines = OrderedDict()
+
+
+def param_schema(config):
+    """Describe one get_params() entry as JSON."""
+    if isinstance(config, tuple):
+        min_val, max_val, default, step = config
+        kind = "int" if all(isinstance(v, int) for v in config) else "float"
+        return {"type": kind, "min": min_val, "max": max_val, "default": default, "step": step}
+    if isinstance(config, list):
+        options = [getattr(option, "name", option) for option in config]
+        return {"type": "choice", "options": options, "default": options[0]}
+    if isinstance(config, bool):
+        return {"type": "bool", "default": config}
+    if isinstance(config, int):
+        return {"type": "int", "default": config}
+    return {"type": "float", "default": config}
+
+
+def function_schema(function_class):
+    param_info = function_class.get_params()
+    requires_secondary_image = bool(param_info.pop("requires_secondary_image", False))
+    return {
+        "params": {name: param_schema(config) for name, config in param_info.items()},
+        "requires_secondary_image": requires_secondary_image,
+        "returns_detections": function_class.returns_detections,
+    }
+
+
+def parse_value(name, schema, text):
+    try:
+        if schema["type"] == "bool":
+            if text.lower() not in ("1", "0", "true", "false"):
+                raise ValueError(text)
+            return text.lower() in ("1", "true")
+        if schema["type"] in ("int", "float"):
+            value = int(text) if schema["type"] == "int" else float(text)
+            if "min" in schema and not schema["min"] <= value <= schema["max"]:
+                raise ValueError(text)
+            return value
+        for option in schema["options"]:
+            if str(option) == text:
+                return option
+        raise ValueError(text)
+    except ValueError:
+        raise ValueError(f"Invalid value for {name}: {text}") from None
+
+
+def step_from_query(function_name, function_class, query):
+    """Return the JSON step record of a function, with parameters from a query string.
+
+    Parameters not in the query keep the defaults shown in the UI.
+    """
+    schemas = function_schema(function_class)["params"]
+    unknown = set(query) - set(schemas) - {"output", "format"}
+    if unknown:
+        raise ValueError(f"Unknown parameters for {function_name}: {', '.join(sorted(unknown))}")
+    parameters = {
+        name: parse_value(name, schema, query[name][-1]) if name in query else schema["default"]
+        for name, schema in schemas.items()
+    }
+    return {"function_name": function_name, "parameters": parameters}
+
+
+def read_frames(data):
+    frames = []
+    offset = 0
+    while offset < len(data):
+        if offset + FRAME_HEADER.size > len(data):
+            raise ValueError("Truncated frame header")
+        (length,) = FRAME_HEADER.unpack_from(data, offset)
+        offset += FRAME_HEADER.size
+        if offset + length > len(data):
+            raise ValueError("Truncated frame")
+        frames.append(data[offset : offset + length])
+        offset += length
+    return frames
+
+
+def frame(data):
+    return FRAME_HEADER.pack(len(data)) + data
+
+
+def _init_worker(secondary_path, tile_size):
+    global _secondary_image, _tile_size
+    if secondary_path:
+        _secondary_image = cv2.imread(secondary_path, cv2.IMREAD_COLOR)
+        if _secondary_image is None:
+            raise ValueError(f"Could not read secondary image: {secondary_path}")
+    _tile_size = tile_size
+
+
+def _get_pipeline(functions_to_apply, draw):
+    from functions import opencv_functions
+
+    key = (json.dumps(functions_to_apply, sort_keys=True), draw)
+    pipeline = _pipelines.get(key)
+    if pipeline is None:
+        pipeline = Pipeline.from_json(
+            functions_to_apply, opencv_functions, _secondary_image, _tile_size, draw
+        )
+        _pipelines[key] = pipeline
+        if len(_pipelines) > MAX_WORKER_PIPELINES:
+            _pipelines.popitem(last=False)
+    else:
+        _pipelines.move_to_end(key)
+    return pipeline
+
+
+def run_job(functions_to_apply, body, output="image", extension=".png"):
+    """Decode an image, run the steps on it and encode the result, in a pool worker.
+
+    Return the record of the run and the encoded image, or the .npz bytes
+    of the detections when `output` is "npz". Pipelines are kept per
+    worker, so their buffers are reused by the next request.
+    """
+    start = time.perf_counter()
+    record = {}
+    data = b""
+    with tracer.collect() as spans:
+        try:
+            with tracer.span("decode"):
+                image = cv2.imdecode(np.frombuffer(body, np.uint8), cv2.IMREAD_COLOR)
+            if image is None:
+                raise ValueError("Could not decode image")
+            pipeline = _get_pipeline(functions_to_apply, draw=output != "npz")
+            # Requests are unrelated, so frame-pair steps must not see the last one
+            pipeline.reset()
+            result = pipeline.run(image)
+            if pipeline.detections:
+                record["detections"] = [
+                    dict(function=function_name, **detections.summary())
+                    for function_name, detections in pipeline.detections
+                ]
+            with tracer.span("encode"):
+                if output == "npz":
+                    buffer = io.BytesIO()
+                    save_npz(buffer, pipeline.detections)
+                    data = buffer.getvalue()
+                else:
+                    written, encoded = cv2.imencode(extension, as_image(result))
+                    if not written:
+                        raise ValueError(f"Could not encode the result as {extension}")
+                    data = encoded.tobytes()
+            record["status"] = "ok"
+        except Exception as e:
+            record["status"] = "error"
+            record["error"] = f"{type(e).__name__}: {e}"
+            data = b""
+    record["seconds"] = round(time.perf_counter() - start, 4)
+    record["timings"] = stage_totals(spans)
+    # Recorded by the server for /metrics, not sent to the client
+    record["spans"] = spans
+    return record, data
+
+
+class ProcessingServer(ThreadingHTTPServer):
+    """HTTP server that runs requests on a pool of worker processes.
+
+    Every connection is served by a thread, which hands the encoded image
+    to the pool and waits for the encoded result, so decoding, processing
+    and encoding all run in the workers. A worker that crashes fails the
+    requests it was running, and the next request starts a new pool. Pipelines are registered by name,
+    from files at startup or with PUT /pipelines/<name>.
+    """
+
+    daemon_threads = True
+    request_queue_size = 64
+
+    def __init__(
+        self,
+        address,
+        workers=None,
+        secondary_path=None,
+        tile_size=None,
+        max_body_bytes=DEFAULT_MAX_BODY_BYTES,
+    ):
+        super().__init__(address, RequestHandler)
+        self.max_body_bytes = max_body_bytes
+        self.pipelines = {}
+        self.pipelines_lock = threading.Lock()
+        self.workers = workers or os.cpu_count() or 1
+        self.worker_args = (secondary_path, tile_size)
+        self.executor = self._start_pool()
+        self.executor_lock = threading.Lock()
+
+    def _start_pool(self):
+        return ProcessPoolExecutor(
+            max_workers=self.workers,
+            # Workers are started while requests are served, and forking a
+            # process that runs threads can deadlock the child
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker,
+            initargs=self.worker_args,
+        )
+
+    def submit(self, *args):
+        """Run run_job(*args) on the pool, replacing the pool if a worker crashed."""
+        with self.executor_lock:
+            try:
+                return self.executor.submit(run_job, *args)
+            except BrokenProcessPool:
+                logger.warning("A worker process crashed, starting a new pool")
+                self.executor.shutdown(wait=False, cancel_futures=True)
+                self.executor = self._start_pool()
+                return self.executor.submit(run_job, *args)
+
+    def add_pipeline(self, name, functions_to_apply):
+        """Register the steps of an exported function history under `name`."""
+        from functions import opencv_functions
+
+        # Fail on unknown functions now rather than in every request
+        resolve_steps(functions_to_apply, opencv_functions)
+        with self.pipelines_lock:
+            self.pipelines[name] = functions_to_apply
+
+    def server_close(self):
+        super().server_close()
+        self.executor.shutdown(cancel_futures=True)
+
+
+class RequestHandler(BaseHTTPRequestHandler):
+    # Keep connections open between requests; every response has a length
+    protocol_version = "HTTP/1.1"
+    # Small responses are sent right away instead of waiting for an ACK
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        logger.debug(format, *args)
+
+    def do_GET(self):
+        from functions import opencv_functions
+
+        path, query = self._parse_path()
+        if path == ["functions"]:
+            opencv_functions.load_all()
+            schemas = {}
+            for name in opencv_functions:
+                if name in opencv_functions.errors:
+                    schemas[name] = {"error": opencv_functions.errors[name]}
+                    continue
+                try:
+                    schemas[name] = function_schema(opencv_functions[name])
+                except Exception as e:
+                    # One broken get_params() must not hide the other functions
+                    schemas[name] = {"error": f"{type(e).__name__}: {e}"}
+            self._send_json(200, schemas)
+        elif len(path) == 2 and path[0] == "functions":
+            function_class = self._get_function(path[1])
+            if function_class is not None:
+                self._send_json(200, function_schema(function_class))
+        elif path == ["pipelines"]:
+            with self.server.pipelines_lock:
+                self._send_json(200, self.server.pipelines)
+        elif path == ["metrics"]:
+            self._send(200, tracer.to_prometheus().encode(), "text/plain; version=0.0.4")
+        else:
+            self._send_json(404, {"error": f"Not found: {self.path}"})
+
+    def do_PUT(self):
+        path, _ = self._parse_path()
+        body = self._read_body()
+        if body is None:
+            return
+        if len(path) != 2 or path[0] != "pipelines":
+            self._send_json(404, {"error": f"Not found: {self.path}"})
+            return
+        try:
+            data = json.loads(body)
+            is_valid, validation_msg = validate_json_structure(data)
+            if not is_valid:
+                raise ValueError(f"Invalid JSON structure: {validation_msg}")
+            self.server.add_pipeline(path[1], data["processing_pipeline"]["functions_applied"])
+        except (ValueError, ImportError) as e:
+            self._send_json(400, {"error": str(e)})
+            return
+        self._send_json(200, {"pipeline": path[1]})
+
+    def do_POST(self):
+        path, query = self._parse_path()
+        body = self._read_body()
+        if body is None:
+            return
+        batch = bool(path) and path[0] == "batch"
+        if batch:
+            path = path[1:]
+
+        output = query.get("output", ["image"])[-1]
+        extension = "." + query.get("format", ["png"])[-1].lstrip(".")
+        if output not in ("image", "npz"):
+            self._send_json(400, {"error": f"Unknown output: {output}"})
+            return
+        if len(path) != 2 or path[0] not in ("functions", "pipelines"):
+            self._send_json(404, {"error": f"Not found: {self.path}"})
+            return
+        functions_to_apply = self._get_steps(path[0], path[1], query, output)
+        if functions_to_apply is None:
+            return
+
+        if batch:
+            try:
+                images = read_frames(body)
+            except ValueError as e:
+                self._send_json(400, {"error": str(e)})
+                return
+            self._send_batch(functions_to_apply, images, output, extension)
+            return
+
+        record, data = self._finish(
+            self.server.submit(functions_to_apply, body, output, extension)
+        )
+        if record["status"] != "ok":
+            # A crashed worker is the server's fault, not the request's
+            self._send_json(500 if record.get("crashed") else 422, record)
+            return
+        headers = {"Server-Timing": server_timing(record)}
+        if "detections" in record:
+            headers["X-Detections"] = json.dumps(record["detections"])
+        content_type = "application/octet-stream" if output == "npz" else image_type(extension)
+        self._send(200, data, content_type, headers)
+
+    def _parse_path(self):
+        url = urlsplit(self.path)
+        path = [unquote(part) for part in url.path.split("/") if part]
+        return path, parse_qs(url.query)
+
+    def _get_function(self, function_name):
+        from functions import opencv_functions
+
+        if function_name not in opencv_functions:
+            self._send_json(404, {"error": f"Unknown function: {function_name}"})
+            return None
+        try:
+            return opencv_functions[function_name]
+        except ImportError as e:
+            self._send_json(503, {"error": str(e)})
+            return None
+
+    def _get_steps(self, kind, name, query, output):
+        from functions import opencv_functions
+
+        if kind == "functions":
+            function_class = self._get_function(name)
+            if function_class is None:
+                return None
+            try:
+                functions_to_apply = [step_from_query(name, function_class, query)]
+            except ValueError as e:
+                self._send_json(400, {"error": str(e)})
+                return None
+        else:
+            with self.server.pipelines_lock:
+                functions_to_apply = self.server.pipelines.get(name)
+            if functions_to_apply is None:
+                self._send_json(404, {"error": f"Unknown pipeline: {name}"})
+                return None
+
+        if output == "npz":
+            steps = resolve_steps(functions_to_apply, opencv_functions)
+            if not any(function_class.returns_detections for _, function_class, _ in steps):
+                self._send_json(400, {"error": "No detector steps to return detections of"})
+                return None
+        return functions_to_apply
+
+    def _finish(self, future):
+        try:
+            record, data = future.result()
+        except BrokenProcessPool:
+            return {"status": "error", "error": "Worker process exited", "crashed": True}, b""
+        for span in record.pop("spans"):
+            tracer.record(*span)
+        return record, data
+
+    def _send_batch(self, functions_to_apply, images, output, extension):
+        # All images go to the pool at once, and the results are streamed
+        # back in order as they finish
+        futures = [
+            self.server.submit(functions_to_apply, body, output, extension) for body in images
+        ]
+        self.send_response(200)
+        self.send_header("Content-Type", "application/octet-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        for future in futures:
+            record, data = self._finish(future)
+            chunk = frame(json.dumps(record).encode()) + frame(data)
+            self.wfile.write(b"%X\r\n%s\r\n" % (len(chunk), chunk))
+        self.wfile.write(b"0\r\n\r\n")
+
+    def _read_body(self):
+        length = self.headers.get("Content-Length")
+        if length is None or not length.isdigit():
+            self.close_connection = True
+            self._send_json(411, {"error": "Content-Length is required"})
+            return None
+        if int(length) > self.server.max_body_bytes:
+            # The body is not read, so the connection cannot be reused
+            self.close_connection = True
+            self._send_json(413, {"error": f"Body larger than {self.server.max_body_bytes} bytes"})
+            return None
+        return self.rfile.read(int(length))
+
+    def _send_json(self, code, data):
+        self._send(code, json.dumps(data).encode(), "application/json")
+
+    def _send(self, code, body, content_type, headers=None):
+        self.send_response(code)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        if self.close_connection:
+            self.send_header("Connection", "close")
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def server_timing(record):
+    """Return the stage timings of a record as a Server-Timing header."""
+    timings = [f"{stage};dur={seconds * 1000:.2f}" for stage, seconds in record["timings"].items()]
+    return ", ".join(timings + [f"total;dur={record['seconds'] * 1000:.2f}"])
+
+
+def image_type(extension):
+    image_types = {".jpg": "image/jpeg", ".jpeg": "image/jpeg", ".tif": "image/tiff"}
+    return image_types.get(extension, "image/" + extension.lstrip("."))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1", help="Address to listen on")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT, help="Port to listen on")
+    parser.add_argument("-w", "--workers", type=int, help="Number of worker processes")
+    parser.add_argument(
+        "--pipeline",
+        action="append",
+        default=[],
+        metavar="NAME=PATH",
+        help="Serve an exported function history at /pipelines/NAME (repeatable)",
+    )
+    parser.add_argument("--secondary", help="Secondary image for functions that require one")
+    parser.add_argument(
+        "--tile-size", type=int, help="Process tile-safe filters in tiles of this size on large images"
+    )
+    parser.add_argument(
+        "--max-body-mb", type=int, default=DEFAULT_MAX_BODY_BYTES // (1024 * 1024),
+        help="Largest accepted request body in MB",
+    )
+    args = parser.parse_args()
+
+    server = ProcessingServer(
+        (args.host, args.port),
+        workers=args.workers,
+        secondary_path=args.secondary,
+        tile_size=args.tile_size,
+        max_body_bytes=args.max_body_mb * 1024 * 1024,
+    )
+    for spec in args.pipeline:
+        name, _, path = spec.partition("=")
+        if not path:
+            parser.error(f"--pipeline must be NAME=PATH, got {spec}")
+        server.add_pipeline(name, load_pipeline(path))
+    logger.info(f"Serving on http://{args.host}:{server.server_port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
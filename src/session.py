@@ -0,0 +1,223 @@
+import importlib
+import json
+import os
+import shutil
+import threading
+import time
+import uuid
+import weakref
+
+from functions import opencv_functions
+from history import HistoryEntry, ImageHistory
+from pipeline import deserialize_params, serialize_params
+
+SESSION_DIR = os.environ.get(
+    "OPENCV_TESTER_SESSION_DIR",
+    os.path.join(os.path.expanduser("~"), ".opencv-function-tester", "sessions"),
+)
+# Sessions not used for this long are deleted
+MAX_SESSION_AGE = 30 * 24 * 3600
+MANIFEST = "session.json"
+# Image states of all sessions, named after their content
+IMAGES = "images"
+# Unreferenced image files younger than this may be about to be referenced
+IMAGE_GRACE_SECONDS = 3600
+
+# The store of every open session, shared by all tabs showing it
+_stores = weakref.WeakValueDictionary()
+_stores_lock = threading.Lock()
+
+
+def new_session_id():
+    return uuid.uuid4().hex[:16]
+
+
+def is_session_id(session_id):
+    # Session ids end up in paths, so only allow what new_session_id() makes
+    return (
+        isinstance(session_id, str)
+        and 0 < len(session_id) <= 32
+        and all(c in "0123456789abcdef" for c in session_id)
+    )
+
+
+def prune_sessions(root=SESSION_DIR, max_age=MAX_SESSION_AGE):
+    """Delete the sessions in `root` that have not been saved for `max_age` seconds.
+
+    Then delete the image files no session refers to anymore.
+    """
+    if not os.path.isdir(root):
+        return
+    cutoff = time.time() - max_age
+    for name in os.listdir(root):
+        path = os.path.join(root, name)
+        if is_session_id(name) and os.path.isdir(path) and os.path.getmtime(path) < cutoff:
+            shutil.rmtree(path, ignore_errors=True)
+    collect_images(root)
+
+
+def collect_images(root=SESSION_DIR, grace=IMAGE_GRACE_SECONDS):
+    """Delete the shared image files that no saved session and no open history uses."""
+    images_path = os.path.join(root, IMAGES)
+    if not os.path.isdir(images_path):
+        return
+    used = set()
+    with _stores_lock:
+        stores = list(_stores.values())
+    for store in stores:
+        with store._lock:
+            used.update(*store._files.values())
+    for name in os.listdir(root):
+        manifest_path = os.path.join(root, name, MANIFEST)
+        if not is_session_id(name) or not os.path.exists(manifest_path):
+            continue
+        try:
+            with open(manifest_path, "r", encoding="utf-8") as f:
+                used.update(record["file"] for record in json.load(f)["steps"])
+        except (OSError, ValueError, KeyError):
+            # Keep everything rather than guess what a broken manifest used
+            return
+    cutoff = time.time() - grace
+    for name in os.listdir(images_path):
+        path = os.path.join(images_path, name)
+        if name not in used and os.path.getmtime(path) < cutoff:
+            os.remove(path)
+
+
+def type_name(array_type):
+    return f"{array_type.__module__}.{array_type.__qualname__}"
+
+
+def resolve_type(name):
+    module, _, qualname = name.rpartition(".")
+    return getattr(importlib.import_module(module), qualname)
+
+
+def session_store(session_id, root=SESSION_DIR):
+    """Return the SessionStore of a session, shared by all tabs that show it."""
+    with _stores_lock:
+        store = _stores.get((root, session_id))
+        if store is None:
+            store = _stores[(root, session_id)] = SessionStore(session_id, root)
+        return store
+
+
+class SessionStore:
+    """Image history and function history of one session, kept on disk.
+
+    Every image state is written once, as a .npy file, and is mapped from
+    disk when viewed. The files are shared by all sessions in `root`, as
+    equal states are written to the same file. The function history, the current position and the
+    steps to replay states that were never written go to session.json. A
+    refreshed page or a restarted server picks the session up again, and
+    the states not being viewed take no memory.
+
+    Tabs showing the same session must share one store, see session_store().
+    Image files are deleted by collect_images() once no session uses them.
+    """
+
+    def __init__(self, session_id, root=SESSION_DIR):
+        self.session_id = session_id
+        self.path = os.path.join(root, session_id)
+        self.images_path = os.path.join(root, IMAGES)
+        self._manifest = None
+        # The files each open history refers to
+        self._files = weakref.WeakKeyDictionary()
+        self._lock = threading.Lock()
+
+    def save(self, history, history_index, function_history, function_history_index):
+        """Write new image states and the manifest."""
+        with self._lock:
+            self._save(history, history_index, function_history, function_history_index)
+
+    def _save(self, history, history_index, function_history, function_history_index):
+        os.makedirs(self.path, exist_ok=True)
+        os.makedirs(self.images_path, exist_ok=True)
+        entries = history.save(self.images_path)
+        self._files[history] = {os.path.basename(entry.path) for entry in entries if entry.path}
+        steps = []
+        for entry in entries:
+            step = None
+            if entry.step is not None:
+                function_name, params = entry.step
+                step = [function_name, serialize_params(params)]
+            steps.append(
+                {
+                    "file": os.path.basename(entry.path) if entry.path else None,
+                    "step": step,
+                    "array_type": type_name(entry.array_type),
+                    "attributes": entry.attributes,
+                }
+            )
+        manifest = json.dumps(
+            {
+                "history_index": history_index,
+                "function_history": function_history,
+                "function_history_index": function_history_index,
+                "steps": steps,
+            },
+            default=str,
+        )
+        if manifest == self._manifest:
+            return
+
+        # Replace the manifest in one step, so it is never half written
+        manifest_path = os.path.join(self.path, MANIFEST)
+        with open(manifest_path + ".tmp", "w", encoding="utf-8") as f:
+            f.write(manifest)
+        os.replace(manifest_path + ".tmp", manifest_path)
+        self._manifest = manifest
+
+        # Sessions saved before the images were shared kept them in their
+        # own directory; delete those no tab uses anymore
+        keep = set().union(*self._files.values())
+        for name in os.listdir(self.path):
+            if name.endswith(".npy") and name not in keep:
+                os.remove(os.path.join(self.path, name))
+
+    def load(self, replay, **history_kwargs):
+        """Return the saved session as a dict of session state, or None.
+
+        The image states are not read, the history maps them on access.
+        """
+        manifest_path = os.path.join(self.path, MANIFEST)
+        if not os.path.exists(manifest_path):
+            return None
+        with open(manifest_path, "r", encoding="utf-8") as f:
+            manifest = f.read()
+        data = json.loads(manifest)
+
+        entries = []
+        for record in data["steps"]:
+            step = None
+            if record["step"] is not None:
+                function_name, params = record["step"]
+                step = (function_name, deserialize_params(params, opencv_functions))
+            path = None
+            if record["file"] is not None:
+                path = os.path.join(self.images_path, record["file"])
+                if not os.path.exists(path):
+                    path = os.path.join(self.path, record["file"])
+            attributes = {
+                name: tuple(value) if isinstance(value, list) else value
+                for name, value in record["attributes"].items()
+            }
+            # States without a file were never written and are replayed
+            entries.append(
+                HistoryEntry.saved(
+                    path, step, resolve_type(record["array_type"]), attributes
+                )
+            )
+
+        history = ImageHistory.from_entries(replay, entries, **history_kwargs)
+        with self._lock:
+            self._files[history] = {
+                os.path.basename(entry.path) for entry in entries if entry.path
+            }
+            self._manifest = manifest
+        return {
+            "history": history,
+            "history_index": data["history_index"],
+            "function_history": data["function_history"],
+            "function_history_index": data["function_history_index"],
+        }
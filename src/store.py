@@ -0,0 +1,114 @@
+import threading
+import weakref
+from collections import OrderedDict
+
+import numpy as np
+
+from cache import image_hash
+from functions.colorspace import image_nbytes
+
+DEFAULT_MAX_BYTES = 1024 * 1024 * 1024
+
+
+def image_key(image):
+    """Return a key for the content, type and attributes of an image."""
+    attributes = {
+        name: value
+        for name, value in getattr(image, "__dict__", {}).items()
+        if not name.startswith("_")
+    }
+    return image_hash(image), type(image).__qualname__, repr(sorted(attributes.items()))
+
+
+class ImageStore:
+    """Process-wide store of read-only images, keyed by their content.
+
+    All Streamlit sessions run in one process. intern() returns the array
+    already held for the same content, if there is one, so equal uploads,
+    history states and cached results share one buffer across sessions.
+    Arrays are referenced weakly and freed once no session uses them. The
+    most recently used ones are also kept for the next session to upload
+    or compute them, as long as all arrays together stay within
+    `max_bytes`.
+
+    The store cannot free what sessions use. Instead, their result caches
+    and histories drop images while excess_bytes() is above zero, so the
+    total only exceeds `max_bytes` by the images sessions are showing.
+    """
+
+    def __init__(self, max_bytes=DEFAULT_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._live = weakref.WeakValueDictionary()
+        self._kept = OrderedDict()
+        self._lock = threading.Lock()
+
+    def intern(self, image):
+        """Return the shared array equal to `image`, storing `image` if there is none.
+
+        The image is made read-only, and must not be written to through
+        other references afterwards.
+        """
+        if not isinstance(image, np.ndarray):
+            return image
+        key = image_key(image)
+        with self._lock:
+            shared = self._live.get(key)
+            if shared is not None:
+                self.hits += 1
+                self._keep(key, shared)
+                return shared
+            self.misses += 1
+
+        image.setflags(write=False)
+        with self._lock:
+            # Another session may have stored the same image meanwhile
+            shared = self._live.setdefault(key, image)
+            self._keep(key, shared)
+        return shared
+
+    def _keep(self, key, image):
+        if key in self._kept:
+            self._kept.move_to_end(key)
+            return
+        if image_nbytes(image) > self.max_bytes:
+            return
+        self._kept[key] = image
+        # Measured again every time: an evicted image may still be used by a
+        # session, and the gray and BGR versions of images are added later
+        while self._kept and self._live_bytes() > self.max_bytes:
+            self._kept.popitem(last=False)
+
+    def excess_bytes(self):
+        """Return by how many bytes the images in use exceed `max_bytes`."""
+        with self._lock:
+            return max(0, self._live_bytes() - self.max_bytes)
+
+    def _live_bytes(self):
+        return sum(image_nbytes(image) for image in self._live.values())
+
+    def _kept_bytes(self):
+        return sum(image_nbytes(image) for image in self._kept.values())
+
+    def clear(self):
+        with self._lock:
+            self._kept.clear()
+
+    def stats(self):
+        with self._lock:
+            live = list(self._live.values())
+            live_bytes = sum(image_nbytes(image) for image in live)
+            return {
+                "entries": len(live),
+                "bytes": live_bytes,
+                "excess_bytes": max(0, live_bytes - self.max_bytes),
+                "kept_bytes": self._kept_bytes(),
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+            }
+
+
+# Shared by all sessions of the Streamlit server
+image_store = ImageStore()
@@ -0,0 +1,152 @@
+import itertools
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+import cv2
+import numpy as np
+
+from functions.frequency_domain import as_image
+
+# Per-process inputs for process pool sweeps, set once by _init_worker
+_worker_inputs = None
+
+
+def sweep_values(config, steps=5):
+    """Return the values to try for one get_params() entry."""
+    if isinstance(config, tuple):
+        min_val, max_val, _, step = config
+        values = np.linspace(min_val, max_val, steps)
+        # Snap to the slider step so e.g. odd kernel sizes stay odd
+        values = min_val + np.round((values - min_val) / step) * step
+        if all(isinstance(v, int) for v in (min_val, max_val, step)):
+            return sorted({int(v) for v in values})
+        return sorted({round(float(v), 6) for v in values})
+    if isinstance(config, list):
+        return list(config)
+    if isinstance(config, bool):
+        return [False, True]
+    return [config]
+
+
+def random_value(config, rng):
+    if isinstance(config, tuple):
+        min_val, max_val, _, step = config
+        value = min_val + rng.integers(0, int((max_val - min_val) / step) + 1) * step
+        if all(isinstance(v, int) for v in (min_val, max_val, step)):
+            return int(value)
+        return round(float(min(value, max_val)), 6)
+    if isinstance(config, list):
+        return config[rng.integers(0, len(config))]
+    if isinstance(config, bool):
+        return bool(rng.integers(0, 2))
+    return config
+
+
+def grid_combinations(param_info, base_params, swept, steps=5):
+    """Return every combination of the swept parameters' values."""
+    value_lists = [sweep_values(param_info[name], steps) for name in swept]
+    return [
+        {**base_params, **dict(zip(swept, values))}
+        for values in itertools.product(*value_lists)
+    ]
+
+
+def random_combinations(param_info, base_params, swept, samples=16, seed=0):
+    """Return `samples` random combinations of the swept parameters."""
+    rng = np.random.default_rng(seed)
+    return [
+        {**base_params, **{name: random_value(param_info[name], rng) for name in swept}}
+        for _ in range(samples)
+    ]
+
+
+def thumbnail(image, width):
+    # Must match the downscaling in the process_many fast paths
+    image = as_image(image)
+    if width is None or image.shape[1] <= width:
+        return image
+    height = max(1, round(image.shape[0] * width / image.shape[1]))
+    return cv2.resize(image, (width, height), interpolation=cv2.INTER_AREA)
+
+
+def run_variant(function_class, image, params, secondary_image=None, thumbnail_width=None):
+    """Run one parameter set and return its result and timing."""
+    variant = {"params": params}
+    start = time.perf_counter()
+    try:
+        current = image.copy() if function_class.modifies_input else image
+        if secondary_image is not None:
+            result = function_class.process(current, secondary_image, **params)
+        else:
+            result = function_class.process(current, **params)
+        variant["seconds"] = time.perf_counter() - start
+        variant["result"] = thumbnail(result, thumbnail_width)
+    except Exception as e:
+        variant["seconds"] = time.perf_counter() - start
+        variant["error"] = f"{type(e).__name__}: {e}"
+    return variant
+
+
+def _init_worker(function_class, image, secondary_image, thumbnail_width):
+    global _worker_inputs
+    _worker_inputs = (function_class, image, secondary_image, thumbnail_width)
+
+
+def _run_worker_variant(params):
+    function_class, image, secondary_image, thumbnail_width = _worker_inputs
+    return run_variant(function_class, image, params, secondary_image, thumbnail_width)
+
+
+def run_sweep(
+    function_class,
+    image,
+    combinations,
+    secondary_image=None,
+    executor="thread",
+    max_workers=None,
+    thumbnail_width=None,
+):
+    """Evaluate all parameter combinations and return one result per combination.
+
+    Functions with a `process_many(image, params_list, max_width)` fast path
+    evaluate every combination in one call. Otherwise combinations run on a thread
+    pool, or a process pool with `executor="process"`; the image is sent to
+    each worker process once.
+    """
+    if secondary_image is None and hasattr(function_class, "process_many"):
+        variants = []
+        for params, (result, seconds) in zip(
+            combinations,
+            function_class.process_many(image, combinations, max_width=thumbnail_width),
+        ):
+            variant = {"params": params, "seconds": seconds}
+            if isinstance(result, Exception):
+                variant["error"] = f"{type(result).__name__}: {result}"
+            else:
+                variant["result"] = thumbnail(result, thumbnail_width)
+            variants.append(variant)
+        return variants
+
+    max_workers = max_workers or os.cpu_count() or 1
+    if executor == "process":
+        with ProcessPoolExecutor(
+            max_workers=max_workers,
+            # Sweeps are started from the threaded UI server, and a forked
+            # child could deadlock on a lock one of its threads held
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker,
+            initargs=(function_class, image, secondary_image, thumbnail_width),
+        ) as pool:
+            return list(pool.map(_run_worker_variant, combinations))
+
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        return list(
+            pool.map(
+                lambda params: run_variant(
+                    function_class, image, params, secondary_image, thumbnail_width
+                ),
+                combinations,
+            )
+        )
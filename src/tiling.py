@@ -0,0 +1,86 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+DEFAULT_TILE_SIZE = 1024
+# OpenCV processes most of a row with SIMD and the remaining columns with
+# scalar code, which can round differently. Aligning tile columns to the
+# widest vector size keeps every pixel on the same code path as in the
+# full image.
+COLUMN_ALIGNMENT = 64
+
+
+def is_tileable(function_class, image, params, tile_size=DEFAULT_TILE_SIZE):
+    """Return True if running `function_class` tile by tile is safe and useful."""
+    if function_class.tile_halo(**params) is None:
+        return False
+    return image.shape[0] > tile_size or image.shape[1] > tile_size
+
+
+def tile_regions(height, width, tile_size, halo):
+    """Yield (output region, input region) pairs as (y0, y1, x0, x1) tuples."""
+    # Tiles smaller than the kernel, e.g. a bilateral filter's, are also
+    # filtered differently
+    min_extent = max(COLUMN_ALIGNMENT, 2 * halo + 1)
+    for y0 in range(0, height, tile_size):
+        y1 = min(y0 + tile_size, height)
+        # Very short tiles at the bottom edge also take different code paths
+        ya = max(0, min(y0 - halo, height - min_extent))
+        for x0 in range(0, width, tile_size):
+            x1 = min(x0 + tile_size, width)
+            xb = min(width, -(-(x1 + halo) // COLUMN_ALIGNMENT) * COLUMN_ALIGNMENT)
+            # Narrow tiles on the right edge would skip the SIMD body entirely
+            xa = min(x0 - halo, xb - min_extent)
+            xa = max(0, xa) // COLUMN_ALIGNMENT * COLUMN_ALIGNMENT
+            yield (y0, y1, x0, x1), (
+                ya,
+                min(height, y1 + halo),
+                xa,
+                xb,
+            )
+
+
+def process_tiled(
+    function_class,
+    image,
+    params,
+    tile_size=DEFAULT_TILE_SIZE,
+    max_workers=None,
+    dst=None,
+):
+    """Run a tile-safe function on overlapping tiles in parallel.
+
+    Each tile is extended by the function's halo so that its inner region
+    sees exactly the neighborhood it would see in the full image, which
+    makes the stitched result identical to processing the whole image at
+    once. Tiles on the image edge use OpenCV's border handling as usual.
+    """
+    halo = function_class.tile_halo(**params)
+    if halo is None:
+        raise ValueError(f"{function_class.__name__} cannot be processed in tiles")
+
+    height, width = image.shape[:2]
+    regions = list(tile_regions(height, width, tile_size, halo))
+
+    def run(region):
+        (y0, y1, x0, x1), (ya, yb, xa, xb) = region
+        result = function_class.process(image[ya:yb, xa:xb], **params)
+        return result[y0 - ya : y1 - ya, x0 - xa : x1 - xa]
+
+    # The first tile tells us the output channels and type
+    first = run(regions[0])
+    shape = (height, width) + first.shape[2:]
+    if dst is None or dst.shape != shape or dst.dtype != first.dtype:
+        dst = np.empty(shape, first.dtype)
+    (y0, y1, x0, x1), _ = regions[0]
+    dst[y0:y1, x0:x1] = first
+
+    def run_into(region):
+        (y0, y1, x0, x1), _ = region
+        dst[y0:y1, x0:x1] = run(region)
+
+    # Tiles write disjoint regions of dst, so they need no locking
+    with ThreadPoolExecutor(max_workers=max_workers or os.cpu_count() or 1) as pool:
+        list(pool.map(run_into, regions[1:]))
+    return dst
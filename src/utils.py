@@ -1,16 +1,27 @@
 import streamlit as st
-import cv2
-import numpy as np
-from PIL import Image
 import json
+import os
+import tempfile
+import time
 import datetime
 import traceback
-from functions.enums import (
-    ColorSpaceConversionType, ThresholdType, MorphShape, MorphOperation,
-    Interpolation, BorderType, CornerRefineMethod, DictType,
-    AkazeDescriptorType, DiffusivityType, OrbHarrisScore, FastFeatureType,
-    TemplateMatchingMethod
-)
+from pipeline import Pipeline, serialize_params, validate_json_structure, resolve_steps
+from cache import ResultCache, params_key
+from decode import DecodeCache
+from display import DEFAULT_DISPLAY_WIDTH, DisplayCache
+from history import ImageHistory
+from session import is_session_id, new_session_id, prune_sessions, session_store
+from store import image_store
+from sweep import grid_combinations, random_combinations, run_sweep
+from functions import opencv_functions
+from functions.colorspace import to_rgb
+from functions.frequency_domain import require_image
+from functions.tracing import tracer
+from preview import make_proxy
+from video import process_video
+from worker import BACKGROUND_AFTER_SECONDS, BackgroundRunner, run_function
+
+SWEEP_THUMBNAIL_WIDTH = 320
 
 
 def get_ui_parameters(selected_function):
@@ -47,21 +58,22 @@ def get_ui_parameters(selected_function):
         )
 
         if uploaded_file_secondary is not None:
-            secondary_image = Image.open(uploaded_file_secondary)
-            secondary_image = np.array(secondary_image)
-            if secondary_image.shape[2] == 4:  # If the image has an alpha channel
-                secondary_image = cv2.cvtColor(secondary_image, cv2.COLOR_RGBA2BGR)
-            else:
-                secondary_image = cv2.cvtColor(secondary_image, cv2.COLOR_RGB2BGR)
+            # Cached, so slider moves do not decode the same file again
+            with tracer.span("decode"):
+                secondary_image = st.session_state.decode_cache.decode_upload(
+                    uploaded_file_secondary
+                )
 
     return params, secondary_image
 
 
 def initialize_session_state():
+    if "session_store" not in st.session_state:
+        restore_session()
     if "image" not in st.session_state:
         st.session_state.image = None
     if "history" not in st.session_state:
-        st.session_state.history = []
+        st.session_state.history = ImageHistory(replay_step)
     if "history_index" not in st.session_state:
         st.session_state.history_index = -1
     if "file" not in st.session_state:
@@ -70,87 +82,217 @@ def initialize_session_state():
         st.session_state.function_history = []
     if "function_history_index" not in st.session_state:
         st.session_state.function_history_index = -1
+    if "result_cache" not in st.session_state:
+        st.session_state.result_cache = ResultCache(shared=image_store)
+    if "decode_cache" not in st.session_state:
+        st.session_state.decode_cache = DecodeCache()
+    if "display_cache" not in st.session_state:
+        st.session_state.display_cache = DisplayCache()
+    if "display_width" not in st.session_state:
+        st.session_state.display_width = DEFAULT_DISPLAY_WIDTH
+    if "background_runner" not in st.session_state:
+        st.session_state.background_runner = BackgroundRunner()
+
+
+def restore_session():
+    """Open the session named in the URL, or start a new one.
+
+    The session id is kept in the URL, so refreshing the page or restarting
+    the server continues the session where it was left.
+    """
+    session_id = st.query_params.get("session")
+    if not is_session_id(session_id):
+        session_id = new_session_id()
+        st.query_params["session"] = session_id
+        prune_sessions()
+    store = session_store(session_id)
+    st.session_state.session_store = store
+
+    try:
+        saved = store.load(replay_step)
+        if saved is None or not len(saved["history"]):
+            return
+        # Only the state being viewed is mapped from disk
+        image = saved["history"].get(saved["history_index"])
+    except Exception as e:
+        st.warning(f"Could not restore session {session_id}: {e}")
+        return
+    for key, value in saved.items():
+        st.session_state[key] = value
+    st.session_state.image = image
+
+
+def save_session():
+    """Write the new image states and the function history of the session."""
+    if len(st.session_state.history) == 0:
+        return
+    st.session_state.session_store.save(
+        st.session_state.history,
+        st.session_state.history_index,
+        st.session_state.function_history,
+        st.session_state.function_history_index,
+    )
+
+
+def replay_step(step, image):
+    """Recompute a history state from the previous one."""
+    function_name, function_params = step
+    function_class = opencv_functions[function_name]
+    with tracer.span("replay", function_name):
+        if function_class.modifies_input:
+            image = image.copy()
+        return function_class.process(image, **function_params)
+
+
+def process_image(
+    function_name, function_class, image, params, secondary_image=None, background=False
+):
+    """Run a function on an image, reusing cached results where possible.
+
+    With `background`, slow functions run on the session's BackgroundRunner
+    and None is returned until their result is ready, see
+    display_background_status(). Only cacheable functions qualify, as
+    their results are picked up by a later rerun.
+    """
+    require_image(image, function_name, function_class)
+    result_cache = st.session_state.result_cache
+    cache_key = None
+    if function_class.cacheable:
+        with tracer.span("cache_lookup", function_name):
+            cache_key = result_cache.make_key(image, function_name, params, secondary_image)
+            processed_image = result_cache.get(cache_key)
+        if processed_image is not None:
+            return processed_image
+
+    runner = st.session_state.background_runner
+    if (
+        background
+        and cache_key is not None
+        and (
+            function_class.slow
+            or runner.durations.get(function_name, 0) > BACKGROUND_AFTER_SECONDS
+        )
+    ):
+        runner.submit(
+            cache_key, function_name, function_class, image, cache_key[0], params, secondary_image
+        )
+        done = runner.result(cache_key)
+        if done is None:
+            return None
+        processed_image, spans = done
+        # Report the timings of the worker as if the function ran here
+        for stage, span_function, seconds in spans:
+            tracer.record(stage, span_function, seconds)
+        st.session_state.background_seconds = runner.durations.get(function_name)
+    else:
+        start = time.perf_counter()
+        processed_image = run_function(
+            function_name, function_class, image, params, secondary_image
+        )
+        runner.durations[function_name] = time.perf_counter() - start
+
+    if cache_key is not None:
+        # Sessions computing the same result share it
+        processed_image = image_store.intern(processed_image)
+        result_cache.put(cache_key, processed_image)
+    return processed_image
+
+
+@st.fragment(run_every=0.25)
+def display_background_status():
+    """Say that a result is being computed, and rerun the page once it is ready."""
+    runner = st.session_state.background_runner
+    if not runner.busy:
+        st.rerun()
+    col1, col2 = st.columns([4, 1])
+    col1.info("Computing... The last result is shown until the new one is ready.")
+    if col2.button("Cancel", use_container_width=True):
+        runner.cancel()
+        st.rerun()
+
 
+def show_image(image, caption=None, use_column_width=True):
+    """Show a BGR or single-channel image, downscaled and encoded only once."""
+    data, image_format = st.session_state.display_cache.get(
+        image, st.session_state.display_width
+    )
+    st.image(
+        data,
+        caption=caption,
+        output_format=image_format,
+        use_column_width=use_column_width,
+    )
 
-def save_current_state(image, function_name=None, function_params=None):
-    """Save the current image state and reset forward history."""
+
+def get_preview_image():
+    """Return the downscaled proxy of the current image and its scale.
+
+    The proxy is kept in the session until the current image changes.
+    """
+    preview = st.session_state.get("preview")
+    if preview is None or preview[0] is not st.session_state.image:
+        preview = (st.session_state.image, *make_proxy(st.session_state.image))
+        st.session_state.preview = preview
+    return preview[1], preview[2]
+
+
+def function_record(step, function_name, function_params=None, timings=None):
+    """Return the function history record of one applied step."""
+    record = {
+        "step": step,
+        "function_name": function_name,
+        "parameters": serialize_params(function_params) if function_params else {},
+        "timestamp": datetime.datetime.now().isoformat(),
+    }
+    if timings:
+        record["timings"] = timings
+    return record
+
+
+def save_current_state(
+    image, function_name=None, function_params=None, replayable=True, timings=None
+):
+    """Save the current image state and reset forward history.
+
+    Set `replayable` to False for steps that cannot be recomputed from the
+    function name and parameters alone, e.g. when a secondary image was used.
+    `timings` are the seconds per stage spent on this step, stored with it.
+    The current image becomes the stored one, which other sessions may share.
+    """
     # If the current index isn't at the end of the history, truncate history
     if st.session_state.history_index < len(st.session_state.history) - 1:
-        st.session_state.history = st.session_state.history[
-            : st.session_state.history_index + 1
-        ]
+        st.session_state.history.truncate(st.session_state.history_index + 1)
         st.session_state.function_history = st.session_state.function_history[
             : st.session_state.function_history_index + 1
         ]
 
     # Add the new image to history and update the index
-    st.session_state.history.append(image)
+    step = None
+    if function_name is not None and replayable:
+        step = (function_name, function_params or {})
+    st.session_state.image = st.session_state.history.append(image, step)
     st.session_state.history_index = len(st.session_state.history) - 1
     
     # Track function application if provided
     if function_name is not None:
-        function_record = {
-            "step": len(st.session_state.function_history) + 1,
-            "function_name": function_name,
-            "parameters": serialize_params(function_params) if function_params else {},
-            "timestamp": datetime.datetime.now().isoformat(),
-        }
-        st.session_state.function_history.append(function_record)
+        st.session_state.function_history.append(
+            function_record(
+                len(st.session_state.function_history) + 1,
+                function_name,
+                function_params,
+                timings,
+            )
+        )
         st.session_state.function_history_index = len(st.session_state.function_history) - 1
 
 
-def serialize_params(params):
-    """Convert parameters to JSON-serializable format."""
-    serialized = {}
-    for key, value in params.items():
-        if hasattr(value, 'name'):  # Handle enum values
-            serialized[key] = value.name
-        elif hasattr(value, 'value'):  # Handle enum values with .value
-            serialized[key] = value.value
-        elif isinstance(value, (int, float, str, bool, list, tuple)):
-            serialized[key] = value
-        else:
-            serialized[key] = str(value)  # Fallback to string representation
-    return serialized
-
-
-def deserialize_params(params, opencv_functions):
-    """Convert JSON parameters back to their proper types including enums."""
-    # List of all enum classes
-    enum_classes = [
-        ColorSpaceConversionType, ThresholdType, MorphShape, MorphOperation,
-        Interpolation, BorderType, CornerRefineMethod, DictType,
-        AkazeDescriptorType, DiffusivityType, OrbHarrisScore, FastFeatureType,
-        TemplateMatchingMethod
-    ]
-    
-    deserialized = {}
-    for key, value in params.items():
-        # Try to convert enum string names back to enum objects
-        if isinstance(value, str):
-            # Check all enum types
-            for enum_class in enum_classes:
-                try:
-                    if hasattr(enum_class, value):
-                        deserialized[key] = getattr(enum_class, value)
-                        break
-                except:
-                    pass
-            else:
-                deserialized[key] = value
-        else:
-            deserialized[key] = value
-    
-    return deserialized
-
-
 def revert_state():
     """Revert to the previous image state."""
     if st.session_state.history_index > 0:
         st.session_state.history_index -= 1
-        st.session_state.image = st.session_state.history[
+        st.session_state.image = st.session_state.history.get(
             st.session_state.history_index
-        ]
+        )
         
         # Update function history index to match image history
         # Function history index should be history_index - 1 (since first image has no function)
@@ -161,9 +303,9 @@ def forward_state():
     """Move forward to the next image state."""
     if st.session_state.history_index < len(st.session_state.history) - 1:
         st.session_state.history_index += 1
-        st.session_state.image = st.session_state.history[
+        st.session_state.image = st.session_state.history.get(
             st.session_state.history_index
-        ]
+        )
         
         # Update function history index to match image history
         # Function history index should be history_index - 1 (since first image has no function)
@@ -193,74 +335,84 @@ def get_function_history_json():
     return json.dumps(history_data, indent=2)
 
 
-def validate_json_structure(data):
-    """Validate the structure of imported JSON data."""
-    try:
-        if not isinstance(data, dict):
-            return False, "JSON must be an object"
-        
-        if "processing_pipeline" not in data:
-            return False, "Missing 'processing_pipeline' key"
-        
-        pipeline = data["processing_pipeline"]
-        if not isinstance(pipeline, dict):
-            return False, "'processing_pipeline' must be an object"
-        
-        if "functions_applied" not in pipeline:
-            return False, "Missing 'functions_applied' key"
-        
-        functions = pipeline["functions_applied"]
-        if not isinstance(functions, list):
-            return False, "'functions_applied' must be a list"
-        
-        for i, func in enumerate(functions):
-            if not isinstance(func, dict):
-                return False, f"Function {i+1} must be an object"
-            
-            if "function_name" not in func:
-                return False, f"Function {i+1} missing 'function_name'"
-            
-            if "parameters" not in func:
-                return False, f"Function {i+1} missing 'parameters'"
-        
-        return True, "Valid JSON structure"
-    
-    except Exception as e:
-        return False, f"JSON validation error: {str(e)}"
+def shared_step_count(history, steps):
+    """Return how many leading `steps` produced the states after the first one.
+
+    Those states are what replaying the steps from the first image would
+    compute again. Only replayable states count, as the others depended on
+    more than the function name and parameters.
+    """
+    count = 0
+    for index, (function_name, _, parameters) in enumerate(steps, start=1):
+        if index >= len(history):
+            break
+        step = history.step(index)
+        if step is None or step[0] != function_name:
+            break
+        if params_key(step[1]) != params_key(parameters):
+            break
+        count += 1
+    return count
+
+
+def reused_function_records(function_history, steps, count):
+    """Return the function history records of the first `count` steps.
+
+    Existing records are kept where they describe the same step, the others
+    are rebuilt, e.g. after the function history was cleared, so the
+    export still lists every step that produced the image.
+    """
+    records = []
+    for index, (function_name, _, parameters) in enumerate(steps[:count], start=1):
+        record = function_record(index, function_name, parameters)
+        if index <= len(function_history):
+            existing = function_history[index - 1]
+            if (
+                existing["function_name"] == function_name
+                and existing["parameters"] == record["parameters"]
+            ):
+                record = dict(existing, step=index)
+        records.append(record)
+    return records
 
 
 def apply_function_sequence(opencv_functions, functions_to_apply, mode="add"):
-    """Apply a sequence of functions from JSON data."""
+    """Apply a sequence of functions from JSON data.
+
+    When restarting, the steps the current history shares with the start of
+    the sequence are not applied again; their states are kept instead.
+    """
     try:
         # Store original state for rollback
-        original_image = st.session_state.image.copy()
+        original_image = st.session_state.image
         original_history = st.session_state.history.copy()
         original_history_index = st.session_state.history_index
         original_function_history = st.session_state.function_history.copy()
         original_function_history_index = st.session_state.function_history_index
         
-        # If restarting, go back to the original image
+        steps = resolve_steps(functions_to_apply, opencv_functions)
+
+        # If restarting, go back to the last state the sequence shares with
+        # the current history, or to the original image
+        reused_count = 0
         if mode == "restart":
             if len(st.session_state.history) > 0:
-                st.session_state.image = st.session_state.history[0].copy()
-                st.session_state.history = [st.session_state.history[0]]
-                st.session_state.history_index = 0
-                st.session_state.function_history = []
-                st.session_state.function_history_index = -1
+                reused_count = shared_step_count(st.session_state.history, steps)
+                st.session_state.image = st.session_state.history.get(reused_count)
+                st.session_state.history.truncate(reused_count + 1)
+                st.session_state.history_index = reused_count
+                st.session_state.function_history = reused_function_records(
+                    st.session_state.function_history, steps, reused_count
+                )
+                st.session_state.function_history_index = reused_count - 1
         
         # Apply each function in sequence
         applied_count = 0
-        for func_data in functions_to_apply:
-            function_name = func_data["function_name"]
-            
-            if function_name not in opencv_functions:
-                raise ValueError(f"Unknown function: {function_name}")
-            
-            function_class = opencv_functions[function_name]
-            parameters = deserialize_params(func_data.get("parameters", {}), opencv_functions)
-            
-            # Apply the function
-            current_image = st.session_state.image.copy()
+        for function_name, function_class, parameters in steps[reused_count:]:
+            # Apply the function, copying only for functions that draw on their input
+            current_image = st.session_state.image
+            if function_class.modifies_input:
+                current_image = current_image.copy()
             processed_image = function_class.process(current_image, **parameters)
             
             # Save the state
@@ -268,7 +420,10 @@ def apply_function_sequence(opencv_functions, functions_to_apply, mode="add"):
             save_current_state(processed_image, function_name, parameters)
             applied_count += 1
         
-        return True, f"Successfully applied {applied_count} functions", applied_count
+        message = f"Successfully applied {applied_count} functions"
+        if reused_count:
+            message += f", reused {reused_count} unchanged steps"
+        return True, message, applied_count
     
     except Exception as e:
         # Rollback on error
@@ -336,3 +491,184 @@ def display_function_history():
                     st.write(f"  - {param}: {value}")
             else:
                 st.write("**Parameters:** None")
+            if func_record.get("timings"):
+                st.write("**Timings:**")
+                for stage, seconds in func_record["timings"].items():
+                    st.write(f"  - {stage}: {seconds * 1000:.1f} ms")
+
+
+def display_history_memory():
+    """Display how much memory each image state in the history uses."""
+    history = st.session_state.history
+    st.write(
+        f"**History memory:** {history.nbytes / 1e6:.1f} MB "
+        f"of {history.max_bytes / 1e6:.0f} MB budget"
+    )
+    st.table(history.memory_usage())
+
+
+def display_timings():
+    """Display the latency of every stage and function traced so far."""
+    stages = tracer.to_dict()["stages"]
+    if not stages:
+        st.info("Nothing has been traced yet.")
+        return
+    st.table(
+        [
+            {
+                "stage": entry["stage"],
+                "function": entry["function"],
+                "count": entry["count"],
+                "mean (ms)": round(entry["mean_seconds"] * 1000, 2),
+                "p95 (ms)": round(entry["p95_seconds"] * 1000, 2),
+                "max (ms)": round(entry["max_seconds"] * 1000, 2),
+            }
+            for entry in stages
+        ]
+    )
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        st.download_button(
+            "Download JSON",
+            tracer.to_json(),
+            file_name="timings.json",
+            mime="application/json",
+            use_container_width=True,
+        )
+    with col2:
+        st.download_button(
+            "Download Prometheus",
+            tracer.to_prometheus(),
+            file_name="timings.prom",
+            mime="text/plain",
+            use_container_width=True,
+        )
+    with col3:
+        if st.button("Reset Timings", use_container_width=True):
+            tracer.reset()
+            st.rerun()
+
+
+def display_parameter_sweep(selected_function_string, selected_function, params, secondary_image):
+    """Sweep parameters of the selected function and show a contact sheet."""
+    param_info = selected_function.get_params()
+    param_info.pop("requires_secondary_image", None)
+    sweepable = [
+        name for name, config in param_info.items() if isinstance(config, (tuple, list, bool))
+    ]
+    if not sweepable:
+        st.info(f"{selected_function_string} has no parameters to sweep.")
+        return
+
+    st.write(f"Sweeping **{selected_function_string}**, other parameters use the current settings.")
+    swept = st.multiselect("Parameters to sweep", sweepable, default=sweepable[:1])
+
+    col1, col2, col3, col4 = st.columns(4)
+    with col1:
+        mode = st.radio("Mode", ["Grid", "Random"], horizontal=True)
+    with col2:
+        if mode == "Grid":
+            steps = st.slider("Values per slider", 2, 10, 4)
+        else:
+            samples = st.slider("Samples", 2, 64, 16)
+    with col3:
+        executor = st.radio("Executor", ["thread", "process"], horizontal=True)
+    with col4:
+        columns = st.slider("Thumbnails per row", 2, 8, 4)
+
+    if st.button("Run Sweep", type="primary", disabled=not swept):
+        if mode == "Grid":
+            combinations = grid_combinations(param_info, params, swept, steps)
+        else:
+            combinations = random_combinations(param_info, params, swept, samples)
+        with st.spinner(f"Evaluating {len(combinations)} parameter combinations..."):
+            start = time.time()
+            st.session_state.sweep_results = run_sweep(
+                selected_function,
+                st.session_state.image,
+                combinations,
+                secondary_image,
+                executor=executor,
+                thumbnail_width=SWEEP_THUMBNAIL_WIDTH,
+            )
+            st.session_state.sweep_swept = swept
+        st.write(f"Sweep took {time.time() - start:.2f} seconds")
+
+    variants = st.session_state.get("sweep_results")
+    if not variants:
+        return
+    swept = st.session_state.sweep_swept
+    for i in range(0, len(variants), columns):
+        cols = st.columns(columns)
+        for col, variant in zip(cols, variants[i : i + columns]):
+            label = ", ".join(
+                f"{name}={serialize_params({name: variant['params'][name]})[name]}"
+                for name in swept
+            )
+            with col:
+                if "error" in variant:
+                    st.error(f"{label}: {variant['error']}")
+                    continue
+                st.image(
+                    to_rgb(variant["result"]),
+                    caption=f"{label} ({variant['seconds'] * 1000:.1f} ms)",
+                    clamp=True,
+                )
+
+
+def display_video_processing():
+    """Apply the accepted function history to every frame of a video."""
+    current_functions = st.session_state.function_history[
+        : st.session_state.function_history_index + 1
+    ]
+    if not current_functions:
+        st.info("Accept at least one function on an image to build the pipeline to apply.")
+        return
+    st.write("Pipeline: " + " → ".join(f["function_name"] for f in current_functions))
+
+    uploaded_video = st.file_uploader(
+        "Choose a video...", type=["mp4", "avi", "mov", "mkv"], key="video_file"
+    )
+    drop_frames = st.checkbox(
+        "Drop frames when processing falls behind decoding",
+        help="Simulates a live source. Otherwise every frame is processed.",
+    )
+    if uploaded_video is None or not st.button("Process Video", type="primary"):
+        return
+
+    pipeline = Pipeline.from_json(current_functions, opencv_functions)
+    suffix = os.path.splitext(uploaded_video.name)[1]
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        input_path = os.path.join(tmp_dir, f"input{suffix}")
+        output_path = os.path.join(tmp_dir, "output.mp4")
+        with open(input_path, "wb") as f:
+            f.write(uploaded_video.getbuffer())
+
+        progress_bar = st.progress(0.0, text="Processing frames...")
+
+        def progress(frames, total):
+            if total:
+                progress_bar.progress(min(frames / total, 1.0), text=f"Frame {frames} of {total}")
+
+        try:
+            stats = process_video(
+                pipeline, input_path, output_path, drop_frames=drop_frames, progress=progress
+            )
+        except Exception as e:
+            st.error(f"Video processing failed: {e}")
+            return
+        progress_bar.empty()
+
+        with open(output_path, "rb") as f:
+            video_bytes = f.read()
+
+    col1, col2, col3 = st.columns(3)
+    col1.metric("Frames", stats["frames"])
+    col2.metric("Sustained FPS", stats["fps"])
+    col3.metric("Dropped frames", stats["dropped"])
+    st.download_button(
+        label="Download processed video",
+        data=video_bytes,
+        file_name=f"processed_{time.strftime('%Y%m%d_%H%M%S')}.mp4",
+        mime="video/mp4",
+    )
@@ -0,0 +1,253 @@
+"""Replay an exported function history over a video or an image sequence.
+
+Example:
+    python video.py history.json input.mp4 -o output.mp4
+    python video.py history.json "./frames/*.png" -o output.mp4 --fps 25
+"""
+
+import argparse
+import glob
+import logging
+import os
+import queue
+import threading
+import time
+
+import cv2
+import numpy as np
+
+from batch import find_images
+from functions.colorspace import to_bgr
+from functions.frequency_domain import as_image
+from functions.tracing import tracer
+from pipeline import Pipeline, load_pipeline
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+DEFAULT_PREFETCH = 8
+DEFAULT_FPS = 25.0
+# Marks the end of the frame queue
+_END = object()
+
+
+class FrameReader:
+    """Decode frames on a background thread into a bounded queue.
+
+    `source` is a video file, a directory of images or a glob pattern. The
+    queue holds at most `prefetch` frames, so decoding runs ahead of
+    processing without buffering the whole video. With `drop_frames`,
+    frames decoded while the queue is full are dropped and counted, as a
+    live source would; otherwise decoding waits for the consumer.
+    """
+
+    def __init__(self, source, prefetch=DEFAULT_PREFETCH, drop_frames=False):
+        self.source = source
+        self.drop_frames = drop_frames
+        self.dropped = 0
+        self.fps = None
+        self.frame_count = None
+        self._queue = queue.Queue(maxsize=prefetch)
+        self._stop = threading.Event()
+        self._error = None
+        self._frames = self._open(source)
+        self._thread = threading.Thread(target=self._decode, daemon=True)
+
+    def _open(self, source):
+        if os.path.isdir(source) or glob.has_magic(source):
+            paths = find_images(source)
+            if not paths:
+                raise ValueError(f"No images found: {source}")
+            self.frame_count = len(paths)
+            return (cv2.imread(path, cv2.IMREAD_COLOR) for path in paths)
+
+        capture = cv2.VideoCapture(source)
+        if not capture.isOpened():
+            raise ValueError(f"Could not open video: {source}")
+        self.fps = capture.get(cv2.CAP_PROP_FPS) or None
+        self.frame_count = int(capture.get(cv2.CAP_PROP_FRAME_COUNT)) or None
+
+        def frames():
+            try:
+                while True:
+                    ok, frame = capture.read()
+                    if not ok:
+                        return
+                    yield frame
+            finally:
+                capture.release()
+
+        return frames()
+
+    def _decode(self):
+        try:
+            while not self._stop.is_set():
+                with tracer.span("decode"):
+                    frame = next(self._frames, _END)
+                if frame is _END:
+                    break
+                if frame is None:
+                    raise ValueError("Could not read frame")
+                if self.drop_frames:
+                    try:
+                        self._queue.put_nowait(frame)
+                    except queue.Full:
+                        self.dropped += 1
+                    continue
+                while not self._stop.is_set():
+                    try:
+                        self._queue.put(frame, timeout=0.1)
+                        break
+                    except queue.Full:
+                        pass
+        except Exception as e:
+            self._error = e
+        finally:
+            self._frames.close()
+            self._queue.put(_END)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._stop.set()
+        # Unblock the decoder if it is waiting for space in the queue
+        while self._thread.is_alive():
+            try:
+                self._queue.get(timeout=0.1)
+            except queue.Empty:
+                pass
+        self._thread.join()
+
+    def __iter__(self):
+        while True:
+            frame = self._queue.get()
+            if frame is _END:
+                break
+            yield frame
+        if self._error is not None:
+            raise self._error
+
+
+def process_video(
+    pipeline,
+    source,
+    output_path,
+    fps=None,
+    prefetch=DEFAULT_PREFETCH,
+    drop_frames=False,
+    fourcc="mp4v",
+    progress=None,
+):
+    """Run `pipeline` on every frame of `source` and write an output video.
+
+    The output size is taken from the first processed frame, and its frame
+    rate from `fps`, the source video, or DEFAULT_FPS. `progress` is called
+    with the number of frames written so far and the total, if known.
+    Returns the frame count, dropped frames, elapsed seconds and sustained
+    frames per second.
+    """
+    pipeline.reset()
+    writer = None
+    frames = 0
+    start = time.perf_counter()
+    try:
+        with FrameReader(source, prefetch, drop_frames) as reader:
+            for frame in reader:
+                result = pipeline.run(frame)
+                with tracer.span("color_conversion"):
+                    result = as_image(result)
+                    if result.dtype != np.uint8:
+                        result = cv2.convertScaleAbs(result)
+                    result = to_bgr(result)
+
+                if writer is None:
+                    size = (result.shape[1], result.shape[0])
+                    writer = cv2.VideoWriter(
+                        output_path,
+                        cv2.VideoWriter_fourcc(*fourcc),
+                        fps or reader.fps or DEFAULT_FPS,
+                        size,
+                    )
+                    if not writer.isOpened():
+                        raise ValueError(f"Could not open video writer: {output_path}")
+                elif (result.shape[1], result.shape[0]) != size:
+                    # VideoWriter silently skips frames of the wrong size
+                    raise ValueError(
+                        f"Frame {frames} is {result.shape[1]}x{result.shape[0]}, "
+                        f"expected {size[0]}x{size[1]}"
+                    )
+                with tracer.span("encode"):
+                    writer.write(result)
+                frames += 1
+                if progress is not None:
+                    progress(frames, reader.frame_count)
+    finally:
+        if writer is not None:
+            writer.release()
+
+    elapsed = time.perf_counter() - start
+    return {
+        "frames": frames,
+        "dropped": reader.dropped,
+        "seconds": round(elapsed, 3),
+        "fps": round(frames / elapsed, 2) if elapsed > 0 else 0.0,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("pipeline", help="Exported function history JSON file")
+    parser.add_argument("input", help="Video file, image directory or glob pattern")
+    parser.add_argument("-o", "--output", required=True, help="Output video file")
+    parser.add_argument("--fps", type=float, help="Output frame rate (default: same as input)")
+    parser.add_argument("--fourcc", default="mp4v", help="Output codec (default: mp4v)")
+    parser.add_argument(
+        "--prefetch", type=int, default=DEFAULT_PREFETCH, help="Number of frames decoded ahead"
+    )
+    parser.add_argument(
+        "--drop-frames",
+        action="store_true",
+        help="Drop frames instead of waiting when processing falls behind decoding",
+    )
+    parser.add_argument("--secondary", help="Secondary image for functions that require one")
+    parser.add_argument(
+        "--metrics", help="Write per-stage timings to this file (.prom for Prometheus, else JSON)"
+    )
+    parser.add_argument(
+        "--tile-size", type=int, help="Process tile-safe filters in tiles of this size on large frames"
+    )
+    args = parser.parse_args()
+
+    from functions import opencv_functions
+
+    secondary_image = None
+    if args.secondary:
+        secondary_image = cv2.imread(args.secondary, cv2.IMREAD_COLOR)
+        if secondary_image is None:
+            raise ValueError(f"Could not read secondary image: {args.secondary}")
+    pipeline = Pipeline.from_json(
+        load_pipeline(args.pipeline), opencv_functions, secondary_image, args.tile_size
+    )
+
+    stats = process_video(
+        pipeline,
+        args.input,
+        args.output,
+        fps=args.fps,
+        prefetch=args.prefetch,
+        drop_frames=args.drop_frames,
+        fourcc=args.fourcc,
+    )
+    logger.info(
+        f"Wrote {stats['frames']} frames to {args.output} in {stats['seconds']} seconds "
+        f"({stats['fps']} FPS), {stats['dropped']} dropped"
+    )
+    if args.metrics:
+        tracer.write(args.metrics)
+        logger.info(f"Wrote metrics to {args.metrics}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,206 @@
+import multiprocessing
+import threading
+import time
+import weakref
+
+from functions.tracing import tracer
+from tiling import is_tileable, process_tiled
+
+# Seconds a request waits for newer ones before it starts, while dragging sliders
+DEBOUNCE_SECONDS = 0.3
+# Functions taking longer than this are run in the background from then on
+BACKGROUND_AFTER_SECONDS = 0.5
+
+
+def run_function(function_name, function_class, image, params, secondary_image=None):
+    """Apply a function to an image, copying the image only if it is drawn on."""
+    with tracer.span("process", function_name):
+        if function_class.modifies_input:
+            image = image.copy()
+        if secondary_image is not None:
+            return function_class.process(image, secondary_image, **params)
+        if is_tileable(function_class, image, params):
+            # Same result as process(), split across all cores
+            return process_tiled(function_class, image, params)
+        return function_class.process(image, **params)
+
+
+def _serve(connection):
+    """Run the jobs sent over `connection`, in the worker process."""
+    images = {}
+    while True:
+        try:
+            job = connection.recv()
+        except EOFError:
+            return
+        key, function_name, function_class, params, image_key, image, secondary_image = job
+        # Images are only sent when they change, keep the last one
+        if image is not None:
+            images = {image_key: image}
+        with tracer.collect() as spans:
+            try:
+                result = run_function(
+                    function_name, function_class, images[image_key], params, secondary_image
+                )
+                error = None
+            except Exception as e:
+                result = None
+                error = f"{type(e).__name__}: {e}"
+        connection.send((key, result, spans, error))
+
+
+def _stop(process):
+    if process.is_alive():
+        process.terminate()
+
+
+class BackgroundRunner:
+    """Run functions in a worker process, so slow ones do not block the UI.
+
+    Only the latest request matters. It starts once no newer request came
+    in for `debounce` seconds, and a newer request kills the worker if it
+    is still busy with an older one, so a function that never returns
+    cannot block the ones after it. The worker is restarted when needed.
+    """
+
+    def __init__(self, debounce=DEBOUNCE_SECONDS):
+        self.debounce = debounce
+        # Seconds the last run of each function took, to pick what runs here
+        self.durations = {}
+        self._condition = threading.Condition()
+        self._pending = None
+        self._running = None
+        self._done = None
+        self._thread = None
+        self._process = None
+        self._connection = None
+        self._sent_image = None
+
+    def submit(
+        self,
+        key,
+        function_name,
+        function_class,
+        image,
+        image_key,
+        params,
+        secondary_image=None,
+    ):
+        """Request the result for `key`, superseding all earlier requests."""
+        with self._condition:
+            if key in (self._running, self._pending and self._pending[0]):
+                return
+            if self._done is not None and self._done[0] == key:
+                return
+            if self._running is not None:
+                self._kill()
+            job = (function_name, function_class, params, image_key, image, secondary_image)
+            self._pending = (key, time.monotonic(), job)
+            self._condition.notify()
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._dispatch, daemon=True)
+                self._thread.start()
+
+    def result(self, key):
+        """Return (result, spans) once the job for `key` is done, else None.
+
+        Errors of the function are raised as a RuntimeError.
+        """
+        with self._condition:
+            if self._done is None or self._done[0] != key:
+                return None
+            _, result, spans, error = self._done
+        if error is not None:
+            raise RuntimeError(error)
+        return result, spans
+
+    @property
+    def busy(self):
+        with self._condition:
+            return self._pending is not None or self._running is not None
+
+    def cancel(self):
+        """Drop the pending request and kill the worker if it is running one.
+
+        The cancelled request fails, so it is not simply submitted again.
+        """
+        with self._condition:
+            key = self._running
+            if self._pending is not None:
+                key = self._pending[0]
+                self._pending = None
+            if self._running is not None:
+                self._kill()
+            if key is not None:
+                self._done = (key, None, [], "Cancelled")
+
+    def _dispatch(self):
+        while True:
+            with self._condition:
+                if self._pending is None:
+                    # Exit when idle, so an unused runner can be collected
+                    self._thread = None
+                    return
+                key, submitted, job = self._pending
+                wait = submitted + self.debounce - time.monotonic()
+                if wait > 0:
+                    self._condition.wait(wait)
+                    continue
+                self._pending = None
+                self._running = key
+                connection = self._connect()
+                function_name, function_class, params, image_key, image, secondary = job
+                if image_key == self._sent_image:
+                    image = None
+                self._sent_image = image_key
+
+            start = time.perf_counter()
+            try:
+                connection.send(
+                    (key, function_name, function_class, params, image_key, image, secondary)
+                )
+                done = connection.recv()
+            except (EOFError, OSError):
+                # Killed by a newer request or cancel(), or died on its own.
+                # Only this thread uses the connection, so it closes it
+                connection.close()
+                done = None
+
+            with self._condition:
+                if self._running == key:
+                    if done is None:
+                        # Not superseded, so the worker crashed. Report it
+                        # once rather than run the same job again
+                        done = (key, None, [], "Worker process exited")
+                    else:
+                        self.durations[function_name] = time.perf_counter() - start
+                    self._done = done
+                self._running = None
+                if connection is not self._connection:
+                    # The worker was killed after it had answered
+                    connection.close()
+
+    def _connect(self):
+        if self._process is None or not self._process.is_alive():
+            if self._connection is not None:
+                self._connection.close()
+            # The UI server runs many threads, and a forked child could
+            # deadlock on a lock one of them held
+            context = multiprocessing.get_context("spawn")
+            self._connection, child = context.Pipe()
+            self._process = context.Process(target=_serve, args=(child,), daemon=True)
+            self._process.start()
+            # Keep only the worker's end open, so its exit is seen as EOF
+            child.close()
+            weakref.finalize(self, _stop, self._process)
+            self._sent_image = None
+        return self._connection
+
+    def _kill(self):
+        # The dispatch thread may be blocked on the connection, it closes it
+        # once the worker is gone
+        self._process.terminate()
+        self._process.join()
+        self._connection = None
+        self._process = None
+        self._running = None
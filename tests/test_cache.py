@@ -0,0 +1,51 @@
+import numpy as np
+import pytest
+
+from benchmark import synthetic_image
+from cache import ResultCache
+from functions import opencv_functions
+from functions.enums import BorderType
+
+PARAMS = {"ksize": 5, "sigmaX": 1.0, "sigmaY": 0.0, "borderType": BorderType.BORDER_DEFAULT}
+
+
+def test_cached_result_matches_a_fresh_one():
+    blur = opencv_functions["Gaussian Blur"]
+    image = synthetic_image(320, 240, 3)
+    cache = ResultCache()
+    key = cache.make_key(image, "Gaussian Blur", PARAMS)
+    assert cache.get(key) is None
+    cache.put(key, blur.process(image, **PARAMS))
+
+    # An equal image and equal parameters find the result
+    again = cache.make_key(image.copy(), "Gaussian Blur", dict(PARAMS))
+    result = cache.get(again)
+    assert np.array_equal(result, blur.process(image, **PARAMS))
+    assert cache.stats()["hits"] == 1
+    with pytest.raises(ValueError):
+        result[0, 0] = 0
+
+
+def test_keys_differ_by_content_dtype_params_and_secondary():
+    image = synthetic_image(320, 240, 1)
+    cache = ResultCache()
+    key = cache.make_key(image, "Gaussian Blur", PARAMS)
+    changed = image.copy()
+    changed[0, 0] += 1
+    assert cache.make_key(changed, "Gaussian Blur", PARAMS) != key
+    assert cache.make_key(image.view(np.int8), "Gaussian Blur", PARAMS) != key
+    assert cache.make_key(image, "Gaussian Blur", dict(PARAMS, ksize=7)) != key
+    assert cache.make_key(image, "Gaussian Blur", PARAMS, image) != key
+
+
+def test_cache_stays_within_budget():
+    image = synthetic_image(320, 240, 3)
+    cache = ResultCache(max_bytes=3 * image.nbytes)
+    keys = []
+    for value in range(5):
+        keys.append(("image", value))
+        cache.put(keys[-1], np.full_like(image, value))
+    assert cache.total_bytes <= cache.max_bytes
+    # Least recently used results go first
+    assert cache.get(keys[0]) is None
+    assert cache.get(keys[-1]) is not None
@@ -0,0 +1,49 @@
+import cv2
+import numpy as np
+import pytest
+
+from benchmark import synthetic_image
+from functions import opencv_functions
+from functions.frequency_domain import Spectrum
+from history import ImageHistory
+
+
+def never_replayed(step, image):
+    raise AssertionError("Spectrum states must not need replay")
+
+
+@pytest.mark.parametrize("color", [False, True])
+def test_inverse_transform_restores_the_image(color):
+    # An odd size is padded to a DFT size and cropped back
+    image = synthetic_image(317, 241, 3)
+    spectrum = opencv_functions["Fourier Transform"].process(image, color=color)
+    assert isinstance(spectrum, Spectrum)
+    assert spectrum.image_shape == (241, 317)
+
+    result = opencv_functions["Inverse Fourier Transform"].process(spectrum)
+    if not color:
+        gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+        image = cv2.cvtColor(gray, cv2.COLOR_GRAY2BGR)
+    assert np.array_equal(result, image)
+
+
+def assert_same_spectrum(restored, spectrum):
+    assert isinstance(restored, Spectrum)
+    assert restored.image_shape == spectrum.image_shape
+    assert restored.shift == spectrum.shift
+    assert np.array_equal(restored, spectrum)
+
+
+def test_spectrum_survives_compression_and_saving(tmp_path):
+    image = synthetic_image(320, 240, 3)
+    spectrum = opencv_functions["Fourier Transform"].process(image, dft_shift=False)
+    history = ImageHistory(never_replayed, max_bytes=1)
+    history.append(image)
+    history.append(spectrum)
+    history.append(image)
+    assert history.memory_usage()[1]["state"] == "compressed"
+    assert_same_spectrum(history.get(1), spectrum)
+
+    history.save(str(tmp_path))
+    assert history.memory_usage()[1]["state"] == "mapped"
+    assert_same_spectrum(history.get(1), spectrum)
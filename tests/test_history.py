@@ -0,0 +1,79 @@
+import cv2
+import numpy as np
+
+from benchmark import synthetic_image
+from history import ImageHistory
+
+
+def blur(step, image):
+    _, params = step
+    return cv2.GaussianBlur(image, (params["ksize"], params["ksize"]), 0)
+
+
+def build(history, image, ksizes):
+    expected = [image]
+    history.append(image)
+    for ksize in ksizes:
+        image = blur(("blur", {"ksize": ksize}), image)
+        expected.append(image)
+        history.append(image, ("blur", {"ksize": ksize}))
+    return expected
+
+
+def test_history_stays_within_budget():
+    image = synthetic_image(320, 240, 3)
+    history = ImageHistory(blur, max_bytes=3 * image.nbytes, checkpoint_interval=4)
+    build(history, image, [3, 5, 7, 9, 11, 3, 5, 7, 9, 11])
+
+    assert history.nbytes <= history.max_bytes
+    states = [entry["state"] for entry in history.memory_usage()]
+    assert states[-1] == "resident"
+    assert "evicted" in states
+    for index in range(len(history)):
+        if history.is_checkpoint(index):
+            assert states[index] != "evicted"
+
+
+def test_replayed_states_match_the_originals():
+    image = synthetic_image(320, 240, 3)
+    calls = []
+
+    def counting_blur(step, image):
+        calls.append(step)
+        return blur(step, image)
+
+    history = ImageHistory(counting_blur, max_bytes=3 * image.nbytes, checkpoint_interval=4)
+    expected = build(history, image, [3, 5, 7, 9, 11, 3, 5, 7, 9, 11])
+
+    # Walk back from the end, as Revert does
+    for index in reversed(range(len(history))):
+        assert np.array_equal(history.get(index), expected[index]), index
+    assert calls
+
+
+def test_compressed_checkpoints_round_trip():
+    image = synthetic_image(320, 240, 1)
+    history = ImageHistory(blur, max_bytes=1, checkpoint_interval=1)
+    expected = build(history, image, [3, 5, 7])
+
+    states = [entry["state"] for entry in history.memory_usage()]
+    assert states[:-1] == ["compressed"] * 3
+    for index, image in enumerate(expected):
+        result = history.get(index)
+        assert result.dtype == image.dtype
+        assert np.array_equal(result, image)
+
+
+def test_unreplayable_states_are_kept():
+    image = synthetic_image(320, 240, 3)
+    history = ImageHistory(blur, max_bytes=1, checkpoint_interval=100, compress=False)
+    step = ("blur", {"ksize": 5})
+    history.append(image)
+    history.append(blur(step, image), step)
+    # E.g. a step that used a secondary image
+    history.append(image[::-1].copy())
+    history.append(blur(step, image[::-1]), step)
+
+    states = [entry["state"] for entry in history.memory_usage()]
+    assert states == ["resident", "evicted", "resident", "resident"]
+    assert np.array_equal(history.get(1), blur(step, image))
@@ -0,0 +1,91 @@
+import json
+
+import cv2
+import numpy as np
+import pytest
+import streamlit as st
+
+from benchmark import synthetic_image
+from functions import opencv_functions
+from utils import (
+    apply_function_sequence,
+    get_function_history_json,
+    initialize_session_state,
+    save_current_state,
+)
+
+
+def blur_steps(*ksizes):
+    return [
+        {
+            "function_name": "Gaussian Blur",
+            "parameters": {
+                "ksize": ksize,
+                "sigmaX": 1.0,
+                "sigmaY": 0.0,
+                "borderType": "BORDER_DEFAULT",
+            },
+        }
+        for ksize in ksizes
+    ]
+
+
+def replayed(image, steps):
+    for step in steps:
+        ksize = step["parameters"]["ksize"]
+        image = cv2.GaussianBlur(image, (ksize, ksize), 1.0)
+    return image
+
+
+@pytest.fixture(autouse=True)
+def session():
+    st.session_state.clear()
+    # Keep the tests off the session directory
+    st.session_state.session_store = None
+    initialize_session_state()
+    image = synthetic_image(320, 240, 3)
+    st.session_state.image = image
+    save_current_state(image)
+    yield image
+    st.session_state.clear()
+
+
+def exported_steps():
+    return json.loads(get_function_history_json())["processing_pipeline"]["functions_applied"]
+
+
+def test_restart_reuses_shared_prefix(session):
+    apply_function_sequence(opencv_functions, blur_steps(3, 5, 7), "restart")
+    success, message, applied = apply_function_sequence(
+        opencv_functions, blur_steps(3, 5, 9), "restart"
+    )
+    assert success, message
+    assert applied == 1
+    assert "reused 2" in message
+    assert np.array_equal(st.session_state.image, replayed(session, blur_steps(3, 5, 9)))
+    assert len(st.session_state.history) == 4
+
+
+def test_restart_after_clearing_function_history(session):
+    apply_function_sequence(opencv_functions, blur_steps(3, 5, 7), "restart")
+    # What "Clear Function History" does, the image history is kept
+    st.session_state.function_history = []
+    st.session_state.function_history_index = -1
+
+    success, message, applied = apply_function_sequence(
+        opencv_functions, blur_steps(3, 5, 7, 9), "restart"
+    )
+    assert success, message
+    assert applied == 1
+    exported = exported_steps()
+    assert [step["step"] for step in exported] == [1, 2, 3, 4]
+    assert [step["parameters"]["ksize"] for step in exported] == [3, 5, 7, 9]
+    assert np.array_equal(st.session_state.image, replayed(session, blur_steps(3, 5, 7, 9)))
+
+
+def test_restart_keeps_matching_records(session):
+    apply_function_sequence(opencv_functions, blur_steps(3, 5), "restart")
+    first = st.session_state.function_history[0]
+    apply_function_sequence(opencv_functions, blur_steps(3, 7), "restart")
+    assert st.session_state.function_history[0]["timestamp"] == first["timestamp"]
+    assert [step["parameters"]["ksize"] for step in exported_steps()] == [3, 7]
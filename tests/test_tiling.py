@@ -0,0 +1,64 @@
+import cv2
+import numpy as np
+import pytest
+
+from benchmark import PARAM_SETS, derive_params, synthetic_image
+from functions import opencv_functions
+from functions.enums import BorderType
+from tiling import is_tileable, process_tiled
+
+TILE_SIZE = 256
+TILED_FUNCTIONS = [
+    "Gaussian Blur",
+    "Median Blur",
+    "Bilateral Filter",
+    "Sobel Edge Detection",
+    "Laplacian",
+    "Dilate",
+    "Erode",
+    "Morphology",
+]
+
+
+def param_cases(function_class):
+    """Yield the min, default and max parameters, with every border type."""
+    param_info = function_class.get_params()
+    for param_set in PARAM_SETS:
+        params = derive_params(param_info, param_set)
+        if "borderType" not in params:
+            yield params
+            continue
+        for border_type in BorderType:
+            yield dict(params, borderType=border_type)
+
+
+@pytest.mark.parametrize("channels", [1, 3])
+@pytest.mark.parametrize("function_name", TILED_FUNCTIONS)
+def test_tiled_matches_untiled(function_name, channels):
+    function_class = opencv_functions[function_name]
+    image = synthetic_image(560, 300, channels)
+    for params in param_cases(function_class):
+        try:
+            expected = function_class.process(image, **params)
+        except cv2.error:
+            # Invalid combination, e.g. a derivative order above the kernel size
+            continue
+        if not is_tileable(function_class, image, params, TILE_SIZE):
+            assert params.get("borderType") == BorderType.BORDER_WRAP
+            continue
+        result = process_tiled(function_class, image, params, TILE_SIZE)
+        assert np.array_equal(result, expected), params
+
+
+@pytest.mark.parametrize(
+    "function_name", ["Gaussian Blur", "Sobel Edge Detection", "Laplacian"]
+)
+def test_wrap_border_is_not_tileable(function_name):
+    function_class = opencv_functions[function_name]
+    params = derive_params(function_class.get_params(), "default")
+    params["borderType"] = BorderType.BORDER_WRAP
+    image = synthetic_image(560, 300, 3)
+    assert function_class.tile_halo(**params) is None
+    assert not is_tileable(function_class, image, params, TILE_SIZE)
+    with pytest.raises(ValueError):
+        process_tiled(function_class, image, params, TILE_SIZE)